@@ -1,6 +1,4 @@
 import streamlit as st
-import requests
-import json
 
 # --------------------------------------------------------
 # CONFIGURATION DE LA PAGE
@@ -18,50 +16,14 @@ def rechercher_info_siren(siren: str):
     - adresse
     - CP / ville
     - dirigeant (si dispo)
-    """
-
-    url = "https://api-siret-verification.p.rapidapi.com/api/v1/verify/siren"
-
-    # Sécurisation
-    siren = siren.strip()
-    if len(siren) == 14 and siren.isdigit():
-        siren = siren[:9]
-    if not siren.isdigit() or len(siren) != 9:
-        return None, "Format SIREN invalide."
-
-    payload = {
-        "siren": siren,
-        "include_company_data": True
-    }
-
-    headers = {
-        "x-rapidapi-key": "TA_CLE_RAPIDAPI_ICI",   # <-- À REMPLACER
-        "x-rapidapi-host": "api-siret-verification.p.rapidapi.com",
-        "Content-Type": "application/json"
-    }
-
-    try:
-        r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
-        r.raise_for_status()
-        data = r.json()
-
-        if "company" not in data:
-            return None, "Aucune donnée entreprise trouvée."
-
-        company = data["company"]
-
-        info = {
-            "siren": siren,
-            "nom_entreprise": company.get("name", "Nom inconnu"),
-            "adresse": company.get("address", "Adresse inconnue"),
-            "ville_cp": f"{company.get('postal_code', '')} {company.get('city', '')}",
-            "dirigeant": company.get("representative", "Dirigeant non fourni")
-        }
 
-        return info, "OK"
+    Passe par le client partagé (`siren_client`) : connexions réutilisées,
+    fiches en cache, relances en cas d'erreur temporaire. Le client (et
+    requests) n'est importé qu'à la première recherche.
+    """
+    from siren_client import client_par_defaut
 
-    except Exception as e:
-        return None, f"Erreur API : {e}"
+    return client_par_defaut().rechercher(siren)
 
 
 # --------------------------------------------------------
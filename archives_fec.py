@@ -0,0 +1,140 @@
+"""
+FEC transmis en archive (.zip, .gz) : ouverture des fichiers contenus en
+flux, sans extraction ni décompression complète en mémoire.
+
+Les membres texte sont décompressés au fil de la lecture (ZipExtFile,
+GzipFile) : le lecteur CSV ne voit jamais plus d'un bloc décompressé. Les
+classeurs Excel contenus dans une archive, qui demandent un accès
+aléatoire, sont en revanche décompressés en mémoire.
+
+Une archive peut contenir les FEC de plusieurs exercices :
+`repartir_exercices` les attribue à N, N-1, N-2 d'après leur date de
+clôture (nom normalisé SIREN + "FEC" + AAAAMMJJ, sinon dates d'écriture).
+"""
+import gzip
+import io
+import os
+import re
+import struct
+import zipfile
+
+import pandas as pd
+
+from sig_utils import EXTENSIONS_EXCEL, _dates_ecriture, lire_entete_fec
+
+EXTENSIONS_ARCHIVES = (".zip", ".gz")
+EXTENSIONS_FEC = (".txt", ".csv") + EXTENSIONS_EXCEL
+
+_NOM_NORMALISE = re.compile(r"FEC(\d{8})", re.IGNORECASE)
+
+
+def est_archive(nom):
+    return nom.lower().endswith(EXTENSIONS_ARCHIVES)
+
+
+def _nom_gz(file):
+    nom = os.path.basename(file.name)
+    return nom[:-3] if nom.lower().endswith(".gz") else nom
+
+
+def membres_fec(file):
+    """
+    Fichiers FEC de l'archive : liste de dicts {nom, taille (décompressée,
+    en octets ; None si inconnue)}, dans l'ordre de l'archive.
+    """
+    file.seek(0)
+    if file.name.lower().endswith(".gz"):
+        # taille décompressée : 4 derniers octets du gzip (modulo 4 Go)
+        file.seek(-4, io.SEEK_END)
+        taille = struct.unpack("<I", file.read(4))[0]
+        file.seek(0)
+        return [{"nom": _nom_gz(file), "taille": taille}]
+
+    with zipfile.ZipFile(file) as archive:
+        membres = [
+            {"nom": info.filename, "taille": info.file_size}
+            for info in archive.infolist()
+            if not info.is_dir()
+            and not os.path.basename(info.filename).startswith(".")
+            and "__MACOSX" not in info.filename
+            and info.filename.lower().endswith(EXTENSIONS_FEC)
+        ]
+    file.seek(0)
+    return membres
+
+
+def ouvrir_membre(file, nom=None):
+    """
+    Flux binaire lisible et rembobinable du membre `nom` (premier FEC de
+    l'archive si None), avec un attribut `name` (nom du membre). None si
+    l'archive ne contient pas de FEC.
+    """
+    file.seek(0)
+    if file.name.lower().endswith(".gz"):
+        return gzip.GzipFile(filename=_nom_gz(file), fileobj=file, mode="rb")
+
+    if nom is None:
+        membres = membres_fec(file)
+        if not membres:
+            return None
+        nom = membres[0]["nom"]
+
+    archive = zipfile.ZipFile(file)
+    if nom.lower().endswith(EXTENSIONS_EXCEL):
+        flux = io.BytesIO(archive.read(nom))
+        archive.close()
+    else:
+        # ZipExtFile : décompression au fil de la lecture ; l'archive reste
+        # ouverte tant que le flux est utilisé
+        flux = archive.open(nom)
+    flux.name = os.path.basename(nom)
+    return flux
+
+
+def date_cloture(file, nom, taille_echantillon=1 << 20):
+    """
+    Date de clôture d'un FEC de l'archive : d'après le nom normalisé
+    (…FECAAAAMMJJ…), sinon plus grande date d'écriture des premières lignes.
+    None si indéterminée.
+    """
+    trouve = _NOM_NORMALISE.search(os.path.basename(nom))
+    if trouve:
+        date = pd.to_datetime(trouve.group(1), format="%Y%m%d", errors="coerce")
+        if not pd.isna(date):
+            return date
+
+    flux = ouvrir_membre(file, nom)
+    try:
+        entete = lire_entete_fec(flux)
+        if entete["date"] is None:
+            return None
+        if flux.name.lower().endswith(EXTENSIONS_EXCEL):
+            dates = pd.read_excel(flux, usecols=[entete["date"]], nrows=1000)[entete["date"]]
+        else:
+            echantillon = io.BytesIO(flux.read(taille_echantillon))
+            dates = pd.read_csv(
+                echantillon, sep=entete["sep"], encoding=entete["encodage"], encoding_errors="replace",
+                usecols=[entete["date"]], dtype=str, on_bad_lines="skip",
+            )[entete["date"]]
+        date = _dates_ecriture(dates).max()
+        return None if pd.isna(date) else date
+    except Exception:
+        return None
+    finally:
+        flux.close()
+
+
+def repartir_exercices(file, annees=("N", "N-1", "N-2")):
+    """
+    Attribue les FEC d'une archive aux exercices `annees`, du plus récent
+    au plus ancien (date de clôture, puis nom). Retourne (`{annee: nom}`,
+    noms des FEC en surnombre).
+    """
+    membres = membres_fec(file)
+    clotures = {m["nom"]: date_cloture(file, m["nom"]) for m in membres}
+    ordre = sorted(
+        clotures,
+        key=lambda nom: (clotures[nom] is not None, clotures[nom] or pd.Timestamp.min, nom),
+        reverse=True,
+    )
+    return dict(zip(annees, ordre)), ordre[len(annees):]
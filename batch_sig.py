@@ -0,0 +1,341 @@
+"""
+Calcul SIG en masse, sans interface : un répertoire (ou un manifeste) de
+FEC / balances → un fichier consolidé des lignes SIG par entité et exercice.
+
+    python batch_sig.py ENTREE SORTIE.csv [--workers N] [--reprendre] [--rapports REP]
+
+ENTREE est un répertoire (fichiers txt/csv/xlsx/xls et archives zip/gz,
+récursivement) ou un manifeste CSV (colonnes chemin, entite, annee ;
+séparateur ";" ou ","). Chaque FEC d'une archive est un fichier du lot
+(`archives_fec.membres_fec`), lu décompressé au fil de la lecture ; son
+exercice est déduit de son nom, à défaut de sa date de clôture.
+Chaque fichier est traité dans un pool de processus, isolément : une erreur
+est consignée sans interrompre le lot. Un journal (SORTIE.journal.jsonl)
+enregistre chaque fichier terminé ; avec --reprendre, les fichiers déjà
+traités avec succès sont sautés. SORTIE en .parquet : sortie Parquet.
+
+Avec --rapports, chaque dossier (entité) est traité d'un bloc et son
+rapport Excel (`export_sig.ecrire_classeur`, exercices du plus récent au
+plus ancien) est écrit dans REP/<entité>.xlsx.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from archives_fec import EXTENSIONS_ARCHIVES, date_cloture, est_archive, membres_fec, ouvrir_membre
+from export_sig import ecrire_classeur
+from sig_utils import (
+    EXTENSIONS_EXCEL,
+    LIGNES_SIG,
+    calcul_sig,
+    compiler_regles_sig,
+    controle_coherence_detail,
+    lire_fichier_fec_projete,
+    preparer_grouped,
+)
+
+EXTENSIONS = (".txt", ".csv") + EXTENSIONS_EXCEL + EXTENSIONS_ARCHIVES
+
+# Nom normalisé d'un FEC : <SIREN>FEC<AAAAMMJJ de clôture>
+MOTIF_NOM_FEC = re.compile(r"(\d{9})FEC(\d{4})\d{4}", re.IGNORECASE)
+
+
+# ---------- Constitution du lot ----------
+
+def _depuis_nom(chemin):
+    """(entité, exercice) déduits du nom de fichier, à défaut (nom, "")."""
+    m = MOTIF_NOM_FEC.search(chemin.stem)
+    if m:
+        return m.group(1), m.group(2)
+    return chemin.stem, ""
+
+
+def _cle(f):
+    """Identifiant d'un fichier du lot dans le journal : chemin, et FEC lu dans l'archive."""
+    return f"{f['chemin']}!{f['membre']}" if f.get("membre") else f["chemin"]
+
+
+def _entrees(chemin, entite="", annee=""):
+    """
+    Fichiers du lot pour `chemin` : {chemin, entite, annee}, ou un par FEC
+    (`membre`) pour une archive. `entite` / `annee` (manifeste) priment sur
+    ceux déduits des noms ; `annee` ne s'applique qu'à un fichier unique.
+    Archive illisible ou sans FEC : le fichier seul, en erreur au traitement.
+    """
+    archive = est_archive(chemin.name)
+    # x.txt.gz -> x
+    entite_nom, annee_nom = _depuis_nom(Path(chemin.stem) if archive else chemin)
+    seul = [{"chemin": str(chemin), "entite": entite or entite_nom, "annee": annee or annee_nom}]
+    if not archive:
+        return seul
+
+    try:
+        with open(chemin, "rb") as file:
+            membres = membres_fec(file)
+            lot = []
+            for membre in membres:
+                m = MOTIF_NOM_FEC.search(Path(membre["nom"]).stem)
+                if m:
+                    entite_membre, annee_membre = m.group(1), m.group(2)
+                else:
+                    cloture = date_cloture(file, membre["nom"]) if len(membres) > 1 else None
+                    entite_membre = entite_nom
+                    annee_membre = str(cloture.year) if cloture is not None else annee_nom
+                lot.append({
+                    "chemin": str(chemin),
+                    "membre": membre["nom"],
+                    "entite": entite or entite_membre,
+                    "annee": annee if annee and len(membres) == 1 else annee_membre,
+                })
+    except Exception:
+        return seul
+    return lot or seul
+
+
+def lister_fichiers(entree):
+    """
+    Liste de dicts {chemin, entite, annee, et membre pour un FEC d'archive}
+    depuis un répertoire ou un manifeste.
+    """
+    entree = Path(entree)
+
+    if entree.is_dir():
+        fichiers = sorted(p for p in entree.rglob("*") if p.name.lower().endswith(EXTENSIONS))
+        return [f for p in fichiers for f in _entrees(p)]
+
+    with open(entree, newline="", encoding="utf-8-sig") as f:
+        echantillon = f.read(4096)
+        f.seek(0)
+        lecteur = csv.DictReader(f, delimiter=";" if ";" in echantillon else ",")
+        lot = []
+        for ligne in lecteur:
+            chemin = Path(ligne["chemin"])
+            if not chemin.is_absolute():
+                chemin = entree.parent / chemin
+            lot.extend(_entrees(chemin, ligne.get("entite") or "", ligne.get("annee") or ""))
+        return lot
+
+
+# ---------- Traitement d'un fichier (processus fils) ----------
+
+def _traiter(chemin, entite, annee, membre=None):
+    """
+    (entrée de journal, {grouped, regles, coherence} ou None en erreur).
+    `membre` : FEC à lire dans l'archive `chemin`.
+    """
+    debut = time.perf_counter()
+    entree = {"chemin": chemin, "entite": entite, "annee": annee}
+    if membre:
+        entree["membre"] = membre
+    calcul = None
+    try:
+        with open(chemin, "rb") as file:
+            df = lire_fichier_fec_projete(ouvrir_membre(file, membre) if membre else file, strict=True)
+        if df is None:
+            raise ValueError("format non reconnu (colonne compte introuvable)")
+
+        grouped = preparer_grouped(df)
+        regles = compiler_regles_sig(grouped)
+        sig = calcul_sig(grouped, regles)
+        coherence = controle_coherence_detail(df)
+        calcul = {"grouped": grouped, "regles": regles, "coherence": coherence}
+
+        entree.update(
+            statut="ok",
+            nb_lignes=len(df),
+            ecart_coherence=coherence["ecart"],
+            sig=sig,
+        )
+    except Exception as e:
+        entree.update(statut="erreur", erreur=f"{type(e).__name__} : {e}")
+
+    entree["duree"] = time.perf_counter() - debut
+    return entree, calcul
+
+
+def traiter_fichier(chemin, entite, annee, membre=None):
+    """
+    lecture → regroupement → SIG → cohérence pour un fichier (ou le FEC
+    `membre` d'une archive). Retourne une entrée de journal ; les erreurs
+    sont capturées.
+    """
+    return _traiter(chemin, entite, annee, membre)[0]
+
+
+def _nom_rapport(entite):
+    return re.sub(r"[^\w.-]+", "_", entite).strip("_") or "dossier"
+
+
+def traiter_dossier(entite, fichiers, rapports):
+    """
+    Traite les fichiers d'une entité ({chemin, annee, membre}) et écrit son
+    rapport Excel dans le répertoire `rapports`. Retourne les entrées de journal
+    (avec le chemin du rapport) ; une erreur d'écriture du rapport est
+    consignée sur chaque entrée sans interrompre le lot.
+    """
+    entrees, exercices = [], {}
+    for f in sorted(fichiers, key=lambda f: (f["annee"], _cle(f)), reverse=True):
+        entree, calcul = _traiter(f["chemin"], entite, f["annee"], f.get("membre"))
+        entrees.append(entree)
+        if calcul is not None:
+            nom = Path(f.get("membre") or f["chemin"])
+            libelle = f["annee"] or nom.stem
+            if libelle in exercices:  # deux fichiers du même exercice
+                libelle = nom.name
+            exercices[libelle] = calcul
+
+    if exercices:
+        rapport = str(Path(rapports) / f"{_nom_rapport(entite)}.xlsx")
+        try:
+            ecrire_classeur(rapport, exercices, titre=entite)
+        except Exception as e:
+            for entree in entrees:
+                entree["erreur_rapport"] = f"{type(e).__name__} : {e}"
+        else:
+            for entree in entrees:
+                entree["rapport"] = rapport
+    return entrees
+
+
+# ---------- Journal et sortie consolidée ----------
+
+def _chemin_journal(sortie):
+    return Path(f"{sortie}.journal.jsonl")
+
+
+def lire_journal(sortie):
+    """Dernière entrée de journal de chaque fichier."""
+    journal = _chemin_journal(sortie)
+    entrees = {}
+    if journal.exists():
+        with open(journal, encoding="utf-8") as f:
+            for ligne in f:
+                if ligne.strip():
+                    entree = json.loads(ligne)
+                    entrees[_cle(entree)] = entree
+    return entrees
+
+
+def ecrire_sortie(entrees, sortie):
+    """Fichier consolidé : une ligne par entité, exercice et poste SIG."""
+    lignes = []
+    for entree in entrees:
+        if entree["statut"] != "ok":
+            continue
+        for ordre, poste in enumerate(LIGNES_SIG, start=1):
+            lignes.append({
+                "entite": entree["entite"],
+                "annee": entree["annee"],
+                "fichier": os.path.basename(entree.get("membre") or entree["chemin"]),
+                "ordre": ordre,
+                "poste": poste,
+                "montant": entree["sig"][poste],
+                "ecart_coherence": entree["ecart_coherence"],
+            })
+
+    resultat = pd.DataFrame(lignes, columns=[
+        "entite", "annee", "fichier", "ordre", "poste", "montant", "ecart_coherence",
+    ])
+    if str(sortie).lower().endswith(".parquet"):
+        resultat.to_parquet(sortie, index=False)
+    else:
+        resultat.to_csv(sortie, sep=";", index=False, decimal=",")
+    return resultat
+
+
+def executer_lot(entree, sortie, workers=None, reprendre=False, rapports=None):
+    """
+    Traite le lot et écrit la sortie consolidée ; avec `rapports`
+    (répertoire), un rapport Excel par entité (`traiter_dossier`).
+    Retourne le rapport : fichiers traités / en erreur / sautés, débits.
+    """
+    lot = lister_fichiers(entree)
+    deja = lire_journal(sortie) if reprendre else {}
+    if not reprendre:
+        _chemin_journal(sortie).unlink(missing_ok=True)
+
+    def termine(f):
+        entree = deja.get(_cle(f), {})
+        return entree.get("statut") == "ok" and (rapports is None or "rapport" in entree)
+
+    a_traiter = [f for f in lot if not termine(f)]
+    if rapports is not None:
+        # un dossier est retraité en entier dès qu'un de ses fichiers doit l'être
+        entites = {f["entite"] for f in a_traiter}
+        a_traiter = [f for f in lot if f["entite"] in entites]
+        dossiers = {}
+        for f in a_traiter:
+            dossiers.setdefault(f["entite"], []).append(f)
+        os.makedirs(rapports, exist_ok=True)
+
+    debut = time.perf_counter()
+    nouvelles = []
+    with open(_chemin_journal(sortie), "a", encoding="utf-8") as journal, \
+            ProcessPoolExecutor(max_workers=workers) as executeur:
+        if rapports is None:
+            futurs = [
+                executeur.submit(traiter_fichier, f["chemin"], f["entite"], f["annee"], f.get("membre"))
+                for f in a_traiter
+            ]
+        else:
+            futurs = [executeur.submit(traiter_dossier, e, fichiers, rapports) for e, fichiers in dossiers.items()]
+        for futur in as_completed(futurs):
+            resultats = futur.result()
+            for resultat in resultats if rapports is not None else [resultats]:
+                journal.write(json.dumps(resultat, ensure_ascii=False) + "\n")
+                nouvelles.append(resultat)
+                if resultat["statut"] != "ok":
+                    print(f"ERREUR {_cle(resultat)} : {resultat['erreur']}", file=sys.stderr)
+                elif "erreur_rapport" in resultat:
+                    print(f"ERREUR rapport {resultat['entite']} : {resultat['erreur_rapport']}", file=sys.stderr)
+            journal.flush()
+    duree = time.perf_counter() - debut
+
+    entrees = lire_journal(sortie)
+    ecrire_sortie([entrees[_cle(f)] for f in lot if _cle(f) in entrees], sortie)
+
+    ok = [r for r in nouvelles if r["statut"] == "ok"]
+    nb_lignes = sum(r["nb_lignes"] for r in ok)
+    return {
+        "fichiers": len(lot),
+        "traites": len(ok),
+        "erreurs": len(nouvelles) - len(ok),
+        "sautes": len(lot) - len(a_traiter),
+        "lignes": nb_lignes,
+        "duree": duree,
+        "fichiers_par_s": len(nouvelles) / duree if duree else 0.0,
+        "lignes_par_s": nb_lignes / duree if duree else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcul SIG en masse sur des FEC / balances.")
+    parser.add_argument("entree", help="répertoire de FEC ou manifeste CSV (chemin;entite;annee)")
+    parser.add_argument("sortie", help="fichier consolidé (.csv ou .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus (défaut : nb de CPU)")
+    parser.add_argument("--reprendre", action="store_true", help="sauter les fichiers déjà traités avec succès")
+    parser.add_argument("--rapports", default=None, help="répertoire des rapports Excel, un par entité")
+    args = parser.parse_args(argv)
+
+    rapport = executer_lot(args.entree, args.sortie, args.workers, args.reprendre, args.rapports)
+    print(
+        f"{rapport['traites']} fichier(s) traité(s), {rapport['erreurs']} en erreur, "
+        f"{rapport['sautes']} déjà traité(s) sur {rapport['fichiers']}"
+    )
+    print(
+        f"{rapport['duree']:.1f} s – {rapport['fichiers_par_s']:.2f} fichiers/s, "
+        f"{rapport['lignes_par_s']:,.0f} lignes/s".replace(",", " ")
+    )
+    return 1 if rapport["erreurs"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
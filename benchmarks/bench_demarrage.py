@@ -0,0 +1,165 @@
+"""
+Benchmark du démarrage à froid : durée d'import des modules de l'application
+et de la première exécution de chaque script Streamlit, chacun mesuré dans
+un interpréteur neuf (comme un nouveau processus de l'application, du
+pipeline ou du batch), avec comparaison à une référence enregistrée.
+
+Pour chaque cible, la durée retenue est la médiane de `--repetitions`
+interpréteurs. Les scripts (app.py, pages) sont exécutés une fois par
+AppTest, Streamlit déjà importé (il l'est par le serveur) : la mesure
+couvre les imports du script et son premier rendu, session vide.
+
+Sont aussi relevés les modules lourds chargés par chaque cible : le cœur
+de calcul (sig_utils, pipeline, batch, export, validation) ne doit charger
+ni Streamlit, ni openpyxl, ni requests ; app.py ne doit charger ni pandas
+ni requests. Une cible qui en charge un est en erreur.
+
+Usage :
+  python benchmarks/bench_demarrage.py [--repetitions 5] [--enregistrer]
+      [--reference benchmarks/reference_demarrage.json] [--tolerance 0.5]
+
+Sans --enregistrer, une cible plus lente que la référence × (1 + tolérance)
+est une régression ; régression ou module interdit : code de sortie 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+REFERENCE = Path(__file__).with_name("reference_demarrage.json")
+
+LOURDS = ("streamlit", "pandas", "pyarrow", "openpyxl", "lxml", "requests")
+
+# cible -> modules lourds interdits
+MODULES = {
+    "sig_utils": ("streamlit", "openpyxl", "requests"),
+    "pipeline_sig": ("streamlit", "openpyxl", "requests"),
+    "batch_sig": ("streamlit", "openpyxl", "requests"),
+    "export_sig": ("streamlit", "openpyxl", "requests"),
+    "validation_fec": ("streamlit", "openpyxl", "requests"),
+    "taches_import": ("streamlit", "openpyxl", "requests"),
+    "siren_client": ("pandas", "requests"),
+}
+SCRIPTS = {
+    "app.py": ("pandas", "requests"),
+    "pages/1_Donnees_imports.py": ("openpyxl", "requests"),
+    "pages/2_Analyse_SIG.py": ("openpyxl", "requests"),
+}
+
+_MESURE_MODULE = """
+import importlib, json, sys, time
+debut = time.perf_counter()
+importlib.import_module({cible!r})
+duree = time.perf_counter() - debut
+print(json.dumps({{"duree_s": duree, "charges": [m for m in {lourds!r} if m in sys.modules]}}))
+"""
+
+_MESURE_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+avant = set(sys.modules)
+test = AppTest.from_file({cible!r}, default_timeout=120)
+debut = time.perf_counter()
+test.run()
+duree = time.perf_counter() - debut
+print(json.dumps({{
+    "duree_s": duree,
+    "charges": [m for m in {lourds!r} if m in sys.modules and m not in avant],
+    "exceptions": [str(e.value) for e in test.exception],
+}}))
+"""
+
+
+def mesurer(code, repetitions):
+    """Médiane des durées sur `repetitions` interpréteurs neufs, et dernier relevé."""
+    durees = []
+    for _ in range(repetitions):
+        sortie = subprocess.run(
+            [sys.executable, "-c", code], cwd=RACINE, capture_output=True, text=True, check=True,
+            env=dict(os.environ, PYTHONPATH=str(RACINE)),
+        )
+        releve = json.loads(sortie.stdout.strip().splitlines()[-1])
+        durees.append(releve["duree_s"])
+    releve["duree_s"] = round(statistics.median(durees), 4)
+    return releve
+
+
+def executer(repetitions):
+    """{cible: {duree_s, charges, interdits}} pour l'interpréteur nu, les modules et les scripts."""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        durees.append(time.perf_counter() - debut)
+    # lancement de l'interpréteur seul, à ajouter aux imports pour un processus neuf
+    resultats = {"(interpréteur)": {"duree_s": round(statistics.median(durees), 4), "charges": [], "interdits": []}}
+
+    for cibles, gabarit in ((MODULES, _MESURE_MODULE), (SCRIPTS, _MESURE_SCRIPT)):
+        for cible, interdits in cibles.items():
+            releve = mesurer(gabarit.format(cible=cible, lourds=LOURDS), repetitions)
+            releve["interdits"] = [m for m in releve["charges"] if m in interdits]
+            resultats[cible] = releve
+    return resultats
+
+
+def afficher(resultats, reference):
+    for cible, releve in resultats.items():
+        ligne = f"  {cible:30s} {releve['duree_s'] * 1000:8.0f} ms  {', '.join(releve['charges']) or '-'}"
+        ref = reference.get(cible)
+        if ref and ref["duree_s"]:
+            ligne += f"   (x{releve['duree_s'] / ref['duree_s']:.2f} vs référence)"
+        if releve["interdits"]:
+            ligne += f"   INTERDIT : {', '.join(releve['interdits'])}"
+        if releve.get("exceptions"):
+            ligne += f"   EXCEPTION : {releve['exceptions'][0]}"
+        print(ligne)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid (imports, premier rendu).")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--reference", type=Path, default=REFERENCE)
+    parser.add_argument("--enregistrer", action="store_true", help="remplacer la référence par ces mesures")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    reference = json.loads(args.reference.read_text()) if args.reference.exists() else {}
+    mesures_ref = reference.get("cibles", {})
+
+    resultats = executer(args.repetitions)
+    print(f"Démarrage à froid (médiane de {args.repetitions} interpréteurs)")
+    afficher(resultats, mesures_ref)
+
+    erreurs = [c for c, r in resultats.items() if r["interdits"] or r.get("exceptions")]
+    if args.enregistrer:
+        args.reference.write_text(json.dumps({
+            "machine": f"{platform.system()} {platform.machine()} – Python {platform.python_version()}",
+            "cibles": {c: {"duree_s": r["duree_s"]} for c, r in resultats.items()},
+        }, indent=2, ensure_ascii=False) + "\n")
+        print(f"Référence enregistrée : {args.reference}")
+        return 1 if erreurs else 0
+
+    regressions = [
+        (cible, ref["duree_s"], resultats[cible]["duree_s"])
+        for cible, ref in mesures_ref.items()
+        # en dessous de 50 ms, le bruit de mesure domine
+        if cible in resultats and resultats[cible]["duree_s"] > max(ref["duree_s"], 0.05) * (1 + args.tolerance)
+    ]
+    for cible, ref, actuel in regressions:
+        print(f"RÉGRESSION {cible} : {ref} s → {actuel} s", file=sys.stderr)
+    for cible in erreurs:
+        print(f"ERREUR {cible} : modules interdits {resultats[cible]['interdits']}, "
+              f"exceptions {resultats[cible].get('exceptions', [])}", file=sys.stderr)
+    if not mesures_ref:
+        print("Aucune référence : relancer avec --enregistrer pour en créer une.")
+    return 1 if regressions or erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
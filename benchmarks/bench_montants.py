@@ -0,0 +1,54 @@
+"""
+Benchmark : conversion des colonnes Débit / Crédit.
+
+Compare l'ancien chemin (`serie.apply(to_float)`) au parseur vectorisé
+`parser_montants` (centimes int64) sur des montants au format français.
+
+Usage : python benchmarks/bench_montants.py [nb_lignes]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sig_utils import parser_montants, to_float  # noqa: E402
+
+
+def generer_montants(n, seed=0):
+    """Montants FEC simples ("1234,56"), avec 40 % de cellules vides."""
+    rng = np.random.default_rng(seed)
+    cts = rng.integers(1, 10_000_000, size=n)
+    txt = pd.Series([f"{c // 100},{c % 100:02d}" for c in cts], dtype=str)
+    vides = rng.random(n) < 0.4
+    txt[vides] = ""
+    return txt
+
+
+def chrono(fonction, *args):
+    debut = time.perf_counter()
+    resultat = fonction(*args)
+    return resultat, time.perf_counter() - debut
+
+
+def main(n):
+    serie = generer_montants(n)
+
+    ancien, t_ancien = chrono(lambda s: s.apply(to_float), serie)
+    nouveau, t_nouveau = chrono(parser_montants, serie)
+
+    ecart_max = np.abs(np.rint(ancien.to_numpy() * 100) - nouveau.to_numpy()).max()
+
+    print(f"{n} lignes")
+    print(f"  apply(to_float)   : {t_ancien:8.3f} s")
+    print(f"  parser_montants   : {t_nouveau:8.3f} s  (x{t_ancien / t_nouveau:.1f})")
+    print(f"  écart max (cts)   : {ecart_max}")
+    print(f"  somme float       : {ancien.sum():.2f}")
+    print(f"  somme centimes    : {nouveau.sum() / 100:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
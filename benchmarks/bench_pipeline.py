@@ -0,0 +1,204 @@
+"""
+Suite de benchmarks du chemin import → SIG, sur FEC synthétiques
+(`generateur_fec`), avec comparaison à une référence enregistrée.
+
+Pour chaque scénario (lignes, comptes, séparateur, encodage, CSV / Excel),
+chaque étape est mesurée deux fois : durée (meilleure de `--repetitions`)
+puis pic mémoire Python (tracemalloc, qui ne voit pas les allocations
+internes d'Arrow). Les étapes :
+lire_fichier_fec, normaliser_colonnes, lire_fichier_fec_projete,
+lire_fichier_fec_par_blocs, preparer_grouped, controle_coherence,
+valider_fec, calcul_sig, filtre_detail (toutes les lignes SIG).
+
+Usage :
+  python benchmarks/bench_pipeline.py [--suite rapide|complete] [--lignes N ...]
+      [--enregistrer] [--reference benchmarks/reference.json] [--tolerance 0.5]
+
+Sans --enregistrer, les mesures sont comparées à la référence : une étape
+plus lente (ou plus gourmande) que la référence × (1 + tolérance) est une
+régression, et le code de sortie vaut 1. Les fichiers générés sont gardés
+dans BIPLUS_BENCH_DIR (défaut : répertoire temporaire) pour être réutilisés.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from generateur_fec import ecrire_fec  # noqa: E402
+from sig_utils import (  # noqa: E402
+    LIGNES_SIG,
+    calcul_sig,
+    compiler_regles_sig,
+    controle_coherence,
+    filtre_detail,
+    lire_fichier_fec,
+    lire_fichier_fec_par_blocs,
+    lire_fichier_fec_projete,
+    normaliser_colonnes,
+    preparer_grouped,
+)
+from validation_fec import valider_fec  # noqa: E402
+
+REFERENCE = Path(__file__).with_name("reference.json")
+REPERTOIRE = Path(os.environ.get("BIPLUS_BENCH_DIR", Path(tempfile.gettempdir()) / "biplus_bench"))
+
+# Scénario : (lignes, comptes, séparateur, encodage, extension)
+SUITES = {
+    "rapide": [
+        (10_000, 500, ";", "utf-8", ".txt"),
+        (100_000, 2_000, ";", "utf-8", ".txt"),
+        (100_000, 2_000, "|", "cp1252", ".txt"),
+        (100_000, 2_000, "\t", "utf-8", ".csv"),
+        (10_000, 500, ";", "utf-8", ".xlsx"),
+    ],
+    "complete": [
+        (10_000, 500, ";", "utf-8", ".txt"),
+        (100_000, 2_000, ";", "utf-8", ".txt"),
+        (100_000, 2_000, "|", "cp1252", ".txt"),
+        (100_000, 2_000, "\t", "utf-8", ".csv"),
+        (1_000_000, 10_000, ";", "utf-8", ".txt"),
+        (1_000_000, 10_000, ",", "cp1252", ".csv"),
+        (10_000_000, 50_000, ";", "utf-8", ".txt"),
+        (10_000, 500, ";", "utf-8", ".xlsx"),
+        (100_000, 2_000, ";", "utf-8", ".xlsx"),
+    ],
+}
+
+NOMS_SEP = {";": "pv", ",": "virgule", "|": "pipe", "\t": "tab"}
+
+
+def nom_scenario(lignes, comptes, sep, encodage, extension):
+    return f"{lignes}l_{comptes}c_{NOMS_SEP[sep]}_{encodage}{extension}"
+
+
+def fichier_scenario(scenario):
+    """Chemin du FEC synthétique du scénario (généré s'il n'existe pas encore)."""
+    lignes, comptes, sep, encodage, extension = scenario
+    chemin = REPERTOIRE / nom_scenario(*scenario)
+    if not chemin.exists():
+        REPERTOIRE.mkdir(parents=True, exist_ok=True)
+        temporaire = chemin.with_name(f"tmp_{os.getpid()}_{chemin.name}")
+        ecrire_fec(temporaire, lignes, comptes, sep=sep, encodage=encodage)
+        os.replace(temporaire, chemin)
+    return chemin
+
+
+def mesurer(fonction, repetitions):
+    """(résultat, meilleure durée en s, pic mémoire tracemalloc en octets)."""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    del resultat
+
+    tracemalloc.start()
+    resultat = fonction()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultat, min(durees), pic
+
+
+def _lire(chemin, lecture, **options):
+    with open(chemin, "rb") as file:
+        return lecture(file, **options)
+
+
+def executer_scenario(scenario, repetitions):
+    """Mesures {étape: {duree_s, pic_octets}} d'un scénario."""
+    chemin = fichier_scenario(scenario)
+    excel = chemin.suffix == ".xlsx"
+    mesures = {}
+
+    def etape(nom, fonction, repetitions=repetitions):
+        resultat, duree, pic = mesurer(fonction, repetitions)
+        mesures[nom] = {"duree_s": round(duree, 4), "pic_octets": pic}
+        return resultat
+
+    # les lectures Excel sont longues : une seule répétition
+    rep_lecture = 1 if excel else repetitions
+    brut = etape("lire_fichier_fec", lambda: _lire(chemin, lire_fichier_fec), rep_lecture)
+    etape("normaliser_colonnes", lambda: normaliser_colonnes(brut.copy(deep=False)))
+    etape("lire_fichier_fec_projete", lambda: _lire(chemin, lire_fichier_fec_projete), rep_lecture)
+    etape("lire_fichier_fec_par_blocs", lambda: _lire(chemin, lire_fichier_fec_par_blocs), rep_lecture)
+    grouped = etape("preparer_grouped", lambda: preparer_grouped(brut))
+    etape("controle_coherence", lambda: controle_coherence(brut))
+    etape("valider_fec", lambda: valider_fec(brut))
+    regles = compiler_regles_sig(grouped)
+    etape("calcul_sig", lambda: calcul_sig(grouped))
+    etape("filtre_detail", lambda: [filtre_detail(grouped, ligne, regles) for ligne in LIGNES_SIG])
+    return mesures
+
+
+def comparer(resultats, reference, tolerance):
+    """Liste des régressions (scénario, étape, mesure, référence, actuel)."""
+    regressions = []
+    for scenario, mesures in resultats.items():
+        for etape, valeurs in mesures.items():
+            ref = reference.get(scenario, {}).get(etape)
+            if ref is None:
+                continue
+            for cle in ("duree_s", "pic_octets"):
+                # en dessous de 50 ms / 1 Mo, le bruit de mesure domine
+                plancher = 0.05 if cle == "duree_s" else 1 << 20
+                if valeurs[cle] > max(ref[cle], plancher) * (1 + tolerance):
+                    regressions.append((scenario, etape, cle, ref[cle], valeurs[cle]))
+    return regressions
+
+
+def afficher(nom, mesures, reference):
+    print(nom)
+    for etape, valeurs in mesures.items():
+        ligne = f"  {etape:28s} {valeurs['duree_s'] * 1000:10.1f} ms  {valeurs['pic_octets'] / 1024 ** 2:9.1f} Mo"
+        ref = reference.get(nom, {}).get(etape)
+        if ref and ref["duree_s"]:
+            ligne += f"   (x{valeurs['duree_s'] / ref['duree_s']:.2f} vs référence)"
+        print(ligne)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks import → SIG sur FEC synthétiques.")
+    parser.add_argument("--suite", choices=SUITES, default="rapide")
+    parser.add_argument("--lignes", type=int, nargs="*", help="ne garder que ces tailles")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--reference", type=Path, default=REFERENCE)
+    parser.add_argument("--enregistrer", action="store_true", help="remplacer la référence par ces mesures")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in SUITES[args.suite] if not args.lignes or s[0] in args.lignes]
+    reference = json.loads(args.reference.read_text()) if args.reference.exists() else {}
+    mesures_ref = reference.get("scenarios", {})
+
+    resultats = {}
+    for scenario in scenarios:
+        nom = nom_scenario(*scenario)
+        resultats[nom] = executer_scenario(scenario, args.repetitions)
+        afficher(nom, resultats[nom], mesures_ref)
+
+    if args.enregistrer:
+        mesures_ref.update(resultats)
+        args.reference.write_text(json.dumps({
+            "machine": f"{platform.system()} {platform.machine()} – Python {platform.python_version()}",
+            "scenarios": mesures_ref,
+        }, indent=2, ensure_ascii=False) + "\n")
+        print(f"Référence enregistrée : {args.reference}")
+        return 0
+
+    regressions = comparer(resultats, mesures_ref, args.tolerance)
+    for scenario, etape, cle, ref, actuel in regressions:
+        print(f"RÉGRESSION {scenario} / {etape} : {cle} {ref} → {actuel}", file=sys.stderr)
+    if not mesures_ref:
+        print("Aucune référence : relancer avec --enregistrer pour en créer une.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark : sommes par préfixe de `calcul_sig` sur un grand plan comptable.
+
+Compare les ~25 balayages (masque `str.startswith` / regex sur tout
+'grouped') à l'index trié + sommes cumulées de `indexer_prefixes`.
+
+Usage : python benchmarks/bench_sig.py [nb_comptes ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sig_utils import calcul_sig, indexer_prefixes, somme_prefixes  # noqa: E402
+
+# Requêtes de `calcul_sig` : (préfixes, exclusions)
+REQUETES = [
+    (("707",), ()), (("70",), ("707",)), (("713",), ()), (("72",), ()),
+    (("607", "6037", "6031"), ()), (("60",), ("607",)), (("61", "62"), ()),
+    (("74",), ()), (("63",), ()), (("64",), ()), (("79", "791"), ()),
+    (("78", "781"), ()), (("75",), ()), (("68",), ("686", "687")),
+    (("681",), ()), (("65",), ()), (("76",), ()), (("66",), ()),
+    (("77",), ()), (("67",), ()),
+]
+
+
+def generer_grouped(nb_comptes, seed=0):
+    """Plan comptable synthétique : sous-comptes à 8 chiffres des classes 1 à 7."""
+    rng = np.random.default_rng(seed)
+    racines = rng.integers(10, 80, size=nb_comptes)
+    suffixes = rng.integers(0, 1_000_000, size=nb_comptes)
+    comptes = np.unique([f"{r}{s:06d}" for r, s in zip(racines, suffixes)])  # trié, comme preparer_grouped
+    cts = rng.integers(-10_000_000, 10_000_000, size=len(comptes))
+    return pd.DataFrame({
+        "CompteNum": comptes,
+        "CompteLib": [f"Compte {c}" for c in comptes],
+        "Debit": np.maximum(cts, 0) / 100,
+        "Credit": np.maximum(-cts, 0) / 100,
+        "Montant": cts / 100,
+    })
+
+
+def somme_par_balayage(grouped, prefixes, exclus):
+    comptes = grouped["CompteNum"]
+    masque = comptes.str.startswith(prefixes)
+    if exclus:
+        masque &= ~comptes.str.startswith(exclus)
+    return grouped.loc[masque, "Montant"].sum()
+
+
+def chrono(fonction, repetitions=5):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        resultat = fonction()
+    return resultat, (time.perf_counter() - debut) / repetitions
+
+
+def main(tailles):
+    for nb in tailles:
+        grouped = generer_grouped(nb)
+
+        balayage, t_balayage = chrono(
+            lambda: [somme_par_balayage(grouped, p, e) for p, e in REQUETES])
+
+        index, t_construction = chrono(lambda: indexer_prefixes(grouped))
+        indexe, t_requetes = chrono(lambda: [somme_prefixes(index, p, e) for p, e in REQUETES])
+        t_index = t_construction + t_requetes
+        _, t_sig = chrono(lambda: calcul_sig(grouped))
+
+        ecart_max = max(abs(a - b) for a, b in zip(balayage, indexe))
+        print(f"{len(grouped)} comptes")
+        print(f"  {len(REQUETES)} balayages        : {t_balayage * 1000:8.1f} ms")
+        print(f"  construction index   : {t_construction * 1000:8.1f} ms  (une fois par 'grouped')")
+        print(f"  {len(REQUETES)} requêtes indexées : {t_requetes * 1000:8.1f} ms")
+        print(f"  index + requêtes     : {t_index * 1000:8.1f} ms  (x{t_balayage / t_index:.1f})")
+        print(f"  calcul_sig complet   : {t_sig * 1000:8.1f} ms")
+        print(f"  écart max            : {ecart_max:.6f} €")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,192 @@
+"""
+Générateur déterministe de FEC / balances synthétiques pour les benchmarks.
+
+Le grand livre est produit par blocs : des écritures équilibrées à deux
+lignes (débit / crédit) sur un plan comptable réaliste des classes 1 à 7,
+aux 18 colonnes réglementaires. Les comptes de tiers (401 / 411) portent
+un compte auxiliaire. Une même graine donne toujours le même fichier.
+
+Usage : python benchmarks/generateur_fec.py SORTIE nb_lignes [nb_comptes]
+        [--sep ";"] [--encodage utf-8] [--balance]
+(SORTIE en .xlsx : fichier Excel, plafonné à 1 048 575 lignes.)
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+COLONNES_FEC = [
+    "JournalCode", "JournalLib", "EcritureNum", "EcritureDate", "CompteNum", "CompteLib",
+    "CompAuxNum", "CompAuxLib", "PieceRef", "PieceDate", "EcritureLib", "Debit", "Credit",
+    "EcritureLet", "DateLet", "ValidDate", "Montantdevise", "Idevise",
+]
+
+# Racines du plan comptable (3 chiffres) et poids relatif en nombre de lignes.
+RACINES = {
+    "101": 1, "106": 1, "164": 1, "215": 1, "218": 1, "281": 1, "355": 1, "370": 1,
+    "401": 30, "411": 30, "421": 3, "431": 3, "445": 12, "512": 20, "530": 1,
+    "601": 6, "603": 2, "606": 5, "607": 8, "611": 2, "613": 3, "622": 3, "625": 2,
+    "626": 2, "635": 1, "641": 3, "645": 3, "661": 1, "671": 1, "681": 1, "695": 1,
+    "701": 6, "706": 8, "707": 8, "708": 1, "713": 1, "740": 1, "758": 1, "761": 1,
+    "771": 1, "781": 1, "791": 1,
+}
+
+JOURNAUX = {"AC": "Achats", "VE": "Ventes", "BQ": "Banque", "OD": "Opérations diverses"}
+
+TAILLE_BLOC = 500_000
+MAX_LIGNES_EXCEL = 1_048_575
+
+
+def plan_comptable(nb_comptes, seed=0):
+    """DataFrame CompteNum / CompteLib trié : `nb_comptes` sous-comptes à 8 chiffres."""
+    rng = np.random.default_rng(seed)
+    racines = np.array(list(RACINES))
+    poids = np.array(list(RACINES.values()), dtype=float)
+    nb_comptes = max(nb_comptes, len(racines))
+
+    # chaque racine a au moins un compte, le reste est réparti selon les poids
+    tirage = rng.choice(len(racines), size=nb_comptes - len(racines), p=poids / poids.sum())
+    choix = np.concatenate([np.arange(len(racines)), tirage])
+    comptes = set()
+    for i, racine in enumerate(racines[choix]):
+        compte = f"{racine}{i % 100_000:05d}"
+        comptes.add(compte)
+    comptes = np.array(sorted(comptes))
+    return pd.DataFrame({"CompteNum": comptes, "CompteLib": [f"Compte {c}" for c in comptes]})
+
+
+def _poids_comptes(plan):
+    """Poids de tirage des comptes (poids de la racine réparti sur ses comptes)."""
+    racines = plan["CompteNum"].str[:3]
+    nb_par_racine = racines.map(racines.value_counts())
+    poids = racines.map(RACINES).astype(float) / nb_par_racine
+    return (poids / poids.sum()).to_numpy()
+
+
+def _montants_texte(cts):
+    """Centimes int64 -> texte au format français ("1234,56"), vides pour 0."""
+    centimes = np.array([f",{c:02d}" for c in range(100)], dtype=object)
+    texte = pd.Series(cts // 100).astype(str).to_numpy(dtype=object) + centimes[cts % 100]
+    texte[cts == 0] = ""
+    return texte
+
+
+def generer_blocs(nb_lignes, nb_comptes=1_000, annee=2024, seed=0, taille_bloc=TAILLE_BLOC):
+    """Itère sur des DataFrames FEC (texte) dont le total fait `nb_lignes` lignes."""
+    rng = np.random.default_rng(seed)
+    plan = plan_comptable(nb_comptes, seed)
+    poids = _poids_comptes(plan)
+    comptes = plan["CompteNum"].to_numpy()
+    libelles = plan["CompteLib"].to_numpy()
+    codes_journaux = np.array(list(JOURNAUX))
+    libelles_journaux = np.array(list(JOURNAUX.values()))
+    jours_annee = pd.date_range(f"{annee}-01-01", periods=365).strftime("%Y%m%d").to_numpy()
+
+    taille_bloc -= taille_bloc % 2  # une écriture ne chevauche pas deux blocs
+    produites = 0
+    while produites < nb_lignes:
+        n = min(taille_bloc, nb_lignes - produites)
+        nb_ecritures = (n + 1) // 2
+
+        # écriture = deux lignes : compte débité puis compte crédité, même montant
+        idx = rng.choice(len(comptes), size=(nb_ecritures, 2), p=poids).ravel()[:n]
+        montants = rng.lognormal(mean=10, sigma=1.5, size=nb_ecritures).astype(np.int64) + 1
+        cts = np.repeat(montants, 2)[:n]
+        sens_debit = np.tile([True, False], nb_ecritures)[:n]
+
+        numeros = np.repeat(np.arange(produites // 2, produites // 2 + nb_ecritures), 2)[:n] + 1
+        jours = np.repeat(rng.integers(0, 365, size=nb_ecritures), 2)[:n]
+        dates = jours_annee[jours]
+        journal = np.repeat(rng.integers(0, len(codes_journaux), size=nb_ecritures), 2)[:n]
+
+        compte = pd.Series(comptes[idx])
+        tiers = compte.str.startswith(("401", "411"))
+        aux = np.where(tiers, np.where(compte.str[:3] == "401", "F", "C") + compte.str[-4:], "")
+
+        yield pd.DataFrame({
+            "JournalCode": codes_journaux[journal],
+            "JournalLib": libelles_journaux[journal],
+            "EcritureNum": numeros.astype(str),
+            "EcritureDate": dates,
+            "CompteNum": compte,
+            "CompteLib": libelles[idx],
+            "CompAuxNum": aux,
+            "CompAuxLib": np.where(tiers, "Tiers " + pd.Series(aux), ""),
+            "PieceRef": ("P" + pd.Series(numeros).astype(str)).to_numpy(),
+            "PieceDate": dates,
+            "EcritureLib": "Écriture " + pd.Series(numeros).astype(str),
+            "Debit": _montants_texte(np.where(sens_debit, cts, 0)),
+            "Credit": _montants_texte(np.where(sens_debit, 0, cts)),
+            "EcritureLet": "",
+            "DateLet": "",
+            "ValidDate": dates,
+            "Montantdevise": "",
+            "Idevise": "",
+        }, columns=COLONNES_FEC)
+        produites += n
+
+
+def generer_balance(nb_comptes=1_000, seed=0):
+    """Balance synthétique (CompteNum, CompteLib, Debit, Credit), équilibrée."""
+    rng = np.random.default_rng(seed)
+    plan = plan_comptable(nb_comptes, seed)
+    soldes = rng.lognormal(mean=12, sigma=1.5, size=len(plan)).astype(np.int64) + 1
+    sens = rng.random(len(plan)) < 0.5
+    soldes[-1] = 0
+    ecart = np.where(sens, soldes, -soldes).sum()
+    sens[-1], soldes[-1] = ecart < 0, abs(ecart)
+    plan["Debit"] = _montants_texte(np.where(sens, soldes, 0))
+    plan["Credit"] = _montants_texte(np.where(sens, 0, soldes))
+    return plan
+
+
+def ecrire_fec(chemin, nb_lignes, nb_comptes=1_000, sep=";", encodage="utf-8", balance=False, seed=0):
+    """
+    Écrit un FEC (ou une balance) synthétique : CSV / txt avec le séparateur
+    et l'encodage demandés, ou Excel si `chemin` se termine par .xlsx.
+    Retourne le chemin.
+    """
+    blocs = [generer_balance(nb_comptes, seed)] if balance else generer_blocs(nb_lignes, nb_comptes, seed=seed)
+
+    if str(chemin).lower().endswith(".xlsx"):
+        from openpyxl import Workbook
+
+        classeur = Workbook(write_only=True)
+        feuille = classeur.create_sheet()
+        ecrites = 0
+        for i, bloc in enumerate(blocs):
+            if i == 0:
+                feuille.append(list(bloc.columns))
+            for ligne in bloc.itertuples(index=False):
+                if ecrites >= MAX_LIGNES_EXCEL:
+                    break
+                feuille.append(list(ligne))
+                ecrites += 1
+        classeur.save(chemin)
+        return chemin
+
+    with open(chemin, "w", encoding=encodage, newline="") as f:
+        for i, bloc in enumerate(blocs):
+            bloc.to_csv(f, sep=sep, index=False, header=i == 0, quoting=csv.QUOTE_MINIMAL)
+    return chemin
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère un FEC / une balance synthétique.")
+    parser.add_argument("sortie")
+    parser.add_argument("nb_lignes", type=int)
+    parser.add_argument("nb_comptes", type=int, nargs="?", default=1_000)
+    parser.add_argument("--sep", default=";")
+    parser.add_argument("--encodage", default="utf-8")
+    parser.add_argument("--balance", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ecrire_fec(args.sortie, args.nb_lignes, args.nb_comptes, args.sep, args.encodage, args.balance, args.seed)
+    print(f"{args.sortie} : {os.path.getsize(args.sortie) / 1024 ** 2:.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
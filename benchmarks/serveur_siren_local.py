@@ -0,0 +1,241 @@
+"""
+Serveur HTTP local simulant l'API SIREN, et vérification de `ClientSiren`
+contre ce serveur (sans réseau ni clé d'API).
+
+Le serveur (ThreadingHTTPServer, keep-alive) répond selon le SIREN demandé :
+- 9 chiffres se terminant par 429 / 500 / 502 / 503 / 504 : ce statut aux
+  premiers appels de ce SIREN (`ECHECS_AVANT_SUCCES`), avec l'en-tête
+  Retry-After choisi par le scénario, puis une fiche ;
+- 999999999 : 503 à chaque appel ;
+- 000000404 : réponse sans fiche entreprise ;
+- sinon : une fiche ; `--latence` simule le temps de réponse.
+
+Scénarios vérifiés : relances sur 429 / 5xx (Retry-After en secondes, en
+date HTTP, illisible, ou trop long et plafonné), abandon après les
+relances, cache (aucun appel pour un SIREN déjà lu), recherche en masse
+(dédoublonnage, appels parallèles).
+
+Usage :
+  python benchmarks/serveur_siren_local.py            # vérifications
+  python benchmarks/serveur_siren_local.py --servir 8765   # serveur seul
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from siren_client import ClientSiren, delai_retry_after  # noqa: E402
+
+ECHECS_AVANT_SUCCES = 2
+SIREN_TOUJOURS_EN_ERREUR = "999999999"
+SIREN_SANS_FICHE = "000000404"
+
+
+class ServeurSiren(ThreadingHTTPServer):
+    """Serveur de test : compte les appels par SIREN et le parallélisme observé."""
+
+    daemon_threads = True
+
+    def __init__(self, adresse, latence=0.0):
+        super().__init__(adresse, _Gestionnaire)
+        self.latence = latence
+        self.retry_after = None  # valeur de l'en-tête sur les réponses en erreur
+        self.appels = {}
+        self.en_cours = 0
+        self.max_en_cours = 0
+        self._verrou = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1/verify/siren"
+
+    def reinitialiser(self, retry_after=None):
+        with self._verrou:
+            self.retry_after = retry_after
+            self.appels.clear()
+            self.max_en_cours = 0
+
+    def entrer(self, siren):
+        with self._verrou:
+            self.appels[siren] = self.appels.get(siren, 0) + 1
+            self.en_cours += 1
+            self.max_en_cours = max(self.max_en_cours, self.en_cours)
+            return self.appels[siren]
+
+    def sortir(self):
+        with self._verrou:
+            self.en_cours -= 1
+
+
+class _Gestionnaire(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _repondre(self, statut, corps, entetes=()):
+        donnees = json.dumps(corps).encode()
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(donnees)))
+        for nom, valeur in entetes:
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(donnees)
+
+    def do_POST(self):
+        longueur = int(self.headers.get("Content-Length") or 0)
+        siren = json.loads(self.rfile.read(longueur) or b"{}").get("siren", "")
+        serveur = self.server
+        numero = serveur.entrer(siren)
+        try:
+            if serveur.latence:
+                time.sleep(serveur.latence)
+            entetes = [("Retry-After", serveur.retry_after)] if serveur.retry_after is not None else []
+            statut = int(siren[-3:]) if siren[-3:] in ("429", "500", "502", "503", "504") else 200
+            if siren == SIREN_TOUJOURS_EN_ERREUR:
+                self._repondre(503, {"message": "indisponible"}, entetes)
+            elif statut != 200 and numero <= ECHECS_AVANT_SUCCES:
+                self._repondre(statut, {"message": "erreur simulée"}, entetes)
+            elif siren == SIREN_SANS_FICHE:
+                self._repondre(200, {"message": "inconnu"})
+            else:
+                self._repondre(200, {"company": {
+                    "name": f"Entreprise {siren}",
+                    "address": "1 rue du Test",
+                    "postal_code": "75001",
+                    "city": "Paris",
+                    "representative": "Dirigeant Test",
+                }})
+        finally:
+            serveur.sortir()
+
+
+def demarrer(port=0, latence=0.0):
+    """Serveur démarré dans un thread ; l'arrêter par `shutdown()`."""
+    serveur = ServeurSiren(("127.0.0.1", port), latence)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur
+
+
+def _client(serveur, **options):
+    options = {"chemin_cache": ":memory:", "requetes_par_seconde": 0, "temporisation": 0.01, **options}
+    return ClientSiren(url=serveur.url, cle_api="test", **options)
+
+
+def verifier(latence):
+    """Exécute les scénarios ; liste des échecs (vide si tout est conforme)."""
+    echecs = []
+
+    def controle(condition, message):
+        print(f"  {'ok ' if condition else 'ÉCHEC'}  {message}")
+        if not condition:
+            echecs.append(message)
+
+    # en-tête Retry-After seul
+    dans_2s = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=2), usegmt=True)
+    controle(delai_retry_after("3", 1.0) == 3.0, "Retry-After en secondes")
+    controle(1.0 <= delai_retry_after(dans_2s, 0.5) <= 2.0, "Retry-After en date HTTP")
+    controle(delai_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 0.5) == 0.0, "date HTTP passée : pas d'attente")
+    controle(delai_retry_after("demain", 0.5) == 0.5, "Retry-After illisible : temporisation par défaut")
+    controle(delai_retry_after("86400", 0.5, plafond=5) == 5, "Retry-After plafonné")
+
+    serveur = demarrer(latence=latence)
+    try:
+        # relances sur 429 / 5xx, selon la forme de Retry-After
+        for retry_after in (None, "0", format_datetime(datetime.now(timezone.utc), usegmt=True), "n'importe quoi"):
+            serveur.reinitialiser(retry_after)
+            client = _client(serveur)
+            for siren in ("100000429", "100000500", "100000502", "100000503", "100000504"):
+                info, statut = client.rechercher(siren)
+                controle(
+                    statut == "OK" and serveur.appels[siren] == ECHECS_AVANT_SUCCES + 1,
+                    f"{siren[-3:]} puis succès (Retry-After={retry_after!r}) : {statut}, {serveur.appels[siren]} appels",
+                )
+
+        # Retry-After trop long : attente plafonnée
+        serveur.reinitialiser("3600")
+        client = _client(serveur, attente_max=0.05)
+        debut = time.perf_counter()
+        _, statut = client.rechercher("200000429")
+        duree = time.perf_counter() - debut
+        controle(statut == "OK" and duree < 1.0, f"Retry-After 3600 plafonné : {statut} en {duree:.2f} s")
+
+        # abandon après les relances
+        serveur.reinitialiser("0")
+        client = _client(serveur, relances=2)
+        info, statut = client.rechercher(SIREN_TOUJOURS_EN_ERREUR)
+        controle(
+            info is None and statut.startswith("Erreur API") and serveur.appels[SIREN_TOUJOURS_EN_ERREUR] == 3,
+            f"503 permanent : abandon après 3 appels ({statut})",
+        )
+
+        # réponses sans fiche, SIREN invalide
+        serveur.reinitialiser()
+        client = _client(serveur)
+        controle(client.rechercher(SIREN_SANS_FICHE) == (None, "Aucune donnée entreprise trouvée."), "réponse sans fiche")
+        controle(client.rechercher("12345") == (None, "Format SIREN invalide."), "SIREN invalide, sans appel")
+
+        # cache : second appel sans requête, SIRET ramené au SIREN
+        info, _ = client.rechercher("300000001")
+        info_cache, statut = client.rechercher("30000000100015")
+        controle(
+            statut == "OK" and info_cache == info and serveur.appels["300000001"] == 1,
+            "cache : une seule requête pour le SIREN et son SIRET",
+        )
+
+        # recherche en masse : dédoublonnage et parallélisme
+        serveur.reinitialiser("0")
+        client = _client(serveur)
+        sirens = [f"4{i:08d}" for i in range(40)] + ["400000429", "400000503"]
+        debut = time.perf_counter()
+        resultats = client.rechercher_masse(sirens + sirens[:10], max_workers=8)
+        duree = time.perf_counter() - debut
+        controle(
+            list(resultats) == sirens and all(statut == "OK" for _, statut in resultats.values()),
+            f"rechercher_masse : {len(resultats)} SIREN distincts, tous OK en {duree:.2f} s",
+        )
+        controle(
+            all(serveur.appels[s] == 1 for s in sirens[:40]),
+            "rechercher_masse : une requête par SIREN distinct",
+        )
+        controle(serveur.max_en_cours > 1, f"rechercher_masse : {serveur.max_en_cours} requêtes simultanées")
+        client.rechercher_masse(sirens)
+        controle(sum(serveur.appels.values()) == 40 + 2 * (ECHECS_AVANT_SUCCES + 1), "rechercher_masse : second passage servi par le cache")
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+    return echecs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur SIREN local et vérification du client.")
+    parser.add_argument("--servir", type=int, metavar="PORT", help="lancer le serveur seul sur ce port")
+    parser.add_argument("--latence", type=float, default=0.02, help="temps de réponse simulé (s)")
+    args = parser.parse_args(argv)
+
+    if args.servir is not None:
+        serveur = ServeurSiren(("127.0.0.1", args.servir), args.latence)
+        print(f"Serveur SIREN local : {serveur.url} (BIPLUS_SIREN_URL)")
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    print("Client SIREN contre le serveur local")
+    echecs = verifier(args.latence)
+    for message in echecs:
+        print(f"ÉCHEC {message}", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Cache partagé entre sessions pour les résultats du pipeline d'import
+(`pipeline_sig.traiter_annee_cache`) et les rapports de conformité.
+
+Les entrées sont indexées par l'empreinte SHA-256 du fichier importé et par
+la version du parseur / des règles SIG : deux utilisateurs qui importent le
+même FEC partagent le même résultat. Le cache a un budget mémoire, évince
+les entrées les moins récemment utilisées et compte succès / échecs.
+
+Les objets renvoyés sont partagés : ils ne doivent pas être modifiés.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from sig_utils import VERSION_PARSEUR, empreinte_fichier, lire_fichier_fec
+from validation_fec import valider_fec
+
+
+def taille_objet(obj):
+    """Estimation de l'occupation mémoire d'un résultat, en octets."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(taille_objet(k) + taille_objet(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(taille_objet(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class CacheLRU:
+    """Cache LRU thread-safe borné par un budget mémoire (octets)."""
+
+    def __init__(self, budget_octets):
+        self.budget_octets = budget_octets
+        self._entrees = OrderedDict()  # clé -> (valeur, taille)
+        self._octets = 0
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+        self.evictions = 0
+
+    def obtenir(self, cle, calcul):
+        """Renvoie la valeur en cache, ou la calcule et la conserve (sauf None)."""
+        valeur = self.consulter(cle)
+        if valeur is not None:
+            return valeur
+
+        # calcul hors verrou : les autres sessions ne sont pas bloquées
+        valeur = calcul()
+        self.deposer(cle, valeur)
+        return valeur
+
+    def consulter(self, cle):
+        """Valeur en cache (None si absente) ; compte le succès ou l'échec."""
+        with self._verrou:
+            if cle in self._entrees:
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return self._entrees[cle][0]
+            self.echecs += 1
+            return None
+
+    def deposer(self, cle, valeur):
+        """Conserve une valeur calculée ailleurs (None est ignoré)."""
+        if valeur is not None:
+            self._stocker(cle, valeur)
+
+    def _stocker(self, cle, valeur):
+        taille = taille_objet(valeur)
+        if taille > self.budget_octets:
+            return  # trop gros pour le budget : jamais conservé
+
+        with self._verrou:
+            if cle in self._entrees:
+                self._octets -= self._entrees.pop(cle)[1]
+            self._entrees[cle] = (valeur, taille)
+            self._octets += taille
+            while self._octets > self.budget_octets:
+                _, (_, taille_evincee) = self._entrees.popitem(last=False)
+                self._octets -= taille_evincee
+                self.evictions += 1
+
+    def statistiques(self):
+        with self._verrou:
+            total = self.succes + self.echecs
+            return {
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "taux_succes": self.succes / total if total else 0.0,
+                "evictions": self.evictions,
+                "entrees": len(self._entrees),
+                "octets": self._octets,
+                "budget_octets": self.budget_octets,
+            }
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._octets = 0
+
+
+# Instance unique du processus : partagée par toutes les sessions Streamlit.
+CACHE = CacheLRU(int(os.environ.get("BIPLUS_CACHE_MO", "512")) * 1024 * 1024)
+
+
+# ---------- Fonctions mises en cache ----------
+#
+# Le pipeline d'un exercice est mis en cache d'un bloc
+# (`pipeline_sig.traiter_annee_cache`) ; seule la validation, hors
+# pipeline, a son entrée propre.
+
+def valider_fec_cache(file, cloture=None, empreinte=None):
+    """
+    `valider_fec` du fichier brut en cache (None si fichier illisible).
+    `file` : fichier, ou fonction qui l'ouvre, appelée seulement si le
+    rapport n'est pas en cache. `empreinte` : clé du contenu déjà connue
+    (empreinte calculée à l'import) ; à défaut, celle du fichier.
+    """
+    if empreinte is None:
+        file = file() if callable(file) else file
+        empreinte = empreinte_fichier(file)
+
+    def valider():
+        fichier = file() if callable(file) else file
+        fichier.seek(0)
+        df = lire_fichier_fec(fichier)
+        return valider_fec(df, cloture) if df is not None else None
+
+    return CACHE.obtenir(("validation", empreinte, VERSION_PARSEUR, cloture), valider)
@@ -0,0 +1,178 @@
+"""
+Cube de cumuls par préfixe du plan comptable, pour l'exploration
+ligne SIG → classe → sous-classe → ... → compte → écritures.
+
+Construit une fois par import (`construire_cube`) à partir de 'grouped'
+trié : pour chaque niveau de préfixe (1 chiffre, 2, 3... jusqu'au compte),
+les totaux Debit / Credit / Montant et la plage contiguë des comptes du
+préfixe. Les écritures sont indexées par compte (tri unique). Toutes les
+requêtes sont des recherches dichotomiques et des tranches, sans balayage.
+
+La restriction à chaque ligne SIG (comptes retenus et contribution
+signée) est calculée avec le cube, pour toutes les lignes à la fois. Le
+cube n'est plus modifié ensuite : il peut être partagé par le cache, dont
+le budget mémoire compte sa taille au dépôt.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumente
+from sig_utils import LIGNES_SIG, centimes_vers_euros, compiler_regles_sig, indexer_prefixes
+
+FIN_PREFIXE = "\U0010ffff"
+
+
+def _cumul(valeurs):
+    """Sommes cumulées sur le dernier axe, précédées de 0."""
+    cumul = np.cumsum(valeurs, axis=-1)
+    return np.concatenate((np.zeros(cumul.shape[:-1] + (1,), dtype=cumul.dtype), cumul), axis=-1)
+
+
+def _en_centimes(serie):
+    return np.rint(serie.to_numpy(dtype="float64") * 100).astype("int64")
+
+
+def indexer_lignes(lignes, colonne="CompteNum"):
+    """
+    Index des lignes par valeur de `colonne` (tri unique) : les lignes d'une
+    valeur, ou d'un préfixe de valeurs, forment une tranche (`lignes_prefixe`).
+    """
+    comptes = lignes[colonne]
+    if isinstance(comptes.dtype, pd.CategoricalDtype) and comptes.cat.categories.is_monotonic_increasing:
+        codes, cles = comptes.cat.codes.to_numpy(), comptes.cat.categories.astype(str)
+    else:
+        codes, cles = pd.factorize(comptes.astype(str), sort=True)
+    ordre = np.argsort(codes, kind="stable")
+    return {
+        "lignes": lignes,
+        "ordre": ordre,
+        "codes": codes[ordre],
+        "cles": np.asarray(cles, dtype=object),
+    }
+
+
+@instrumente("cube")
+def construire_cube(grouped, regles=None, lignes=None):
+    """
+    Cube du 'grouped' d'un exercice. `regles` : `compiler_regles_sig(grouped)`
+    si déjà compilées ; `lignes` : écritures (forme compacte ou brute) pour
+    descendre jusqu'aux écritures. None si grouped est None.
+    """
+    if grouped is None:
+        return None
+    if regles is None:
+        regles = compiler_regles_sig(grouped)
+
+    index = indexer_prefixes(grouped)
+    ordre = index["ordre"]
+    numeros = index["comptes"]
+    comptes = grouped.iloc[ordre].reset_index(drop=True)
+
+    debit, credit, montant = (_en_centimes(comptes[c]) for c in ("Debit", "Credit", "Montant"))
+    cumuls = {"Debit": _cumul(debit), "Credit": _cumul(credit), "Montant": _cumul(montant)}
+
+    # restriction aux lignes SIG : une rangée par ligne de LIGNES_SIG
+    coefficients = regles["coefficients"][:, ordre]
+    retenus = coefficients != 0
+    lignes_sig = {
+        "retenus": retenus,
+        "NbComptes": _cumul(retenus),
+        "Debit": _cumul(debit * retenus),
+        "Credit": _cumul(credit * retenus),
+        "Montant": _cumul(montant * retenus),
+        "Contribution": _cumul(montant * coefficients),
+    }
+
+    longueurs = comptes["CompteNum"].str.len().to_numpy()
+    niveaux = {}
+    for niveau in range(1, int(longueurs.max(initial=0)) + 1):
+        prefixes = np.unique(comptes["CompteNum"][longueurs >= niveau].str[:niveau].to_numpy(dtype=object))
+        debut = np.searchsorted(numeros, prefixes, side="left")
+        fin = np.searchsorted(numeros, prefixes + FIN_PREFIXE, side="left")
+        niveaux[niveau] = pd.DataFrame(
+            {
+                "NbComptes": fin - debut,
+                **{c: centimes_vers_euros(cumul[fin] - cumul[debut]) for c, cumul in cumuls.items()},
+                "Debut": debut,
+                "Fin": fin,
+            },
+            index=pd.Index(prefixes, name="Prefixe"),
+        )
+
+    return {
+        "comptes": comptes,
+        "numeros": numeros,
+        "niveaux": niveaux,
+        "profondeur": len(niveaux),
+        "centimes": {"Debit": debit, "Credit": credit, "Montant": montant},
+        "coefficients": coefficients,
+        "lignes_sig": lignes_sig,
+        "ecritures": indexer_lignes(lignes) if lignes is not None and "CompteNum" in lignes else None,
+    }
+
+
+def _restriction_ligne(cube, ligne):
+    """Cumuls des comptes retenus par une ligne SIG (rangée de la ligne dans le cube)."""
+    rang = list(LIGNES_SIG).index(ligne)
+    return {c: cumul[rang] for c, cumul in cube["lignes_sig"].items()}
+
+
+def _plage(valeurs, prefixe):
+    return (
+        int(np.searchsorted(valeurs, prefixe, side="left")),
+        int(np.searchsorted(valeurs, prefixe + FIN_PREFIXE, side="left")),
+    )
+
+
+def noeuds(cube, niveau, parent="", ligne=None):
+    """
+    Préfixes de longueur `niveau` commençant par `parent`, avec NbComptes,
+    Debit, Credit, Montant. Avec `ligne` (ligne SIG) : seuls les comptes
+    retenus par la ligne sont cumulés, et Contribution donne le montant
+    signé apporté à la ligne.
+    """
+    table = cube["niveaux"].get(niveau)
+    if table is None:
+        return pd.DataFrame(columns=["NbComptes", "Debit", "Credit", "Montant"])
+    debut, fin = _plage(table.index.to_numpy(), parent)
+    table = table.iloc[debut:fin]
+
+    if ligne is not None:
+        restriction = _restriction_ligne(cube, ligne)
+        d, f = table["Debut"].to_numpy(), table["Fin"].to_numpy()
+        table = table.assign(
+            NbComptes=restriction["NbComptes"][f] - restriction["NbComptes"][d],
+            **{c: centimes_vers_euros(restriction[c][f] - restriction[c][d])
+               for c in ("Debit", "Credit", "Montant", "Contribution")},
+        )
+        table = table[table["NbComptes"] > 0]
+    return table.drop(columns=["Debut", "Fin"])
+
+
+def comptes_noeud(cube, prefixe, ligne=None):
+    """Comptes de 'grouped' commençant par `prefixe` (retenus par `ligne` si donnée)."""
+    debut, fin = _plage(cube["numeros"], prefixe)
+    comptes = cube["comptes"].iloc[debut:fin]
+    if ligne is not None:
+        comptes = comptes[_restriction_ligne(cube, ligne)["retenus"][debut:fin]]
+    return comptes
+
+
+def ecritures_noeud(cube, prefixe, exact=False):
+    """
+    Écritures des comptes commençant par `prefixe` (du seul compte
+    `prefixe` si `exact`). None si le cube a été construit sans écritures.
+    """
+    index = cube["ecritures"]
+    if index is None:
+        return None
+    return lignes_prefixe(index, prefixe, exact)
+
+
+def lignes_prefixe(index, prefixe, exact=False):
+    """Lignes de `indexer_lignes` dont la valeur commence par `prefixe` (vaut `prefixe` si `exact`)."""
+    cles = index["cles"]
+    debut = np.searchsorted(cles, prefixe, side="left")
+    fin = np.searchsorted(cles, prefixe, side="right") if exact else np.searchsorted(cles, prefixe + FIN_PREFIXE)
+    a, b = np.searchsorted(index["codes"], [debut, fin], side="left")
+    return index["lignes"].iloc[index["ordre"][a:b]]
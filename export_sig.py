@@ -0,0 +1,159 @@
+"""
+Export du rapport SIG d'un dossier : classeur Excel (tableau SIG des
+exercices, une feuille de détail par ligne SIG, contrôle de cohérence) ou
+CSV des détails par compte.
+
+Le classeur est écrit par openpyxl en mode write_only : chaque ligne est
+sérialisée dès son ajout (fichier temporaire par feuille), sans modèle du
+classeur en mémoire ; la mémoire reste constante quel que soit le nombre
+de comptes. Le CSV est écrit ligne SIG par ligne SIG.
+"""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumente
+from sig_utils import CLASSES_COHERENCE, LIGNES_SIG, calcul_sig_annees, comparer_annees, compiler_regles_sig, filtre_detail
+
+FORMAT_MONTANT = "#,##0.00"
+FORMAT_POURCENT = '0.0" %"'
+COLONNES_DETAIL = ["CompteNum", "CompteLib", "Debit", "Credit", "Montant"]
+
+_NOM_FEUILLE_INTERDIT = re.compile(r"[\[\]:*?/\\]")
+
+
+def _nom_feuille(nom, pris):
+    """Nom de feuille Excel valide (31 caractères, sans []:*?/\\) et unique dans `pris`."""
+    base = _NOM_FEUILLE_INTERDIT.sub(" ", nom).strip()[:31]
+    candidat, n = base, 1
+    while candidat.lower() in pris:
+        n += 1
+        suffixe = f" ({n})"
+        candidat = base[:31 - len(suffixe)] + suffixe
+    pris.add(candidat.lower())
+    return candidat
+
+
+def _valeur(valeur):
+    """Valeur de cellule : NaN -> vide, scalaires numpy -> Python."""
+    if isinstance(valeur, np.generic):
+        valeur = valeur.item()
+    if isinstance(valeur, float) and math.isnan(valeur):
+        return None
+    return valeur
+
+
+class _Feuille:
+    """Feuille write_only : en-tête en gras, cellules numériques au format donné par colonne."""
+
+    def __init__(self, classeur, nom, colonnes, formats=(), titre=None):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+
+        self._cellule = WriteOnlyCell
+        self._feuille = classeur.create_sheet(nom)
+        self._formats = [dict(formats).get(c) for c in colonnes]
+        gras = Font(bold=True)
+        if titre:
+            cellule = WriteOnlyCell(self._feuille, value=titre)
+            cellule.font = gras
+            self._feuille.append([cellule, None])
+        entete = []
+        for colonne in colonnes:
+            cellule = WriteOnlyCell(self._feuille, value=colonne)
+            cellule.font = gras
+            entete.append(cellule)
+        self._feuille.append(entete)
+
+    def ajouter(self, valeurs):
+        ligne = []
+        for valeur, format_ in zip(valeurs, self._formats):
+            valeur = _valeur(valeur)
+            if format_ and isinstance(valeur, (int, float)):
+                cellule = self._cellule(self._feuille, value=valeur)
+                cellule.number_format = format_
+                ligne.append(cellule)
+            else:
+                ligne.append(valeur)
+        self._feuille.append(ligne)
+
+    def ajouter_colonnes(self, colonnes):
+        """Ajoute des lignes depuis des colonnes (Series / tableaux de même longueur)."""
+        for valeurs in zip(*(np.asarray(c, dtype=object) for c in colonnes)):
+            self.ajouter(valeurs)
+
+
+def _regles(exercice):
+    regles = exercice.get("regles")
+    return regles if regles is not None else compiler_regles_sig(exercice["grouped"])
+
+
+def _exercices_valides(exercices):
+    return {annee: e for annee, e in exercices.items() if e is not None and e.get("grouped") is not None}
+
+
+@instrumente("export")
+def ecrire_classeur(destination, exercices, titre=None):
+    """
+    Classeur du rapport SIG dans `destination` (chemin ou fichier binaire).
+    `exercices` : {libellé: dict avec grouped, et regles / coherence si
+    disponibles (résultat de `traiter_annee`)}, du plus récent au plus
+    ancien. Feuilles :
+    - SIG : montants par exercice, écarts et variations (`comparer_annees`)
+    - une feuille par ligne SIG : comptes retenus (`filtre_detail`) par exercice
+    - Cohérence : écart 6-7 vs 1-5 et solde par classe, par exercice
+    """
+    from openpyxl import Workbook
+
+    exercices = _exercices_valides(exercices)
+    classeur = Workbook(write_only=True)
+    pris = set()
+
+    if exercices:
+        tableau = comparer_annees(calcul_sig_annees({a: e["grouped"] for a, e in exercices.items()}))
+        colonnes = ["Poste"] + list(tableau.columns)
+        formats = {c: FORMAT_POURCENT if c.startswith("%") else FORMAT_MONTANT for c in tableau.columns}
+        feuille = _Feuille(classeur, _nom_feuille("SIG", pris), colonnes, formats, titre)
+        feuille.ajouter_colonnes([tableau.index] + [tableau[c] for c in tableau.columns])
+
+        regles = {annee: _regles(e) for annee, e in exercices.items()}
+        formats = {c: FORMAT_MONTANT for c in ("Debit", "Credit", "Montant")}
+        for poste in LIGNES_SIG:
+            feuille = _Feuille(classeur, _nom_feuille(poste, pris), ["Exercice"] + COLONNES_DETAIL, formats)
+            for annee, exercice in exercices.items():
+                detail = filtre_detail(exercice["grouped"], poste, regles[annee])
+                feuille.ajouter_colonnes([np.full(len(detail), annee, dtype=object)] + [detail[c] for c in COLONNES_DETAIL])
+
+    coherences = {annee: e.get("coherence") for annee, e in exercices.items() if e.get("coherence") is not None}
+    if coherences:
+        classes = [f"Classe {c}" for c in CLASSES_COHERENCE]
+        colonnes = ["Exercice", "Ecart 6-7 vs 1-5"] + classes + ["Comptes hors classes"]
+        feuille = _Feuille(classeur, _nom_feuille("Cohérence", pris), colonnes, {c: FORMAT_MONTANT for c in colonnes[1:-1]})
+        for annee, coherence in coherences.items():
+            feuille.ajouter([annee, coherence["ecart"], *coherence["par_classe"].to_numpy(), len(coherence["hors_classes"])])
+
+    if not pris:  # un classeur doit avoir au moins une feuille
+        classeur.create_sheet("SIG")
+    classeur.save(destination)
+
+
+@instrumente("export")
+def ecrire_details_csv(destination, exercices):
+    """
+    Détail des comptes de chaque ligne SIG, par exercice, en un seul CSV
+    (séparateur ";", décimale ",") : Poste, Exercice, CompteNum, CompteLib,
+    Debit, Credit, Montant. `destination` : chemin ou fichier texte.
+    """
+    exercices = _exercices_valides(exercices)
+    regles = {annee: _regles(e) for annee, e in exercices.items()}
+    entete = True
+    for poste in LIGNES_SIG:
+        for annee, exercice in exercices.items():
+            detail = filtre_detail(exercice["grouped"], poste, regles[annee])
+            if detail.empty and not entete:
+                continue
+            bloc = pd.DataFrame({"Poste": poste, "Exercice": annee, **{c: detail[c] for c in COLONNES_DETAIL}})
+            bloc.to_csv(destination, sep=";", decimal=",", index=False, header=entete, mode="w" if entete else "a")
+            entete = False
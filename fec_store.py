@@ -0,0 +1,149 @@
+"""
+Stockage disque des grands livres normalisés (forme compacte de
+`compacter_fec`) au format Arrow IPC.
+
+Chaque fichier importé est enregistré une fois, retrouvé par l'empreinte
+de son contenu (SIREN et exercice figurent dans le nom, pour l'inspection
+du répertoire). Le stockage ne contient que les colonnes de la forme
+compacte, toutes utiles au pipeline : les relectures passent par un
+memory-map sans copie des colonnes numériques. La taille totale du
+stockage est plafonnée : les entrées les moins récemment utilisées sont
+supprimées en premier.
+"""
+import os
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+
+from instrumentation import instrumente
+from sig_utils import (
+    VERSION_PARSEUR,
+    ErreurLectureFEC,
+    _erreur_lecture,
+    compacter_fec,
+    empreinte_fichier,
+    lire_fichier_fec,
+    lire_fichier_fec_projete,
+    memoire_df,
+)
+
+REPERTOIRE = Path(os.environ.get("BIPLUS_STORE_DIR", Path.home() / ".cache" / "biplus" / "fec"))
+TAILLE_MAX_OCTETS = int(os.environ.get("BIPLUS_STORE_MO", "2048")) * 1024 * 1024
+
+_verrou = threading.Lock()
+
+
+def _nettoyer(valeur):
+    """Partie de nom de fichier sûre (SIREN, exercice)."""
+    valeur = "".join(c for c in str(valeur or "") if c.isalnum() or c == "-")
+    return valeur or "_"
+
+
+def _chemin(empreinte, siren="", annee="", repertoire=None):
+    repertoire = Path(repertoire or REPERTOIRE)
+    nom = f"{_nettoyer(siren)}__{_nettoyer(annee)}__{empreinte}__v{VERSION_PARSEUR}.arrow"
+    return repertoire / nom
+
+
+def _trouver(empreinte, repertoire=None):
+    """Entrée la plus récente pour l'empreinte (quel que soit le SIREN / exercice du nom)."""
+    repertoire = Path(repertoire or REPERTOIRE)
+    if not repertoire.is_dir():
+        return None
+
+    motif = f"*__*__{empreinte}__v{VERSION_PARSEUR}.arrow"
+    candidats = sorted(repertoire.glob(motif), key=lambda p: p.stat().st_mtime, reverse=True)
+    return candidats[0] if candidats else None
+
+
+def enregistrer(df, empreinte, siren="", annee="", repertoire=None, taille_max=None):
+    """Enregistre un grand livre compact (écriture atomique), puis applique le plafond."""
+    chemin = _chemin(empreinte, siren, annee, repertoire)
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    temporaire = chemin.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(temporaire), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporaire, chemin)
+
+    evincer(repertoire, taille_max)
+    return chemin
+
+
+@instrumente("lecture_stockage")
+def charger(empreinte, repertoire=None):
+    """Relit le grand livre compact d'empreinte `empreinte`. None si absent."""
+    chemin = _trouver(empreinte, repertoire)
+    if chemin is None:
+        return None
+
+    source = pa.memory_map(str(chemin), "r")
+    table = pa.ipc.open_file(source).read_all()
+
+    os.utime(chemin)  # entrée récemment utilisée
+    return table.to_pandas(split_blocks=True)
+
+
+def evincer(repertoire=None, taille_max=None):
+    """Supprime les entrées les moins récemment utilisées au-delà du plafond."""
+    repertoire = Path(repertoire or REPERTOIRE)
+    taille_max = TAILLE_MAX_OCTETS if taille_max is None else taille_max
+
+    with _verrou:
+        entrees = sorted(repertoire.glob("*.arrow"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entrees)
+        for chemin in entrees:
+            if total <= taille_max:
+                break
+            total -= chemin.stat().st_size
+            chemin.unlink(missing_ok=True)
+
+
+def lire_fichier_fec_stocke(file, siren="", annee="", conserver=(), repertoire=None, empreinte=None):
+    """
+    Lecture d'un FEC / balance en forme compacte, adossée au stockage disque.
+
+    Sans colonne supplémentaire, le fichier est lu en projection
+    (`lire_fichier_fec_projete`) puis enregistré ; il n'est relu en entier
+    que si son format n'est pas reconnu. Retourne un dict
+    (None si fichier illisible) :
+    - df : forme compacte (ou DataFrame brut si format non reconnu)
+    - octets_brut / octets_compact : mémoire avant / après compactage
+      (octets_brut vaut None quand le DataFrame brut n'a pas été chargé)
+    - source : "stockage" ou "fichier"
+    """
+    empreinte = empreinte or empreinte_fichier(file)
+
+    if conserver == ():
+        df = charger(empreinte, repertoire)
+        if df is not None:
+            return {"df": df, "octets_brut": None, "octets_compact": memoire_df(df), "source": "stockage"}
+        try:
+            df = lire_fichier_fec_projete(file, strict=True)
+        except ErreurLectureFEC as e:
+            # fichier illisible : signalé une fois, sans seconde lecture
+            _erreur_lecture(str(e), False, e)
+            return None
+        if df is not None:
+            enregistrer(df, empreinte, siren, annee, repertoire)
+            return {"df": df, "octets_brut": None, "octets_compact": memoire_df(df), "source": "fichier"}
+        # format non reconnu (balance sans débit / crédit…) : lecture complète, DataFrame brut
+        file.seek(0)
+
+    brut = lire_fichier_fec(file)
+    if brut is None:
+        return None
+
+    compact = compacter_fec(brut, conserver)
+    if compact is None:
+        return {"df": brut, "octets_brut": memoire_df(brut), "octets_compact": None, "source": "fichier"}
+
+    return {
+        "df": compact,
+        "octets_brut": memoire_df(brut),
+        "octets_compact": memoire_df(compact),
+        "source": "fichier",
+    }
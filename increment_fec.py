@@ -0,0 +1,379 @@
+"""
+Mises à jour incrémentales d'un exercice pendant la clôture.
+
+Un état incrémental (`initialiser`) conserve, pour un grand livre :
+- les totaux en centimes et le nombre de lignes par (CompteNum, CompteLib),
+  et les soldes par compte du contrôle de cohérence ;
+- les lignes compactes, en segments triés sur la clé d'écriture
+  (JournalCode, EcritureNum, EcritureDate), avec l'empreinte de chaque
+  ligne brute ;
+- grouped, regles, sig et coherence, comme `pipeline_sig.traiter_annee`,
+  et le SIG mensuel en centimes (`calcul_sig_mensuel`).
+
+Une mise à jour ne convertit, ne regroupe et n'agrège que les écritures
+nouvelles, modifiées ou supprimées :
+- `appliquer_delta` : fichier d'écritures nouvelles ou corrigées (une
+  écriture déjà connue est remplacée par celle du delta) ;
+- `mettre_a_jour` : FEC complet plus récent ; les écritures modifiées sont
+  détectées par clé et empreinte, sans convertir les autres.
+Le SIG étant linéaire en montants par compte, il est corrigé par le SIG du
+delta : seules les lignes SIG touchées changent.
+
+Les états ne sont jamais modifiés : chaque mise à jour renvoie un nouvel état.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumente
+from sig_utils import (
+    LIGNES_SIG,
+    _extraire_montants,
+    _finaliser_grouped,
+    _identifier_colonne_date,
+    _identifier_colonnes,
+    _resultat_coherence,
+    calcul_sig_mensuel,
+    centimes_vers_euros,
+    compacter_fec,
+    compiler_regles_sig,
+)
+
+MAX_SEGMENTS = 8
+
+
+# ---------- Clés et empreintes d'écritures ----------
+
+def _colonnes_cle(colonnes):
+    """(JournalCode?, EcritureNum, EcritureDate) d'un FEC ; None sans numéro ou date."""
+    par_nom = {str(c).lower().strip().replace(" ", ""): c for c in colonnes}
+    col_num = par_nom.get("ecriturenum")
+    col_date = _identifier_colonne_date(colonnes)
+    if col_num is None or col_date is None:
+        return None
+    col_journal = par_nom.get("journalcode")
+    return tuple(c for c in (col_journal, col_num, col_date) if c is not None)
+
+
+def _hacher(brut, colonnes):
+    """Empreinte uint64 de chaque ligne sur `colonnes` (texte brut), une colonne à la fois."""
+    empreinte = np.full(len(brut), 0x345678, dtype="uint64")
+    for c in colonnes:
+        colonne = pd.util.hash_pandas_object(brut[c].fillna(""), index=False).to_numpy()
+        empreinte = (empreinte * np.uint64(1_000_003)) ^ colonne
+    return empreinte
+
+
+def _empreintes(brut):
+    """(clés, empreintes de lignes) d'un FEC brut ; None si format non reconnu."""
+    colonnes_cle = _colonnes_cle(brut.columns)
+    colonnes = _identifier_colonnes(brut.columns)
+    if colonnes_cle is None or colonnes[0] is None:
+        return None
+    cles = _hacher(brut, colonnes_cle)
+    # empreinte de ligne = clé + compte, libellé, débit, crédit
+    empreintes = (cles * np.uint64(1_000_003)) ^ _hacher(brut, [c for c in colonnes if c is not None])
+    return cles, empreintes
+
+
+def _signatures(cles, empreintes):
+    """Signature de chaque écriture (somme des empreintes de ses lignes, modulo 2**64)."""
+    return pd.Series(empreintes).groupby(cles).sum()
+
+
+# ---------- Agrégats ----------
+
+def _agreger(compact, signe=1):
+    """
+    Agrégats en centimes de lignes compactes, multipliés par `signe` :
+    - sommes : (CompteNum, CompteLib) -> DebitCts, CreditCts, NbLignes (classes 1 à 7)
+    - soldes : compte nettoyé -> Solde, NbLignes (contrôle de cohérence)
+    """
+    tmp = _extraire_montants(compact)
+    comptes = tmp["CompteNum"].astype(str)
+    tmp = pd.DataFrame({
+        "CompteNum": comptes,
+        "CompteLib": tmp["CompteLib"].astype(str),
+        "DebitCts": tmp["DebitCts"],
+        "CreditCts": tmp["CreditCts"],
+        "NbLignes": np.ones(len(tmp), dtype="int64"),
+    })
+
+    classes = tmp[comptes.str.match(r"^[1-7]", na=False).astype(bool)]
+    sommes = classes.groupby(["CompteNum", "CompteLib"])[["DebitCts", "CreditCts", "NbLignes"]].sum()
+
+    nettoyes = comptes.str.strip().to_numpy()
+    soldes = pd.DataFrame({
+        "Solde": (tmp["DebitCts"] - tmp["CreditCts"]).to_numpy(),
+        "NbLignes": tmp["NbLignes"].to_numpy(),
+    }).groupby(nettoyes).sum()
+    soldes = soldes[soldes.index != ""]
+
+    return sommes * signe, soldes * signe
+
+
+def _fusionner(total, delta):
+    """total + delta (index alignés) ; les entrées sans plus aucune ligne disparaissent."""
+    fusion = total.add(delta, fill_value=0).astype("int64")
+    return fusion[fusion["NbLignes"] != 0]
+
+
+def _grouped(sommes):
+    return _finaliser_grouped(sommes.drop(columns="NbLignes").reset_index())
+
+
+def _mensuel(lignes, fenetre):
+    return calcul_sig_mensuel(pd.concat(lignes, ignore_index=True), fenetre) if lignes else None
+
+
+def _fusionner_mensuel(mensuel, retirees, ajoutees):
+    """
+    SIG mensuel après retrait des lignes `retirees` et ajout des lignes
+    `ajoutees` (listes de lignes compactes), sur les mois de l'exercice de
+    `mensuel` : une date aberrante du delta n'étend pas l'axe des mois.
+    """
+    fenetre = mensuel.attrs["fenetre"] if mensuel is not None else None
+    plus = _mensuel(ajoutees, fenetre)
+    if fenetre is None and plus is not None:
+        fenetre = plus.attrs["fenetre"]
+    moins = _mensuel(retirees, fenetre)
+
+    fusion = mensuel
+    for delta, signe in ((plus, 1), (moins, -1)):
+        if delta is not None:
+            fusion = delta * signe if fusion is None else fusion.add(delta * signe, fill_value=0)
+    if fusion is None:
+        return None
+    fusion = fusion.astype("int64")
+    if len(fusion):
+        fusion = fusion.reindex(pd.period_range(fusion.index.min(), fusion.index.max(), freq="M"), fill_value=0)
+    fusion.attrs = {
+        "fenetre": fenetre,
+        "hors_exercice": sum(
+            signe * d.attrs["hors_exercice"] for d, signe in ((mensuel, 1), (plus, 1), (moins, -1)) if d is not None
+        ),
+    }
+    return fusion
+
+
+# ---------- Segments de lignes ----------
+
+def _segment(compact, cles, empreintes):
+    """Lignes compactes triées par clé d'écriture, toutes actives."""
+    ordre = np.argsort(cles, kind="stable")
+    return {
+        "lignes": compact.iloc[ordre].reset_index(drop=True),
+        "cles": cles[ordre],
+        "empreintes": empreintes[ordre],
+        "actives": np.ones(len(ordre), dtype=bool),
+    }
+
+
+def _positions(segment, cles):
+    """Positions actives du segment dont la clé est dans `cles` (tableau trié unique)."""
+    debut = np.searchsorted(segment["cles"], cles, side="left")
+    fin = np.searchsorted(segment["cles"], cles, side="right")
+    longueurs = fin - debut
+    if not longueurs.any():
+        return np.empty(0, dtype="int64")
+    # concaténation vectorisée des plages [debut, fin)
+    decalages = np.repeat(debut - np.cumsum(longueurs) + longueurs, longueurs)
+    positions = decalages + np.arange(longueurs.sum())
+    return positions[segment["actives"][positions]]
+
+
+def _retirer(segments, cles):
+    """(segments sans les lignes des écritures `cles`, lignes compactes retirées)."""
+    nouveaux, retirees = [], []
+    for segment in segments:
+        positions = _positions(segment, cles)
+        if len(positions):
+            actives = segment["actives"].copy()
+            actives[positions] = False
+            segment = dict(segment, actives=actives)
+            retirees.append(segment["lignes"].iloc[positions])
+        nouveaux.append(segment)
+    return nouveaux, retirees
+
+
+def _compacter_segments(segments):
+    """Fusionne les segments quand ils sont trop nombreux ou trop creux."""
+    total = sum(len(s["actives"]) for s in segments)
+    actives = sum(int(s["actives"].sum()) for s in segments)
+    if len(segments) <= MAX_SEGMENTS and actives * 2 >= total:
+        return segments
+    return [_segment(
+        lignes_actives({"segments": segments}),
+        np.concatenate([s["cles"][s["actives"]] for s in segments]),
+        np.concatenate([s["empreintes"][s["actives"]] for s in segments]),
+    )]
+
+
+def lignes_actives(etat):
+    """Lignes compactes courantes de l'état (CompteNum / CompteLib en catégories)."""
+    morceaux = [s["lignes"][s["actives"]] for s in etat["segments"]]
+    lignes = pd.concat(morceaux, ignore_index=True) if len(morceaux) > 1 else morceaux[0].reset_index(drop=True)
+    for c in ("CompteNum", "CompteLib"):
+        lignes[c] = lignes[c].astype(str).astype("category")
+    return lignes
+
+
+# ---------- État et mises à jour ----------
+
+@instrumente("increment_initialisation")
+def initialiser(brut):
+    """
+    État incrémental d'un FEC brut (`lire_fichier_fec`). None si le format
+    n'est pas reconnu ou sans EcritureNum / EcritureDate.
+    """
+    empreintes = _empreintes(brut)
+    compact = compacter_fec(brut) if empreintes is not None else None
+    if compact is None:
+        return None
+
+    sommes, soldes = _agreger(compact)
+    grouped = _grouped(sommes)
+    regles = compiler_regles_sig(grouped)
+    sig_cts = regles["coefficients"] @ regles["montants"]
+
+    return {
+        "segments": [_segment(compact, *empreintes)],
+        "sommes": sommes,
+        "soldes": soldes,
+        "grouped": grouped,
+        "regles": regles,
+        "sig_cts": sig_cts,
+        "sig": {ligne: centimes_vers_euros(int(t)) for ligne, t in zip(LIGNES_SIG, sig_cts)},
+        "coherence": _resultat_coherence(soldes["Solde"]),
+        "sig_mensuel": calcul_sig_mensuel(compact),
+        "nb_lignes": len(compact),
+        "maj": None,
+    }
+
+
+def _appliquer(etat, cles_touchees, ajout, rapport):
+    """
+    Remplace les lignes des écritures `cles_touchees` (tableau trié unique)
+    par `ajout` = (lignes compactes, clés, empreintes) ou None.
+    """
+    segments, retirees = _retirer(etat["segments"], cles_touchees)
+
+    deltas = [_agreger(lignes, -1) for lignes in retirees]
+    if ajout is not None and len(ajout[0]):
+        deltas.append(_agreger(ajout[0]))
+        segments = segments + [_segment(*ajout)]
+    segments = _compacter_segments(segments)
+
+    if deltas:
+        delta_sommes = pd.concat([d[0] for d in deltas]).groupby(level=[0, 1]).sum()
+        delta_soldes = pd.concat([d[1] for d in deltas]).groupby(level=0).sum()
+    else:
+        delta_sommes, delta_soldes = etat["sommes"].iloc[:0], etat["soldes"].iloc[:0]
+
+    sommes = _fusionner(etat["sommes"], delta_sommes)
+    soldes = _fusionner(etat["soldes"], delta_soldes)
+    grouped = _grouped(sommes)
+
+    # mêmes comptes, dans le même ordre : les règles compilées restent valables
+    if sommes.index.equals(etat["sommes"].index):
+        regles = dict(etat["regles"], montants=np.rint(grouped["Montant"].to_numpy() * 100).astype("int64"))
+    else:
+        regles = compiler_regles_sig(grouped)
+
+    # SIG linéaire : SIG(N + delta) = SIG(N) + SIG(delta)
+    delta_sig = np.zeros(len(LIGNES_SIG), dtype="int64")
+    delta_net = delta_sommes[delta_sommes[["DebitCts", "CreditCts"]].any(axis=1)]
+    if len(delta_net):
+        regles_delta = compiler_regles_sig(_grouped(delta_net))
+        delta_sig = regles_delta["coefficients"] @ regles_delta["montants"]
+    sig_cts = etat["sig_cts"] + delta_sig
+
+    # SIG mensuel : moins les lignes retirées, plus les lignes ajoutées
+    ajoutees = [ajout[0]] if ajout is not None and len(ajout[0]) else []
+
+    rapport.update(
+        lignes_retirees=int(sum(len(r) for r in retirees)),
+        lignes_ajoutees=len(ajout[0]) if ajout is not None else 0,
+        comptes_modifies=sorted(delta_net.index.get_level_values(0).unique()),
+        lignes_sig_modifiees=[ligne for ligne, d in zip(LIGNES_SIG, delta_sig) if d],
+    )
+
+    return {
+        "segments": segments,
+        "sommes": sommes,
+        "soldes": soldes,
+        "grouped": grouped,
+        "regles": regles,
+        "sig_cts": sig_cts,
+        "sig": {ligne: centimes_vers_euros(int(t)) for ligne, t in zip(LIGNES_SIG, sig_cts)},
+        "coherence": _resultat_coherence(soldes["Solde"]),
+        "sig_mensuel": _fusionner_mensuel(etat["sig_mensuel"], retirees, ajoutees),
+        "nb_lignes": sum(int(s["actives"].sum()) for s in segments),
+        "maj": rapport,
+    }
+
+
+def _cles_connues(etat, cles):
+    """Masque des `cles` qui ont encore des lignes actives dans l'état."""
+    trouvees = [s["cles"][_positions(s, cles)] for s in etat["segments"]]
+    return np.isin(cles, np.concatenate(trouvees))
+
+
+@instrumente("increment_delta")
+def appliquer_delta(etat, brut_delta):
+    """
+    Applique un fichier d'écritures nouvelles ou corrigées (FEC brut).
+    Toute écriture du delta déjà présente (même clé) est remplacée.
+    Retourne le nouvel état (rapport dans etat["maj"]), None si non reconnu.
+    """
+    empreintes = _empreintes(brut_delta)
+    compact = compacter_fec(brut_delta) if empreintes is not None else None
+    if compact is None:
+        return None
+
+    cles = np.unique(empreintes[0])
+    connues = _cles_connues(etat, cles)
+    rapport = {
+        "ecritures_ajoutees": int((~connues).sum()),
+        "ecritures_modifiees": int(connues.sum()),
+        "ecritures_supprimees": 0,
+    }
+    return _appliquer(etat, cles, (compact, *empreintes), rapport)
+
+
+@instrumente("increment_fec_complet")
+def mettre_a_jour(etat, brut_nouveau):
+    """
+    Met à jour l'état avec une version plus récente du FEC complet (brut).
+    Seules les écritures nouvelles, modifiées ou supprimées sont converties
+    et agrégées. Retourne le nouvel état, None si non reconnu.
+    """
+    empreintes = _empreintes(brut_nouveau)
+    if empreintes is None or _identifier_colonnes(brut_nouveau.columns)[0] is None:
+        return None
+    cles, empreintes_lignes = empreintes
+
+    nouvelles = _signatures(cles, empreintes_lignes)
+    anciennes = _signatures(
+        np.concatenate([s["cles"][s["actives"]] for s in etat["segments"]]),
+        np.concatenate([s["empreintes"][s["actives"]] for s in etat["segments"]]),
+    )
+
+    communes = nouvelles.index.intersection(anciennes.index)
+    modifiees = communes[nouvelles[communes].to_numpy() != anciennes[communes].to_numpy()]
+    ajoutees = nouvelles.index.difference(anciennes.index)
+    supprimees = anciennes.index.difference(nouvelles.index)
+
+    a_convertir = np.union1d(modifiees, ajoutees).astype("uint64")
+    masque = np.isin(cles, a_convertir)
+    ajout = None
+    if masque.any():
+        compact = compacter_fec(brut_nouveau[masque])
+        ajout = (compact, cles[masque], empreintes_lignes[masque])
+
+    rapport = {
+        "ecritures_ajoutees": len(ajoutees),
+        "ecritures_modifiees": len(modifiees),
+        "ecritures_supprimees": len(supprimees),
+    }
+    touchees = np.union1d(a_convertir, supprimees.to_numpy()).astype("uint64")
+    return _appliquer(etat, touchees, ajout, rapport)
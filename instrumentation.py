@@ -0,0 +1,154 @@
+"""
+Mesures par étape du pipeline (lecture, normalisation, montants,
+regroupement, SIG, détail, cohérence, rendu) : durée, lignes traitées et
+variation de la mémoire résidente du processus.
+
+Chaque mesure est :
+- journalisée en JSON (logger "biplus.mesures", niveau INFO) ;
+- ajoutée au fichier JSONL désigné par BIPLUS_METRIQUES, s'il est défini,
+  pour agréger les mesures de toutes les sessions ;
+- ajoutée à la liste de collecte active (`activer_collecte`), que l'app
+  affiche dans le panneau de diagnostic.
+
+La collecte suit le contexte d'exécution (contextvars) : les étapes
+lancées dans un pool de threads via `contextvars.copy_context().run`
+restent rattachées à la session qui les a lancées.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger("biplus.mesures")
+
+FICHIER_METRIQUES = os.environ.get("BIPLUS_METRIQUES", "")
+MAX_MESURES = 1000  # par liste de collecte
+
+_collecte = contextvars.ContextVar("biplus_collecte", default=None)
+_verrou_fichier = threading.Lock()
+
+try:
+    _TAILLE_PAGE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _TAILLE_PAGE = 4096
+
+
+def memoire_residente():
+    """Mémoire résidente du processus en octets (None hors Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _TAILLE_PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def activer_collecte(mesures, session=""):
+    """
+    Les mesures suivantes du contexte courant sont ajoutées à `mesures`
+    (liste). Retourne le jeton de `desactiver_collecte`.
+    """
+    return _collecte.set((mesures, session))
+
+
+def desactiver_collecte(jeton):
+    _collecte.reset(jeton)
+
+
+@contextmanager
+def collecter(session=""):
+    """Contexte qui collecte les mesures de son bloc dans la liste renvoyée."""
+    mesures = []
+    jeton = activer_collecte(mesures, session)
+    try:
+        yield mesures
+    finally:
+        desactiver_collecte(jeton)
+
+
+def _enregistrer(mesure):
+    logger.info(json.dumps(mesure, ensure_ascii=False))
+
+    if FICHIER_METRIQUES:
+        with _verrou_fichier, open(FICHIER_METRIQUES, "a", encoding="utf-8") as f:
+            f.write(json.dumps(mesure, ensure_ascii=False) + "\n")
+
+    collecte = _collecte.get()
+    if collecte is not None:
+        mesures = collecte[0]
+        mesures.append(mesure)
+        if len(mesures) > MAX_MESURES:
+            del mesures[:-MAX_MESURES]
+
+
+@contextmanager
+def mesurer(etape, lignes=None, **contexte):
+    """
+    Mesure le bloc comme étape `etape`. Le dict renvoyé peut être complété
+    dans le bloc (ex. m["lignes"] = len(df)) ; `contexte` est recopié tel
+    quel dans la mesure (exercice, fichier...).
+    """
+    collecte = _collecte.get()
+    mesure = {
+        "etape": etape,
+        "lignes": lignes,
+        "session": collecte[1] if collecte else "",
+        **contexte,
+    }
+    memoire_avant = memoire_residente()
+    debut = time.perf_counter()
+    try:
+        yield mesure
+    finally:
+        mesure["duree_ms"] = round((time.perf_counter() - debut) * 1000, 3)
+        memoire_apres = memoire_residente()
+        mesure["memoire_delta_octets"] = (
+            memoire_apres - memoire_avant if memoire_avant is not None and memoire_apres is not None else None
+        )
+        mesure["horodatage"] = time.time()
+        _enregistrer(mesure)
+
+
+def _nb_lignes(args, resultat):
+    """Lignes traitées : DataFrame / Series en entrée, sinon en sortie."""
+    if args and isinstance(args[0], (pd.DataFrame, pd.Series)):
+        return len(args[0])
+    if isinstance(resultat, (pd.DataFrame, pd.Series)):
+        return len(resultat)
+    if isinstance(resultat, dict) and "nb_lignes" in resultat:
+        return resultat["nb_lignes"]
+    return None
+
+
+def instrumente(etape):
+    """Décorateur : chaque appel de la fonction est mesuré comme `etape`."""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with mesurer(etape) as mesure:
+                resultat = fonction(*args, **kwargs)
+                mesure["lignes"] = _nb_lignes(args, resultat)
+            return resultat
+        return enveloppe
+    return decorateur
+
+
+def synthese(mesures):
+    """DataFrame par étape : nombre d'appels, durée totale / max, lignes, mémoire."""
+    if not mesures:
+        return pd.DataFrame(columns=["appels", "duree_ms", "duree_max_ms", "lignes", "memoire_delta_mo"])
+    df = pd.DataFrame(mesures)
+    resume = df.groupby("etape", sort=False).agg(
+        appels=("duree_ms", "size"),
+        duree_ms=("duree_ms", "sum"),
+        duree_max_ms=("duree_ms", "max"),
+        lignes=("lignes", "sum"),
+        memoire_delta_mo=("memoire_delta_octets", "sum"),
+    )
+    resume["memoire_delta_mo"] = resume["memoire_delta_mo"] / 1024 ** 2
+    return resume.round(1).sort_values("duree_ms", ascending=False)
@@ -1,12 +1,33 @@
 import streamlit as st
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from archives_fec import ouvrir_membre, repartir_exercices
+from cache_sig import CACHE, valider_fec_cache
+from increment_fec import appliquer_delta, initialiser, mettre_a_jour
+from instrumentation import activer_collecte
+from taches_import import identifiant_import, lancer_import
 from sig_utils import (
-    lire_fichier_fec,
-    controle_coherence,
+    controle_coherence_detail,
+    empreinte_fichier,
     fmt,
+    lire_fichier_fec,
+    sig_periodes,
 )
 
 if "data_par_an" not in st.session_state:
     st.session_state["data_par_an"] = {}
+if "resultats_par_an" not in st.session_state:
+    st.session_state["resultats_par_an"] = {}
+if "mesures" not in st.session_state:
+    st.session_state["mesures"] = []
+if "increments" not in st.session_state:
+    st.session_state["increments"] = {}
+if "taches_import" not in st.session_state:
+    st.session_state["taches_import"] = {}
+
+# mesures des étapes de cette exécution -> panneau de diagnostic (page SIG)
+activer_collecte(st.session_state["mesures"], get_script_run_ctx().session_id)
 
 st.title("Données entreprise & imports")
 
@@ -22,34 +43,251 @@ with col2:
 st.markdown("---")
 st.subheader("Imports FEC / balances")
 
+import_flux = st.checkbox(
+    "Import en flux (agrégation à la volée, mémoire réduite)",
+    help="Le fichier est lu par blocs et directement réduit en totaux par compte.",
+)
+conserver_lignes = False
+conserver_colonnes = False
+if import_flux:
+    conserver_lignes = st.checkbox("Conserver aussi les lignes brutes", value=False)
+else:
+    conserver_colonnes = st.checkbox(
+        "Conserver toutes les colonnes du FEC",
+        value=False,
+        help="Par défaut seuls compte, libellé, date, débit et crédit sont gardés en mémoire.",
+    )
+
+# archives .zip / .gz : le FEC contenu est décompressé au fil de la lecture
+TYPES_FEC = ["csv", "txt", "xlsx", "xls", "zip", "gz"]
+
 col_fec1, col_fec2, col_fec3 = st.columns(3)
 with col_fec1:
-    fec_N = st.file_uploader("FEC / balance – Année N", type=["csv", "txt", "xlsx", "xls"], key="fec_N")
+    fec_N = st.file_uploader("FEC / balance – Année N", type=TYPES_FEC, key="fec_N")
 with col_fec2:
-    fec_N1 = st.file_uploader("FEC / balance – Année N-1", type=["csv", "txt", "xlsx", "xls"], key="fec_N1")
+    fec_N1 = st.file_uploader("FEC / balance – Année N-1", type=TYPES_FEC, key="fec_N1")
 with col_fec3:
-    fec_N2 = st.file_uploader("FEC / balance – Année N-2", type=["csv", "txt", "xlsx", "xls"], key="fec_N2")
+    fec_N2 = st.file_uploader("FEC / balance – Année N-2", type=TYPES_FEC, key="fec_N2")
 
 data_par_an = st.session_state["data_par_an"]
+resultats_par_an = st.session_state["resultats_par_an"]
+
+fec_archive = st.file_uploader(
+    "Archive de plusieurs exercices (.zip)",
+    type=["zip"],
+    key="fec_archive",
+    help="Chaque FEC de l'archive est attribué à N, N-1 ou N-2 d'après sa date de clôture. "
+         "Un fichier déposé ci-dessus pour un exercice est prioritaire.",
+)
+
+fichiers = {annee: f for annee, f in (("N", fec_N), ("N-1", fec_N1), ("N-2", fec_N2)) if f is not None}
+membres = {}  # exercice -> FEC lu dans l'archive multi-exercices
+if fec_archive is not None:
+    repartition = st.session_state.get("repartition_archive")
+    identifiant = getattr(fec_archive, "file_id", fec_archive.name)
+    if repartition is None or repartition[0] != identifiant:
+        repartition = (identifiant, *repartir_exercices(fec_archive))
+        st.session_state["repartition_archive"] = repartition
+    _, par_annee, surnombre = repartition
+    for annee, membre in par_annee.items():
+        if annee not in fichiers:
+            fichiers[annee], membres[annee] = fec_archive, membre
+    if membres:
+        st.caption("Archive : " + ", ".join(f"{annee} ← {membre}" for annee, membre in membres.items()))
+    if not par_annee:
+        st.warning("Aucun FEC trouvé dans l'archive.")
+    if surnombre:
+        st.warning("FEC ignorés (plus de trois exercices) : " + ", ".join(surnombre))
+
+
+def fichier_lu(annee):
+    """Fichier importé pour l'exercice, ou son FEC dans l'archive multi-exercices."""
+    if annee in membres:
+        return ouvrir_membre(fichiers[annee], membres[annee])
+    return fichiers[annee]
+
+options_import = dict(
+    flux=import_flux,
+    conserver_lignes=conserver_lignes,
+    conserver="toutes" if conserver_colonnes else (),
+    siren=st.session_state.get("info_entreprise", {}).get("siren", ""),
+)
+
+# Imports en tâche de fond, un par exercice : un nouveau fichier (ou de
+# nouvelles options) relance la tâche, un fichier retiré l'annule.
+taches = st.session_state["taches_import"]
+for annee in list(taches):
+    if annee not in fichiers:
+        taches.pop(annee).annuler()
+for annee, file in fichiers.items():
+    tache = taches.get(annee)
+    if tache is None or tache.source != identifiant_import(file, options_import, membres.get(annee)):
+        if tache is not None:
+            tache.annuler()
+        taches[annee] = lancer_import(annee, file, membres.get(annee), **options_import)
+
+
+def suivi_imports():
+    for annee, tache in taches.items():
+        if tache.terminee:
+            continue
+        col_barre, col_bouton = st.columns([5, 1])
+        col_barre.progress(
+            tache.progression,
+            text=f"{annee} – {tache.nom_lu} : {tache.octets_lus / 1024 ** 2:.1f} / {tache.taille / 1024 ** 2:.1f} Mo, "
+                 f"{tache.lignes_lues} lignes lues",
+        )
+        if col_bouton.button("Annuler", key=f"annuler_{annee}"):
+            tache.annuler()
+    if any(t.terminee and not t.remise for t in taches.values()):
+        st.rerun()  # résultat prêt : réexécution de toute la page
+
+
+# les tâches déjà terminées sont reprises par cette exécution ; le fragment
+# ne relance la page que pour celles qui se terminent ensuite
+for tache in taches.values():
+    tache.remise = tache.terminee
+
+# rafraîchissement de la progression seulement, tant qu'un import est en cours
+st.fragment(suivi_imports, run_every=0.5 if not all(t.terminee for t in taches.values()) else None)()
+
+resultats = {annee: t.resultat for annee, t in taches.items() if t.etat == "terminee"}
+
+# Mises à jour en cours de clôture : seules les écritures nouvelles / modifiées
+# sont retraitées. increments[annee] = {base, etat, appliques, resultat}
+increments = st.session_state["increments"]
+annees_chargees = [a for a in fichiers if resultats.get(a) is not None]
+if annees_chargees:
+    with st.expander("Mise à jour en cours de clôture (FEC mis à jour ou delta)"):
+        col_maj1, col_maj2 = st.columns(2)
+        annee_maj = col_maj1.selectbox("Exercice à mettre à jour", annees_chargees, key="annee_maj")
+        type_maj = col_maj2.radio(
+            "Contenu du fichier",
+            ["FEC complet mis à jour", "Delta (écritures nouvelles ou corrigées)"],
+            key="type_maj",
+        )
+        fichier_maj = st.file_uploader(
+            "Fichier de mise à jour", type=TYPES_FEC, key="fec_maj"
+        )
 
+        if fichier_maj is not None and st.button("Appliquer la mise à jour", key="appliquer_maj"):
+            base = resultats[annee_maj]
+            suivi = increments.get(annee_maj)
+            if suivi is None or suivi["base"] != base["empreinte"]:
+                fichier_base = fichier_lu(annee_maj)
+                fichier_base.seek(0)
+                brut_base = lire_fichier_fec(fichier_base)
+                suivi = {"base": base["empreinte"], "etat": initialiser(brut_base) if brut_base is not None else None,
+                         "appliques": [], "resultat": None}
 
-def charger(label, fichier, annee):
-    if fichier is None:
+            empreinte_maj = empreinte_fichier(fichier_maj)
+            brut_maj = None
+            if suivi["etat"] is None:
+                st.warning("Mise à jour impossible : le fichier de base est illisible ou n'a pas de colonnes "
+                           "EcritureNum / EcritureDate.")
+            elif empreinte_maj not in suivi["appliques"]:
+                brut_maj = lire_fichier_fec(fichier_maj)
+                if brut_maj is None:
+                    st.warning("Fichier de mise à jour illisible.")
+            if brut_maj is not None:
+                mise_a_jour = mettre_a_jour if type_maj.startswith("FEC complet") else appliquer_delta
+                etat = mise_a_jour(suivi["etat"], brut_maj)
+                if etat is None:
+                    st.warning("Fichier de mise à jour non reconnu (compte, EcritureNum ou EcritureDate manquant).")
+                else:
+                    # lignes, cube et tiers : calculés par la page SIG à sa prochaine
+                    # exécution (`increment`), pas à chaque mise à jour appliquée
+                    suivi = dict(
+                        suivi,
+                        etat=etat,
+                        appliques=suivi["appliques"] + [empreinte_maj],
+                        resultat=dict(
+                            base,
+                            df=None,
+                            grouped=etat["grouped"],
+                            regles=etat["regles"],
+                            sig=etat["sig"],
+                            coherence=etat["coherence"],
+                            sig_periodes=sig_periodes(etat["sig_mensuel"]),
+                            cube=None,
+                            tiers=None,
+                            increment=etat,
+                            nb_lignes=etat["nb_lignes"],
+                        ),
+                    )
+            increments[annee_maj] = suivi
+
+        suivi = increments.get(annee_maj)
+        if suivi is not None and suivi["base"] == resultats[annee_maj]["empreinte"] and suivi["resultat"]:
+            maj = suivi["etat"]["maj"]
+            if maj is not None:
+                st.success(
+                    f"Exercice {annee_maj} : {len(suivi['appliques'])} mise(s) à jour appliquée(s). Dernière : "
+                    f"{maj['ecritures_ajoutees']} écriture(s) ajoutée(s), {maj['ecritures_modifiees']} modifiée(s), "
+                    f"{maj['ecritures_supprimees']} supprimée(s) – {len(maj['comptes_modifies'])} compte(s) et "
+                    f"{len(maj['lignes_sig_modifiees'])} ligne(s) SIG recalculés."
+                )
+
+
+def afficher_import(label, annee):
+    if annee not in fichiers:
         st.info(f"{label} {annee} : aucun fichier importé.")
         return
-    df = lire_fichier_fec(fichier)
-    if df is not None:
-        data_par_an[annee] = df
-        st.success(f"{label} {annee} importé ({len(df)} lignes).")
+
+    tache = taches[annee]
+    if not tache.terminee:
+        st.info(f"{label} {annee} : import en cours…")
+        return
+    if tache.etat == "annulee":
+        st.warning(f"{label} {annee} : import annulé.")
+        if st.button("Relancer l'import", key=f"relancer_{annee}"):
+            taches.pop(annee)
+            st.rerun()
+        return
+    if tache.etat == "erreur":
+        st.error(f"{label} {annee} : échec de l'import ({tache.erreur}).")
+        return
+
+    resultat = tache.resultat
+    if resultat is None:
+        st.warning(f"{label} {annee} : fichier illisible.")
+        return
+
+    suivi = increments.get(annee)
+    if suivi is not None and suivi["resultat"] is not None and suivi["base"] == resultat["empreinte"]:
+        resultat = suivi["resultat"]  # mis à jour en cours de clôture
+
+    resultats_par_an[annee] = resultat
+    if resultat["df"] is not None:
+        data_par_an[annee] = resultat["df"]
+    else:
+        data_par_an.pop(annee, None)
+
+    lecture = resultat["lecture"]
+    if lecture["source"] == "flux":
+        st.success(f"{label} {annee} importé en flux ({resultat['nb_lignes']} lignes).")
+    else:
+        st.success(f"{label} {annee} importé ({resultat['nb_lignes']} lignes).")
+
+    if lecture["source"] == "stockage":
+        st.caption(f"Relu depuis le stockage local ({lecture['octets_compact'] / 1024 ** 2:.1f} Mo compact).")
+    elif lecture["octets_compact"] is not None and lecture["octets_brut"] is None:
+        st.caption(f"Lecture projetée : {lecture['octets_compact'] / 1024 ** 2:.1f} Mo en mémoire.")
+    elif lecture["octets_compact"] is not None:
+        st.caption(
+            f"Mémoire : {lecture['octets_brut'] / 1024 ** 2:.1f} Mo brut → "
+            f"{lecture['octets_compact'] / 1024 ** 2:.1f} Mo compact"
+        )
+    st.caption(f"Traitement : {resultat['duree']:.2f} s")
 
 
 colN, colN1, colN2 = st.columns(3)
 with colN:
-    charger("Fichier", fec_N, "N")
+    afficher_import("Fichier", "N")
 with colN1:
-    charger("Fichier", fec_N1, "N-1")
+    afficher_import("Fichier", "N-1")
 with colN2:
-    charger("Fichier", fec_N2, "N-2")
+    afficher_import("Fichier", "N-2")
 
 st.session_state["data_par_an"] = data_par_an
 
@@ -57,15 +295,75 @@ st.markdown("---")
 st.subheader("Contrôle de cohérence (classes 6-7 vs 1-5)")
 
 for annee in ["N", "N-1", "N-2"]:
-    if annee in data_par_an:
-        df = data_par_an[annee]
-        ecart = controle_coherence(df)
-        if ecart is None:
+    if annee in resultats_par_an or annee in data_par_an:
+        if annee in resultats_par_an:
+            controle = resultats_par_an[annee]["coherence"]
+        else:
+            controle = controle_coherence_detail(data_par_an[annee])
+        if controle is None:
             st.warning(f"Exercice {annee} : format non reconnu pour le contrôle.")
         else:
-            if abs(ecart) < 1e-2:
-                st.success(f"Exercice {annee} : balance cohérente (écart ≈ 0 €).")
+            ecart = controle["ecart"]
+            if ecart == 0:
+                st.success(f"Exercice {annee} : balance cohérente (écart = 0 €).")
             else:
                 st.error(f"Exercice {annee} : écart 6-7 vs 1-5 = {fmt(ecart)}.")
+                with st.expander(f"Localiser l'écart – exercice {annee}"):
+                    st.markdown("**Solde par classe**")
+                    st.dataframe(controle["par_classe"].apply(fmt), use_container_width=True)
+                    st.markdown("**Comptes au plus fort solde**")
+                    st.dataframe(controle["top_comptes"], use_container_width=True)
+                    if not controle["hors_classes"].empty:
+                        st.markdown("**Comptes mouvementés hors classes 1 à 7 (ignorés)**")
+                        st.dataframe(controle["hors_classes"], use_container_width=True)
     else:
         st.info(f"Exercice {annee} : aucun fichier chargé.")
+
+st.markdown("---")
+st.subheader("Conformité FEC (contrôles DGFiP)")
+
+if not fichiers:
+    st.info("Aucun fichier importé.")
+elif st.checkbox(
+    "Contrôler la conformité des fichiers importés",
+    key="controle_conformite",
+    help="18 colonnes obligatoires, équilibre de chaque écriture par journal, dates dans l'exercice, doublons.",
+):
+    cloture_N = st.date_input(
+        "Date de clôture de l'exercice N",
+        value=None,
+        key="cloture_N",
+        help="À défaut, l'exercice est l'année civile de la date d'écriture médiane de chaque fichier.",
+    )
+    for decalage, annee in enumerate(["N", "N-1", "N-2"]):
+        if annee not in fichiers:
+            continue
+        cloture = pd.Timestamp(cloture_N) - pd.DateOffset(years=decalage) if cloture_N else None
+        # clé : empreinte calculée par la tâche d'import, sinon fichier déposé et membre
+        # d'archive ; le fichier n'est ouvert et relu que si le rapport n'est pas en cache
+        tache = taches.get(annee)
+        cle = (tache.empreinte if tache is not None else None) or (
+            "depot", getattr(fichiers[annee], "file_id", fichiers[annee].name), membres.get(annee)
+        )
+        rapport = valider_fec_cache(lambda: fichier_lu(annee), cloture, empreinte=cle)
+        if rapport is None:
+            st.warning(f"Exercice {annee} : fichier illisible.")
+            continue
+        if rapport["exercice"] is not None:
+            debut, fin = rapport["exercice"]
+            st.caption(f"Exercice {annee} contrôlé du {debut:%d/%m/%Y} au {fin:%d/%m/%Y}.")
+        nb_anomalies = int(rapport["synthese"]["Anomalies"].fillna(0).sum())
+        if rapport["conforme"]:
+            st.success(f"Exercice {annee} : FEC conforme ({rapport['nb_lignes']} lignes contrôlées).")
+        else:
+            st.error(f"Exercice {annee} : {nb_anomalies} anomalie(s) sur {rapport['nb_lignes']} lignes.")
+            with st.expander(f"Anomalies – exercice {annee}"):
+                st.dataframe(rapport["synthese"], use_container_width=True)
+                st.dataframe(rapport["anomalies"], use_container_width=True, hide_index=True)
+
+stats_cache = CACHE.statistiques()
+st.sidebar.caption(
+    f"Cache partagé : {stats_cache['succes']} succès / {stats_cache['echecs']} échecs, "
+    f"{stats_cache['entrees']} entrées, {stats_cache['octets'] / 1024 ** 2:.0f} / "
+    f"{stats_cache['budget_octets'] / 1024 ** 2:.0f} Mo"
+)
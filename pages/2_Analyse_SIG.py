@@ -1,118 +1,335 @@
+import io
+
 import streamlit as st
 import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from cube_sig import comptes_noeud, construire_cube, ecritures_noeud, noeuds
+from export_sig import ecrire_classeur, ecrire_details_csv
+from increment_fec import lignes_actives
+from instrumentation import activer_collecte, mesurer, synthese
 from sig_utils import (
-    preparer_grouped,
-    calcul_sig,
+    LIGNES_SIG,
+    preparer_grouped_tiers,
+    calcul_sig_annees,
+    calcul_sig_periodes,
+    comparer_annees,
+    compiler_regles_sig,
+    controle_coherence_detail,
     filtre_detail,
     fmt,
+    fmt_serie,
+    nb_comptes_detail,
+    sig_glissant_12,
 )
+from tiers_sig import calcul_tiers, construire_tiers, ecritures_tiers, soldes_tiers
+
+TAILLES_PAGE_DETAIL = [50, 200, 1000]
+EXERCICE_PRECEDENT = {"N": "N-1", "N-1": "N-2"}
 
 st.title("Analyse du résultat (SIG)")
 
+if "mesures" not in st.session_state:
+    st.session_state["mesures"] = []
+mesures = st.session_state["mesures"]
+activer_collecte(mesures, get_script_run_ctx().session_id)
+
 data_par_an = st.session_state.get("data_par_an", {})
+resultats_par_an = st.session_state.get("resultats_par_an", {})
+annees_dispo = set(data_par_an) | set(resultats_par_an)
 
-if "N" not in data_par_an && "N-1" not in data_par_an:
+if not annees_dispo & {"N", "N-1", "N-2"}:
     st.info("Veuillez d'abord importer au moins un fichier dans la page **Données & imports**.")
 else:
-    sig_par_an = {}
     grouped_par_an = {}
+    regles_par_an = {}
+    periodes_par_an = {}
+    cubes_par_an = {}
+    tiers_par_an = {}
 
-    for annee in ["N", "N-1"]:
-        if annee in data_par_an:
-            grouped = preparer_grouped(data_par_an[annee])
+    for annee in ["N", "N-1", "N-2"]:
+        if annee in resultats_par_an:
+            # calculé par le pipeline de la page d'import
+            resultat = resultats_par_an[annee]
+            if resultat.get("increment") is not None and resultat["df"] is None:
+                # exercice mis à jour en cours de clôture : lignes, cube et tiers
+                # calculés ici une fois par mise à jour, et conservés dans le résultat
+                lignes = lignes_actives(resultat["increment"])
+                resultat.update(
+                    df=lignes,
+                    cube=construire_cube(resultat["grouped"], resultat["regles"], lignes),
+                    tiers=calcul_tiers(lignes),
+                )
+            if resultat["grouped"] is not None:
+                grouped_par_an[annee] = resultat["grouped"]
+                regles_par_an[annee] = resultat["regles"]
+                periodes_par_an[annee] = resultat.get("sig_periodes")
+                cubes_par_an[annee] = resultat.get("cube") or construire_cube(
+                    resultat["grouped"], resultat["regles"], resultat["df"]
+                )
+                if resultat.get("tiers") is not None:
+                    tiers_par_an[annee] = resultat["tiers"]
+        elif annee in data_par_an:
+            grouped, sommes_tiers = preparer_grouped_tiers(data_par_an[annee])
             if grouped is not None:
                 grouped_par_an[annee] = grouped
-                sig_par_an[annee] = calcul_sig(grouped)
+                regles_par_an[annee] = compiler_regles_sig(grouped)
+                periodes_par_an[annee] = calcul_sig_periodes(data_par_an[annee])
+                cubes_par_an[annee] = construire_cube(grouped, regles_par_an[annee], data_par_an[annee])
+                if sommes_tiers is not None:
+                    tiers_par_an[annee] = construire_tiers(sommes_tiers, data_par_an[annee])
 
-    if not sig_par_an:
+    if not grouped_par_an:
         st.warning("Impossible de calculer le SIG (format de données non reconnu).")
     else:
-        lignes_ordre = [
-            "Chiffre d'affaires",
-            "Ventes + Production réelle",
-            "Achats consommés",
-            "Marge globale",
-            "Charges de fonctionnement",
-            "Valeur ajoutée",
-            "Subvention de l'exploitation",
-            "Impôts et taxes",
-            "Charges de personnel",
-            "Excédent brut d'exploitation",
-            "Transfert de charges",
-            "Reprises sur provisions",
-            "Autres produits d'exploitation",
-            "Dotations aux amortissements",
-            "Dotations aux provisions",
-            "Autres charges d'exploitation",
-            "Résultat d'exploitation",
-            "Résultat financier",
-            "Résultat courant",
-            "Résultat exceptionnel",
-            "Résultat de l'exercice",
-            "Capacité d'autofinancement",
-        ]
-
-        data_table = []
-        for ligne in lignes_ordre:
-            val_N = sig_par_an.get("N", {}).get(ligne, 0.0)
-            val_N1 = sig_par_an.get("N-1", {}).get(ligne, 0.0)
-            if "N" in sig_par_an and "N-1" in sig_par_an:
-                ecart_abs = val_N - val_N1
-                ecart_pct = (ecart_abs / val_N1 * 100) if abs(val_N1) > 1e-6 else None
+        lignes_ordre = list(LIGNES_SIG)
+
+        tableau = comparer_annees(calcul_sig_annees(grouped_par_an))
+        df_aff = tableau.apply(lambda c: fmt_serie(c, 1, " %") if c.name.startswith("%") else fmt_serie(c))
+
+        with mesurer("rendu_tableau", lignes=len(df_aff)):
+            st.subheader("Tableau des soldes intermédiaires de gestion")
+            st.dataframe(df_aff, use_container_width=True)
+
+        def exercices_export():
+            return {
+                annee: {
+                    "grouped": grouped,
+                    "regles": regles_par_an[annee],
+                    "coherence": resultats_par_an[annee]["coherence"] if annee in resultats_par_an
+                    else controle_coherence_detail(data_par_an[annee]),
+                }
+                for annee, grouped in grouped_par_an.items()
+            }
+
+        def classeur_export():
+            sortie = io.BytesIO()
+            ecrire_classeur(sortie, exercices_export(), titre="Soldes intermédiaires de gestion")
+            return sortie.getvalue()
+
+        def csv_export():
+            sortie = io.StringIO()
+            ecrire_details_csv(sortie, exercices_export())
+            return sortie.getvalue().encode("utf-8-sig")
+
+        # contenus produits au clic seulement (callable), pas à chaque exécution de la page
+        col_x1, col_x2, _ = st.columns([1, 1, 2])
+        col_x1.download_button(
+            "Exporter le rapport (Excel)",
+            classeur_export,
+            file_name="rapport_sig.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            on_click="ignore",
+            key="export_xlsx",
+        )
+        col_x2.download_button(
+            "Exporter les détails (CSV)",
+            csv_export,
+            file_name="details_sig.csv",
+            mime="text/csv",
+            on_click="ignore",
+            key="export_csv",
+        )
+
+        with mesurer("rendu_periodes"):
+            st.markdown("---")
+            st.subheader("Évolution infra-annuelle")
+
+            annees_periodes = [a for a in ("N", "N-1", "N-2") if periodes_par_an.get(a) is not None]
+            if not annees_periodes:
+                st.info("SIG par période indisponible : dates d'écriture absentes, ou import en flux sans les lignes.")
             else:
-                ecart_abs = None
-                ecart_pct = None
-            data_table.append(
-                {
-                    "Poste": ligne,
-                    "N": val_N if "N" in sig_par_an else None,
-                    "N-1": val_N1 if "N-1" in sig_par_an else None,
-                    "Écart": ecart_abs,
-                    "%": ecart_pct,
+                vues = {
+                    "Mensuel": "mensuel",
+                    "Trimestriel": "trimestriel",
+                    "Cumul de l'exercice": "cumul",
+                    "12 mois glissants": "glissant_12",
                 }
-            )
+                col_p1, col_p2, col_p3 = st.columns([1, 2, 3])
+                annee_p = col_p1.radio("Exercice", annees_periodes, key="annee_periodes")
+                vue = col_p2.radio("Période", list(vues), key="vue_periodes")
+                postes_graph = col_p3.multiselect(
+                    "Postes",
+                    lignes_ordre,
+                    default=["Chiffre d'affaires", "Excédent brut d'exploitation", "Résultat de l'exercice"],
+                    key="postes_periodes",
+                )
 
-        df_sig = pd.DataFrame(data_table)
+                hors_exercice = periodes_par_an[annee_p].get("hors_exercice", 0)
+                if hors_exercice:
+                    st.warning(
+                        f"Exercice {annee_p} : {hors_exercice} ligne(s) datée(s) hors de l'exercice "
+                        "(date d'écriture erronée ?) écartée(s) des périodes."
+                    )
+                if vues[vue] == "glissant_12":
+                    # exercice et exercice précédent mis bout à bout
+                    precedent = periodes_par_an.get(EXERCICE_PRECEDENT.get(annee_p))
+                    table = sig_glissant_12(
+                        periodes_par_an[annee_p]["mensuel"], precedent["mensuel"] if precedent is not None else None
+                    )
+                else:
+                    table = periodes_par_an[annee_p][vues[vue]]
+                if table is None:
+                    st.info(
+                        f"12 mois glissants indisponibles : importer l'exercice précédent de {annee_p}, "
+                        "avec ses lignes datées."
+                    )
+                elif table.empty:
+                    st.info("Aucune écriture datée dans l'exercice.")
+                else:
+                    table = table.set_axis(table.index.astype(str))
+                    if postes_graph:
+                        st.line_chart(table[postes_graph])
+                    with st.expander("Tableau par période"):
+                        st.dataframe(table.T.map(fmt), use_container_width=True)
 
-        def fmt_cell(v):
-            if v is None or pd.isna(v):
-                return ""
-            return fmt(v)
+        with mesurer("rendu_exploration"):
+            st.markdown("---")
+            st.subheader("Exploration par compte")
 
-        def fmt_pct(v):
-            if v is None or pd.isna(v):
-                return ""
-            return f"{v:,.1f} %".replace(".", ",")
+            col_e1, col_e2 = st.columns([1, 3])
+            annee_e = col_e1.radio("Exercice", list(cubes_par_an), key="annee_exploration")
+            tous = "(tous les comptes)"
+            choix_ligne = col_e2.selectbox("Ligne SIG", [tous] + lignes_ordre, key="ligne_exploration")
+            ligne_e = None if choix_ligne == tous else choix_ligne
+            cube = cubes_par_an[annee_e]
 
-        df_aff = df_sig.copy()
-        if "N" in sig_par_an:
-            df_aff["N"] = df_aff["N"].apply(fmt_cell)
-        if "N-1" in sig_par_an:
-            df_aff["N-1"] = df_aff["N-1"].apply(fmt_cell)
-        df_aff["Écart"] = df_aff["Écart"].apply(fmt_cell)
-        df_aff["%"] = df_aff["%"].apply(fmt_pct)
+            # descente niveau par niveau ; un niveau à un seul nœud est traversé directement
+            prefixe = ""
+            for niveau in range(1, cube["profondeur"] + 1):
+                table = noeuds(cube, niveau, prefixe, ligne_e)
+                if table.empty:
+                    break
+                if len(table) == 1:
+                    prefixe = table.index[0]
+                    continue
+                st.dataframe(
+                    table.assign(**{c: table[c].map(fmt) for c in table.columns if c != "NbComptes"}),
+                    use_container_width=True,
+                )
+                choix = st.selectbox(
+                    f"Préfixe à {niveau} chiffre(s)",
+                    ["—"] + list(table.index),
+                    key=f"exploration_{annee_e}_{choix_ligne}_{prefixe}",
+                )
+                if choix == "—":
+                    break
+                prefixe = choix
 
-        st.subheader("Tableau des soldes intermédiaires de gestion")
-        st.dataframe(df_aff.set_index("Poste"), use_container_width=True)
+            if prefixe:
+                comptes = comptes_noeud(cube, prefixe, ligne_e)
+                st.markdown(f"**Comptes {prefixe}…** ({len(comptes)})")
+                st.dataframe(comptes, use_container_width=True)
+                ecritures = ecritures_noeud(cube, prefixe)
+                if ecritures is None:
+                    st.info("Écritures indisponibles : import en flux sans conservation des lignes.")
+                else:
+                    if ligne_e is not None:
+                        ecritures = ecritures[ecritures["CompteNum"].isin(comptes["CompteNum"])]
+                    st.markdown(f"**Écritures** ({len(ecritures)}, 1 000 premières affichées)")
+                    st.dataframe(ecritures.head(1000), use_container_width=True)
 
-        st.markdown("---")
-        st.subheader("Détail par poste (cliquer pour dérouler)")
-
-        for _, row in df_sig.iterrows():
-            poste = row["Poste"]
-            with st.expander(poste):
-                cols = st.columns(2)
-                if "N" in grouped_par_an:
-                    detail_N = filtre_detail(grouped_par_an["N"], poste)
-                    cols[0].markdown("**Exercice N**")
-                    if detail_N.empty:
-                        cols[0].write("Aucun compte pour ce poste.")
+        with mesurer("rendu_tiers"):
+            st.markdown("---")
+            st.subheader("Clients et fournisseurs")
+
+            if not tiers_par_an:
+                st.info("Analyse des tiers indisponible : le FEC ne renseigne pas de compte auxiliaire (CompAuxNum).")
+            else:
+                col_t1, col_t2 = st.columns([1, 3])
+                annee_t = col_t1.radio("Exercice", list(tiers_par_an), key="annee_tiers")
+                top_n = col_t2.slider("Nombre de tiers affichés", 5, 100, 20, step=5, key="top_tiers")
+                tiers = tiers_par_an[annee_t]
+
+                for categorie, titre, volume in (
+                    ("clients", "Clients (comptes 41)", "débits TTC"),
+                    ("fournisseurs", "Fournisseurs (comptes 40)", "crédits TTC"),
+                ):
+                    table = tiers[categorie]
+                    concentration = tiers["concentration"][categorie]
+                    st.markdown(f"**{titre}** : {concentration['nb_tiers']} tiers, {fmt(concentration['volume'])} de {volume}")
+                    c1, c2, c3, c4 = st.columns(4)
+                    c1.metric("Premier tiers", f"{concentration['top1']:.1f} %")
+                    c2.metric("5 premiers", f"{concentration['top5']:.1f} %")
+                    c3.metric("10 premiers", f"{concentration['top10']:.1f} %")
+                    c4.metric("Indice HHI", f"{concentration['hhi']:.0f}")
+                    if not table.empty:
+                        tete = table.head(top_n)
+                        st.dataframe(
+                            tete.assign(
+                                Volume=fmt_serie(tete["Volume"]),
+                                Solde=fmt_serie(tete["Solde"]),
+                                Part=fmt_serie(tete["Part"], 1, " %"),
+                                PartCumulee=fmt_serie(tete["PartCumulee"], 1, " %"),
+                            ),
+                            use_container_width=True,
+                        )
+
+                auxiliaires = pd.unique(tiers["numeros"])
+                choix_aux = st.selectbox(
+                    f"Détail d'un tiers ({len(auxiliaires)} comptes auxiliaires)",
+                    ["—"] + list(auxiliaires),
+                    key=f"detail_tiers_{annee_t}",
+                )
+                if choix_aux != "—":
+                    st.dataframe(soldes_tiers(tiers, choix_aux), use_container_width=True)
+                    ecritures = ecritures_tiers(tiers, choix_aux)
+                    if ecritures is None:
+                        st.info("Écritures indisponibles : import en flux sans conservation des lignes.")
                     else:
-                        cols[0].dataframe(detail_N, use_container_width=True)
-                if "N-1" in grouped_par_an:
-                    detail_N1 = filtre_detail(grouped_par_an["N-1"], poste)
-                    cols[1].markdown("**Exercice N-1**")
-                    if detail_N1.empty:
-                        cols[1].write("Aucun compte pour ce poste.")
+                        st.markdown(f"**Écritures** ({len(ecritures)}, 1 000 premières affichées)")
+                        st.dataframe(ecritures.head(1000), use_container_width=True)
+
+        st.markdown("---")
+        st.subheader("Détail par poste")
+
+        # fragment : choisir un poste ou une page ne réexécute que ce bloc ; seule
+        # la page affichée du détail est produite et envoyée au navigateur
+        @st.fragment
+        def afficher_detail():
+            nb_comptes = {
+                poste: {annee: nb_comptes_detail(poste, regles) for annee, regles in regles_par_an.items()}
+                for poste in lignes_ordre
+            }
+            aucun = "—"
+            poste = st.selectbox(
+                "Poste",
+                [aucun] + lignes_ordre,
+                format_func=lambda p: p if p == aucun else f"{p} ({max(nb_comptes[p].values())} comptes)",
+                key="poste_detail",
+            )
+            if poste == aucun:
+                return
+
+            col_p1, col_p2 = st.columns([1, 3])
+            taille = col_p1.selectbox("Comptes par page", TAILLES_PAGE_DETAIL, key="taille_page_detail")
+            nb_pages = max(1, -(-max(nb_comptes[poste].values()) // taille))
+            page = col_p2.number_input(
+                f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1, key=f"page_detail_{poste}_{taille}"
+            )
+            debut = (page - 1) * taille
+
+            with mesurer("rendu_details", lignes=taille * len(grouped_par_an)):
+                cols = st.columns(len(grouped_par_an))
+                for col, (annee, grouped) in zip(cols, grouped_par_an.items()):
+                    col.markdown(f"**Exercice {annee}** ({nb_comptes[poste][annee]} comptes)")
+                    if not nb_comptes[poste][annee]:
+                        col.write("Aucun compte pour ce poste.")
+                    elif debut >= nb_comptes[poste][annee]:
+                        col.write("Fin du détail.")
                     else:
-                        cols[1].dataframe(detail_N1, use_container_width=True)
+                        detail = filtre_detail(grouped, poste, regles_par_an[annee], debut, debut + taille)
+                        col.dataframe(detail, use_container_width=True)
+
+        afficher_detail()
+
+if st.sidebar.checkbox("Diagnostics de performance", key="diagnostics"):
+    st.sidebar.markdown("**Étapes mesurées (session)**")
+    st.sidebar.dataframe(synthese(mesures), use_container_width=True)
+    with st.sidebar.expander("Dernières mesures"):
+        st.dataframe(
+            pd.DataFrame(mesures[-50:][::-1], columns=["etape", "duree_ms", "lignes", "memoire_delta_octets"]),
+            use_container_width=True,
+        )
+    if st.sidebar.button("Effacer les mesures"):
+        mesures.clear()
@@ -0,0 +1,99 @@
+"""
+Pipeline d'un exercice : lecture → normalisation → regroupement → SIG →
+contrôle de cohérence.
+
+Le résultat est réuni dans un seul dict, mis en cache par empreinte du
+fichier (`traiter_annee_cache`). Les exercices importés (N, N-1, N-2) sont
+traités en parallèle par les tâches de fond de `taches_import` : la durée
+d'un import de trois exercices est proche de celle d'un seul.
+"""
+import time
+
+from cache_sig import CACHE
+from cube_sig import construire_cube
+from fec_store import lire_fichier_fec_stocke
+from instrumentation import instrumente
+from sig_utils import (
+    VERSION_PARSEUR,
+    VERSION_REGLES_SIG,
+    calcul_sig,
+    calcul_sig_periodes,
+    compiler_regles_sig,
+    controle_coherence_detail,
+    empreinte_fichier,
+    lire_fichier_fec_par_blocs,
+    preparer_grouped_tiers,
+)
+from tiers_sig import construire_tiers
+
+
+@instrumente("pipeline")
+def traiter_annee(file, flux=False, conserver_lignes=False, conserver=(), siren="", annee="", empreinte=None):
+    """
+    Pipeline complet d'un exercice. Retourne un dict (None si fichier illisible) :
+    - df : lignes en mémoire (forme compacte, ou brutes en flux si conservées)
+    - grouped, regles, sig, coherence : None si le format n'est pas reconnu
+    - sig_periodes : SIG mensuel / trimestriel / cumulé
+      (`calcul_sig_periodes`), None sans lignes datées en mémoire
+    - cube : cumuls par préfixe pour l'exploration (`construire_cube`)
+    - tiers : soldes et classements par compte auxiliaire
+      (`construire_tiers`), None sans colonne CompAuxNum
+    - nb_lignes, lecture (source / mémoire), empreinte, duree (s)
+    """
+    debut = time.perf_counter()
+    empreinte = empreinte or empreinte_fichier(file)
+
+    if flux:
+        lu = lire_fichier_fec_par_blocs(file, conserver_lignes=conserver_lignes)
+        if lu is None:
+            return None
+        df, grouped, coherence, tiers = lu["lignes"], lu["grouped"], lu["coherence"], lu["tiers"]
+        nb_lignes = lu["nb_lignes"]
+        lecture = {"source": "flux", "octets_brut": None, "octets_compact": None}
+    else:
+        lu = lire_fichier_fec_stocke(file, siren, annee, conserver, empreinte=empreinte)
+        if lu is None:
+            return None
+        df = lu["df"]
+        grouped, tiers = preparer_grouped_tiers(df)
+        coherence = controle_coherence_detail(df) if grouped is not None else None
+        nb_lignes = len(df)
+        lecture = {k: lu[k] for k in ("source", "octets_brut", "octets_compact")}
+
+    regles = compiler_regles_sig(grouped) if grouped is not None else None
+
+    return {
+        "df": df,
+        "grouped": grouped,
+        "regles": regles,
+        "sig": calcul_sig(grouped, regles) if grouped is not None else None,
+        "coherence": coherence,
+        "sig_periodes": calcul_sig_periodes(df) if df is not None and grouped is not None else None,
+        "cube": construire_cube(grouped, regles, df),
+        "tiers": construire_tiers(tiers, df),
+        "nb_lignes": nb_lignes,
+        "lecture": lecture,
+        "empreinte": empreinte,
+        "duree": time.perf_counter() - debut,
+    }
+
+
+def cle_pipeline(empreinte, flux=False, conserver_lignes=False, conserver=()):
+    """Clé du résultat de `traiter_annee` dans le cache partagé."""
+    return ("pipeline", empreinte, VERSION_PARSEUR, VERSION_REGLES_SIG, flux, conserver_lignes, conserver)
+
+
+def traiter_annee_cache(file, flux=False, conserver_lignes=False, conserver=(), siren="", annee="", empreinte=None):
+    """
+    `traiter_annee` adossé au cache partagé. `empreinte` : empreinte du
+    contenu lu (pour une archive, du FEC décompressé), calculée si absente.
+    """
+    conserver = conserver if conserver == "toutes" else tuple(conserver)
+    empreinte = empreinte or empreinte_fichier(file)
+    cle = cle_pipeline(empreinte, flux, conserver_lignes, conserver)
+    resultat = CACHE.consulter(cle)
+    if resultat is None:
+        resultat = traiter_annee(file, flux=flux, conserver_lignes=conserver_lignes, conserver=conserver,
+                                 siren=siren, annee=annee, empreinte=empreinte)
+        CACHE.deposer(cle, resultat)
+    return resultat
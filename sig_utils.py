@@ -1,5 +1,33 @@
+import codecs
+import csv
+import hashlib
+import logging
+import sys
+
+import numpy as np
 import pandas as pd
-import streamlit as st
+
+from instrumentation import instrumente
+
+
+# Versions du parseur et des règles SIG : à incrémenter dès qu'un changement
+# modifie les résultats (elles font partie des clés du cache partagé).
+VERSION_PARSEUR = "3"
+VERSION_REGLES_SIG = "1"
+
+
+logger = logging.getLogger(__name__)
+
+
+class ErreurLectureFEC(Exception):
+    """Fichier FEC / balance illisible (levée avec `strict=True`)."""
+
+
+class LectureInterrompue(Exception):
+    """
+    Lecture arrêtée par la source elle-même (import annulé) : propagée
+    telle quelle, jamais traitée comme un fichier illisible.
+    """
 
 
 # ---------- Utilitaires généraux ----------
@@ -13,59 +41,409 @@ def to_float(x):
         return 0.0
 
 
+@instrumente("montants")
+def parser_montants(serie):
+    """
+    Convertit une colonne entière de montants en centimes (int64).
+
+    Gère les formats français ("1 234,56", "1.234,56") et anglais
+    ("1,234.56") : le dernier séparateur présent est le séparateur
+    décimal, sauf s'il est répété ("1.234.567"). Gère aussi les espaces
+    insécables, le moins final ("12,50-"), les parenthèses ("(12,50)")
+    et les cellules vides. Comme `to_float`, une valeur illisible vaut 0 ;
+    c'est aussi le cas d'un booléen et d'un montant hors de l'intervalle
+    int64 des centimes.
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        valeurs = serie.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        s = serie.astype("string").fillna("")
+        s = s.str.replace("[\\s\u00a0\u202f]", "", regex=True)
+
+        negatif = (s.str.startswith("(") & s.str.endswith(")")) | s.str.endswith("-")
+        s = s.str.strip("()").str.rstrip("-")
+
+        # "1.234,56" / "1,234.56" : le dernier séparateur est décimal,
+        # l'autre sépare les milliers
+        point = s.str.contains(".", regex=False)
+        if point.any():
+            t = s[point]
+            virgule = t.str.rfind(",") > t.str.rfind(".")
+            s[point] = t.str.replace(",", "", regex=False).where(~virgule, t.str.replace(".", "", regex=False))
+        s = s.str.replace(",", ".", regex=False)
+
+        lisible = s.str.fullmatch(r"[+-]?(\d+\.?\d*|\.\d+)")
+        if not lisible.all():
+            # séparateur répété ("1.234.567") : séparateur de milliers
+            milliers = s.str.fullmatch(r"[+-]?\d{1,3}(\.\d{3})+") & ~lisible
+            s[milliers] = s[milliers].str.replace(".", "", regex=False)
+            lisible = lisible | milliers
+        valeurs = s.where(lisible, "0").astype("float64").to_numpy()
+        valeurs = np.where(negatif.to_numpy(dtype=bool), -valeurs, valeurs)
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        centimes = np.rint(valeurs * 100)
+    # hors int64 (ou non fini) : illisible, plutôt qu'un montant replié
+    centimes[~(np.abs(centimes) < 2.0 ** 63)] = 0
+    return pd.Series(centimes.astype("int64"), index=serie.index)
+
+
+def centimes_vers_euros(centimes):
+    return centimes / 100
+
+
+def empreinte_fichier(file, taille_bloc=1 << 20):
+    """Empreinte SHA-256 du contenu du fichier (le fichier est rembobiné)."""
+    h = hashlib.sha256()
+    file.seek(0)
+    for bloc in iter(lambda: file.read(taille_bloc), b""):
+        h.update(bloc)
+    file.seek(0)
+    return h.hexdigest()
+
+
 def fmt(v):
     if v is None or pd.isna(v):
         return ""
     return f"{v:,.0f} €".replace(",", " ").replace(".", ",")
 
 
+def fmt_serie(serie, decimales=0, suffixe=" €"):
+    """`fmt` appliqué à toute une Series (chaîne vide pour les valeurs manquantes)."""
+    valeurs = pd.to_numeric(serie, errors="coerce")
+    texte = valeurs.map(f"{{:,.{decimales}f}}{suffixe}".format, na_action="ignore").astype("string")
+    texte = texte.str.replace(",", " ", regex=False).str.replace(".", ",", regex=False)
+    return texte.fillna("")
+
+
 # ---------- Lecture FEC / balance ----------
 
-def lire_fichier_fec(file):
-    """Lecture robuste d'un fichier FEC / balance (txt/csv/xls/xlsx)."""
+def _erreur_lecture(message, strict, cause):
+    """
+    Erreur de lecture : levée si `strict`, sinon affichée dans la page
+    Streamlit en cours, ou journalisée hors interface (batch, threads).
+
+    Le module n'importe pas Streamlit : hors de l'application (batch,
+    processus du pipeline), Streamlit n'est jamais chargé.
+    """
+    if strict:
+        raise ErreurLectureFEC(message) from cause
+
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        if get_script_run_ctx(suppress_warning=True) is not None:
+            st.error(message)
+            return
+    logger.error(message)
+
+EXTENSIONS_EXCEL = (".xlsx", ".xls")
+
+
+def _detecter_encodage(echantillon):
+    """UTF-8 (avec ou sans BOM) si l'échantillon est décodable, sinon cp1252."""
+    if echantillon.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # décodeur incrémental : un caractère coupé en fin d'échantillon n'est pas une erreur
+        codecs.getincrementaldecoder("utf-8")().decode(echantillon, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _detecter_separateur(ligne):
+    if ";" in ligne:
+        return ";"
+    elif "|" in ligne:
+        return "|"
+    elif "\t" in ligne:
+        return "\t"
+    return ","
+
+
+def _entete_excel(file):
+    from openpyxl import load_workbook
+
+    classeur = load_workbook(file, read_only=True, data_only=True)
+    try:
+        premiere = next(classeur.active.iter_rows(max_row=1, values_only=True), ())
+    finally:
+        classeur.close()
+        file.seek(0)
+    return [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(premiere)]
+
+
+@instrumente("normalisation")
+def lire_entete_fec(file, taille_echantillon=65536):
+    """
+    Première phase de lecture : d'après l'en-tête seul, détecte l'encodage,
+    le séparateur et les colonnes compte / libellé / débit / crédit / date
+    (heuristiques de `normaliser_colonnes`), mesurée comme étape
+    "normalisation". L'en-tête est lu depuis le début du fichier, qui est
+    ensuite rembobiné.
+    """
+    file.seek(0)
+    if file.name.lower().endswith(".xls"):
+        colonnes = [str(c) for c in pd.read_excel(file, nrows=0).columns]
+        file.seek(0)
+        encodage, sep = None, None
+    elif file.name.lower().endswith(".xlsx"):
+        colonnes = _entete_excel(file)
+        encodage, sep = None, None
+    else:
+        echantillon = file.read(taille_echantillon)
+        file.seek(0)
+        encodage = _detecter_encodage(echantillon)
+        texte = echantillon.decode(encodage, errors="ignore")
+        premiere_ligne = texte.splitlines()[0] if texte else ""
+        sep = _detecter_separateur(premiere_ligne)
+        colonnes = next(csv.reader([premiere_ligne], delimiter=sep), [])
+
+    col_compte, col_lib, col_debit, col_credit = _identifier_colonnes(colonnes)
+    return {
+        "encodage": encodage,
+        "sep": sep,
+        "colonnes": colonnes,
+        "compte": col_compte,
+        "lib": col_lib,
+        "debit": col_debit,
+        "credit": col_credit,
+        "date": _identifier_colonne_date(colonnes),
+        **dict(zip(("aux", "aux_lib"), _identifier_colonnes_tiers(colonnes))),
+    }
+
+
+def _colonnes_utiles(entete, colonnes_sup=()):
+    """Positions des colonnes à lire : compte, libellé, débit, crédit, date, tiers (+ colonnes_sup)."""
+    noms = [entete[k] for k in ("compte", "lib", "debit", "credit", "date", "aux", "aux_lib")] + list(colonnes_sup)
+    colonnes = entete["colonnes"]
+    return sorted({colonnes.index(n) for n in noms if n is not None and n in colonnes})
+
+
+def _desarchiver(file, strict):
+    """
+    Premier FEC d'une archive .zip / .gz, décompressé au fil de la lecture
+    (`archives_fec`) ; le fichier lui-même s'il n'est pas une archive.
+    None si l'archive est illisible ou ne contient pas de FEC.
+    """
+    if not file.name.lower().endswith((".zip", ".gz")):
+        return file
+
+    from archives_fec import ouvrir_membre  # import différé : archives_fec dépend de ce module
+
+    try:
+        membre = ouvrir_membre(file)
+    except LectureInterrompue:
+        raise
+    except Exception as e:
+        _erreur_lecture(f"Archive illisible {file.name} : {e}", strict, e)
+        return None
+    if membre is None:
+        _erreur_lecture(f"Aucun FEC dans l'archive {file.name}", strict, None)
+    return membre
+
+
+@instrumente("lecture")
+def lire_fichier_fec(file, strict=False):
+    """
+    Lecture robuste d'un fichier FEC / balance (txt/csv/xls/xlsx, ou archive
+    zip/gz qui en contient un). En cas d'erreur : None, ou ErreurLectureFEC
+    si `strict`.
+    """
+    file = _desarchiver(file, strict)
+    if file is None:
+        return None
     filename = file.name.lower()
 
     # Cas Excel
-    if filename.endswith((".xlsx", ".xls")):
+    if filename.endswith(EXTENSIONS_EXCEL):
         try:
             return pd.read_excel(file)
+        except LectureInterrompue:
+            raise
         except Exception as e:
-            st.error(f"Erreur lecture Excel {file.name} : {e}")
+            _erreur_lecture(f"Erreur lecture Excel {file.name} : {e}", strict, e)
             return None
 
-    # Cas texte : auto-détection du séparateur
+    # Cas texte : auto-détection de l'encodage et du séparateur
     try:
-        sample = file.read(4096).decode("utf-8", errors="ignore")
-        file.seek(0)
+        entete = lire_entete_fec(file)
+        df = pd.read_csv(
+            file, sep=entete["sep"], encoding=entete["encodage"], encoding_errors="replace",
+            dtype=str, low_memory=False,
+        )
+        return df
+    except LectureInterrompue:
+        raise
+    except Exception as e:
+        _erreur_lecture(f"Erreur lecture texte {file.name} : {e}", strict, e)
+        return None
 
-        if ";" in sample:
-            sep = ";"
-        elif "|" in sample:
-            sep = "|"
-        elif "\t" in sample:
-            sep = "\t"
-        else:
-            sep = ","
 
-        df = pd.read_csv(file, sep=sep, dtype=str, low_memory=False)
-        return df
+def _blocs_excel(file, taille_bloc, positions=None):
+    """Lecture d'un classeur en flux (openpyxl en lecture seule), colonnes `positions`."""
+    if file.name.lower().endswith(".xls"):
+        # ancien format : pas de lecture en flux, on découpe après lecture
+        df = pd.read_excel(file, usecols=positions)
+        taille_bloc = taille_bloc or max(len(df), 1)
+        for debut in range(0, len(df), taille_bloc):
+            yield df.iloc[debut:debut + taille_bloc]
+        return
+
+    from openpyxl import load_workbook
+
+    classeur = load_workbook(file, read_only=True, data_only=True)
+    try:
+        lignes = classeur.active.iter_rows(values_only=True)
+        entete = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(next(lignes, ()))]
+        if positions is None:
+            positions = range(len(entete))
+        noms = [entete[i] for i in positions]
+
+        bloc = []
+        for ligne in lignes:
+            valeurs = [ligne[i] if i < len(ligne) else None for i in positions]
+            if all(v is None for v in valeurs):
+                continue
+            bloc.append(valeurs)
+            if taille_bloc and len(bloc) >= taille_bloc:
+                yield pd.DataFrame(bloc, columns=noms)
+                bloc = []
+        if bloc:
+            yield pd.DataFrame(bloc, columns=noms)
+    finally:
+        classeur.close()
+
+
+def _blocs_fec(file, taille_bloc, projeter=False, colonnes_sup=()):
+    """
+    Itère sur le fichier par blocs de `taille_bloc` lignes (un seul bloc si
+    None). Avec `projeter`, seules les colonnes utiles sont lues.
+    """
+    entete = lire_entete_fec(file)
+    positions = _colonnes_utiles(entete, colonnes_sup) if projeter and entete["compte"] else None
+
+    if file.name.lower().endswith(EXTENSIONS_EXCEL):
+        yield from _blocs_excel(file, taille_bloc, positions)
+        return
+
+    options = dict(
+        sep=entete["sep"], encoding=entete["encodage"], encoding_errors="replace",
+        usecols=positions, dtype=str,
+    )
+    if taille_bloc is None:
+        yield pd.read_csv(file, **options)
+        return
+    with pd.read_csv(file, chunksize=taille_bloc, **options) as lecteur:
+        yield from lecteur
+
+
+@instrumente("lecture_projetee")
+def lire_fichier_fec_projete(file, colonnes_sup=(), strict=False):
+    """
+    Lecture en deux phases : l'en-tête d'abord (`lire_entete_fec`), puis
+    seulement les colonnes utiles (+ `colonnes_sup`), directement converties
+    en forme compacte (`compacter_fec`). None si illisible ou non reconnu
+    (ErreurLectureFEC si illisible et `strict`).
+    """
+    file = _desarchiver(file, strict)
+    if file is None:
+        return None
+    try:
+        blocs = list(_blocs_fec(file, None, projeter=True, colonnes_sup=colonnes_sup))
+    except LectureInterrompue:
+        raise
     except Exception as e:
-        st.error(f"Erreur lecture texte {file.name} : {e}")
+        _erreur_lecture(f"Erreur lecture {file.name} : {e}", strict, e)
         return None
 
+    df = pd.concat(blocs, ignore_index=True) if len(blocs) > 1 else blocs[0] if blocs else None
+    if df is None:
+        return None
+    return compacter_fec(df, colonnes_sup)
 
-def normaliser_colonnes(df):
+
+@instrumente("lecture_flux")
+def lire_fichier_fec_par_blocs(file, taille_bloc=200_000, conserver_lignes=False, strict=False):
     """
-    Essaie d'identifier les colonnes Compte / Libellé / Débit / Crédit
-    dans un FEC ou une balance.
+    Import en flux d'un FEC / balance : chaque bloc est réduit aussitôt en
+    totaux par compte, la mémoire ne dépend donc pas de la taille du fichier.
+
+    Retourne un dict (None si fichier illisible ou format non reconnu) :
+    - grouped : identique à `preparer_grouped`
+    - coherence : identique à `controle_coherence_detail`
+    - tiers : totaux par compte auxiliaire (`_sommer_tiers`), None sans CompAuxNum
+    - nb_lignes : nombre de lignes lues
+    - lignes : DataFrame brut si `conserver_lignes`, sinon None
+
+    Fichier illisible et `strict` : ErreurLectureFEC.
+    """
+    file = _desarchiver(file, strict)
+    if file is None:
+        return None
+
+    partiels_comptes = []
+    partiels_soldes = []
+    partiels_tiers = []
+    blocs_bruts = []
+    nb_lignes = 0
+
+    try:
+        for bloc in _blocs_fec(file, taille_bloc, projeter=not conserver_lignes):
+            tmp = _extraire_montants(bloc)
+            if tmp is None:
+                return None  # format non reconnu
+
+            nb_lignes += len(bloc)
+            partiels_comptes.append(_sommer_comptes(tmp))
+            partiels_soldes.append(_soldes_par_compte(tmp))
+            partiels_tiers.append(_sommer_tiers(tmp))
+            if conserver_lignes:
+                blocs_bruts.append(bloc)
+
+            # fusion régulière des partiels : mémoire bornée par le nombre de comptes
+            if len(partiels_comptes) >= 8:
+                partiels_comptes = [_sommer_comptes(pd.concat(partiels_comptes))]
+                partiels_soldes = [_fusionner_soldes(partiels_soldes)]
+                partiels_tiers = [_fusionner_tiers(partiels_tiers)]
+    except LectureInterrompue:
+        raise
+    except Exception as e:
+        _erreur_lecture(f"Erreur lecture {file.name} : {e}", strict, e)
+        return None
+
+    if not partiels_comptes:
+        return None
+
+    return {
+        "grouped": _finaliser_grouped(_sommer_comptes(pd.concat(partiels_comptes))),
+        "coherence": _resultat_coherence(_fusionner_soldes(partiels_soldes)),
+        "tiers": _fusionner_tiers(partiels_tiers),
+        "nb_lignes": nb_lignes,
+        "lignes": pd.concat(blocs_bruts, ignore_index=True) if conserver_lignes else None,
+    }
+
+
+def _identifier_colonnes(colonnes):
+    """
+    Heuristiques de `normaliser_colonnes`, sans modifier le DataFrame :
+    le libellé vaut None s'il n'est pas trouvé.
     """
-    cols_norm = {c: c.lower().strip().replace(" ", "").replace("°", "") for c in df.columns}
+    cols_norm = {c: str(c).lower().strip().replace(" ", "").replace("°", "") for c in colonnes}
 
     col_compte = None
     col_lib = None
     col_debit = None
     col_credit = None
 
+    # Libellé du compte dans un FEC (CompteLib), prioritaire sur les autres libellés
+    for c, n in cols_norm.items():
+        if n in ("comptelib", "libellecompte", "libellécompte"):
+            col_lib = c
+            break
+
     # Compte
     for c, n in cols_norm.items():
         if col_compte is None and any(n.startswith(x) for x in ["compte", "comptenum", "numcompte", "comptegeneral"]):
@@ -77,6 +455,29 @@ def normaliser_colonnes(df):
         if col_credit is None and n.startswith(("credit", "crédit")):
             col_credit = c
 
+    return col_compte, col_lib, col_debit, col_credit
+
+
+def _identifier_colonnes_tiers(colonnes):
+    """Colonnes du compte auxiliaire (CompAuxNum, CompAuxLib dans un FEC) ; None si absentes."""
+    col_aux = None
+    col_aux_lib = None
+    for c in colonnes:
+        n = str(c).lower().strip().replace(" ", "")
+        if col_aux is None and n in ("compauxnum", "compteauxiliaire", "numcompteaux", "auxiliaire"):
+            col_aux = c
+        if col_aux_lib is None and n in ("compauxlib", "libellecompteauxiliaire", "libelleauxiliaire"):
+            col_aux_lib = c
+    return col_aux, col_aux_lib
+
+
+def normaliser_colonnes(df):
+    """
+    Essaie d'identifier les colonnes Compte / Libellé / Débit / Crédit
+    dans un FEC ou une balance.
+    """
+    col_compte, col_lib, col_debit, col_credit = _identifier_colonnes(df.columns)
+
     if col_lib is None:
         df["CompteLib"] = ""
         col_lib = "CompteLib"
@@ -84,8 +485,135 @@ def normaliser_colonnes(df):
     return col_compte, col_lib, col_debit, col_credit
 
 
+def _identifier_colonne_date(colonnes):
+    """Colonne de date d'écriture (EcritureDate dans un FEC), None si absente."""
+    for c in colonnes:
+        n = str(c).lower().strip().replace(" ", "")
+        if n.startswith(("ecrituredate", "dateecriture", "écrituredate")) or n == "date":
+            return c
+    return None
+
+
+def _dates_ecriture(serie):
+    """Dates d'écriture en datetime64 (AAAAMMJJ du FEC, sinon JJ/MM/AAAA) ; NaT si invalides."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    dates = pd.to_datetime(serie, format="%Y%m%d", errors="coerce")
+    if dates.isna().all() and serie.notna().any():
+        dates = pd.to_datetime(serie, dayfirst=True, errors="coerce")
+    return dates
+
+
+# ---------- Forme compacte en session ----------
+
+COLONNES_COMPACTES = ("CompteNum", "CompteLib", "DebitCts", "CreditCts")
+COLONNES_TIERS = ("CompAuxNum", "CompAuxLib")
+
+
+def memoire_df(df):
+    """Occupation mémoire réelle d'un DataFrame, en octets."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+@instrumente("compactage")
+def compacter_fec(df, conserver=()):
+    """
+    Forme compacte et typée d'un FEC / balance, à conserver en session :
+    - CompteNum, CompteLib : catégories
+    - DebitCts, CreditCts : centimes int64
+    - EcritureDate : datetime64, si la colonne existe
+    - CompAuxNum, CompAuxLib : catégories, si les colonnes existent
+    - colonnes de `conserver` (ou toutes les autres si conserver="toutes"),
+      en catégories ; les autres colonnes sont abandonnées.
+
+    None si format non reconnu.
+    """
+    tmp = _extraire_montants(df)
+    if tmp is None:
+        return None
+
+    compact = pd.DataFrame({
+        "CompteNum": tmp["CompteNum"].astype("category"),
+        "CompteLib": tmp["CompteLib"].astype("category"),
+        "DebitCts": tmp["DebitCts"],
+        "CreditCts": tmp["CreditCts"],
+    })
+
+    col_date = _identifier_colonne_date(df.columns)
+    if col_date is not None:
+        compact["EcritureDate"] = _dates_ecriture(df[col_date])
+    for c in COLONNES_TIERS:
+        if c in tmp.columns:
+            compact[c] = tmp[c].astype("category")
+
+    utilisees = set(_identifier_colonnes(df.columns)) | set(_identifier_colonnes_tiers(df.columns)) | {col_date}
+    if conserver == "toutes":
+        conserver = [c for c in df.columns if c not in utilisees]
+    for c in conserver:
+        if c in df.columns and c not in compact.columns:
+            compact[c] = df[c].astype("category")
+
+    return compact
+
+
 # ---------- Préparation des données comptables ----------
 
+def _extraire_montants(df):
+    """
+    Colonnes utiles d'un FEC / balance, montants en centimes :
+    CompteNum, CompteLib, DebitCts, CreditCts, et CompAuxNum, CompAuxLib
+    si le fichier a un compte auxiliaire. None si format non reconnu.
+    """
+    if set(COLONNES_COMPACTES) <= set(df.columns):
+        # forme compacte (`compacter_fec`) : déjà en centimes
+        return df[list(COLONNES_COMPACTES) + [c for c in COLONNES_TIERS if c in df.columns]]
+
+    col_compte, col_lib, col_debit, col_credit = _identifier_colonnes(df.columns)
+    if col_compte is None:
+        return None
+
+    zeros = pd.Series(np.zeros(len(df), dtype="int64"), index=df.index)
+
+    tmp = pd.DataFrame({
+        "CompteNum": df[col_compte].astype(str),
+        "CompteLib": df[col_lib].astype(str) if col_lib is not None else "",
+        "DebitCts": parser_montants(df[col_debit]) if col_debit is not None else zeros,
+        "CreditCts": parser_montants(df[col_credit]) if col_credit is not None else zeros,
+    })
+    col_aux, col_aux_lib = _identifier_colonnes_tiers(df.columns)
+    if col_aux is not None:
+        tmp["CompAuxNum"] = df[col_aux].fillna("").astype(str)
+        tmp["CompAuxLib"] = df[col_aux_lib].fillna("").astype(str) if col_aux_lib is not None else ""
+    return tmp
+
+
+def _sommer_comptes(tmp):
+    """Totaux en centimes par (CompteNum, CompteLib) des comptes de classes 1 à 7."""
+    tmp = tmp[tmp["CompteNum"].str.match(r"^[1-7]", na=False).astype(bool)]
+    return (
+        tmp.groupby(["CompteNum", "CompteLib"], dropna=False, observed=True)[["DebitCts", "CreditCts"]]
+        .sum()
+        .reset_index()
+    )
+
+
+def _finaliser_grouped(grouped):
+    """Passe des totaux en centimes au DataFrame 'grouped' en euros."""
+    debit = grouped["DebitCts"].to_numpy()
+    credit = grouped["CreditCts"].to_numpy()
+    produit = grouped["CompteNum"].str.startswith("7").to_numpy(dtype=bool)
+    montant = np.where(produit, credit - debit, debit - credit)
+
+    return pd.DataFrame({
+        "CompteNum": grouped["CompteNum"].astype(str),
+        "CompteLib": grouped["CompteLib"].astype(str),
+        "Debit": centimes_vers_euros(debit),
+        "Credit": centimes_vers_euros(credit),
+        "Montant": centimes_vers_euros(montant),
+    })
+
+
+@instrumente("regroupement")
 def preparer_grouped(df):
     """
     Retourne un DataFrame 'grouped' avec :
@@ -94,200 +622,565 @@ def preparer_grouped(df):
     - Debit
     - Credit
     - Montant (charge > 0, produit > 0)
+
+    Les sommes sont faites en centimes entiers : les totaux sont exacts.
     """
-    col_compte, col_lib, col_debit, col_credit = normaliser_colonnes(df)
-    if col_compte is None:
+    tmp = _extraire_montants(df)
+    if tmp is None:
         return None  # format non reconnu
 
-    if col_debit is None:
-        df["_Debit"] = 0.0
-        col_debit = "_Debit"
-    if col_credit is None:
-        df["_Credit"] = 0.0
-        col_credit = "_Credit"
+    return _finaliser_grouped(_sommer_comptes(tmp))
+
+
+def _renseigne(serie):
+    """Masque des valeurs non vides (sur les catégories pour une colonne catégorielle)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        pleines = np.asarray(serie.cat.categories.astype(str).str.strip() != "", dtype=bool)
+        codes = serie.cat.codes.to_numpy()
+        return (codes >= 0) & pleines[codes]
+    return (serie.notna() & (serie.astype(str).str.strip() != "")).to_numpy()
 
-    tmp = pd.DataFrame({
-        "CompteNum": df[col_compte].astype(str),
-        "CompteLib": df[col_lib].astype(str),
-        "Debit": df[col_debit].apply(to_float),
-        "Credit": df[col_credit].apply(to_float),
-    })
 
-    tmp = tmp[tmp["CompteNum"].str.match(r"^[1-7]")]
+def _sommer_tiers(tmp):
+    """
+    Totaux en centimes par (CompteNum, CompAuxNum, CompAuxLib) des seules
+    lignes portant un compte auxiliaire, avec leur nombre (NbLignes).
+    None si le fichier n'a pas de colonne CompAuxNum.
+    """
+    if "CompAuxNum" not in tmp.columns:
+        return None
+    tmp = tmp[_renseigne(tmp["CompAuxNum"])]
+    if "CompAuxLib" not in tmp.columns:
+        tmp = tmp.assign(CompAuxLib="")
+    sommes = (
+        tmp.groupby(["CompteNum", "CompAuxNum", "CompAuxLib"], dropna=False, observed=True)
+        .agg(DebitCts=("DebitCts", "sum"), CreditCts=("CreditCts", "sum"), NbLignes=("DebitCts", "size"))
+        .reset_index()
+    )
+    for c in ("CompteNum", "CompAuxNum", "CompAuxLib"):
+        sommes[c] = sommes[c].astype(str)
+    return sommes
 
-    grouped = (
-        tmp.groupby(["CompteNum", "CompteLib"], dropna=False)[["Debit", "Credit"]]
+
+def _fusionner_tiers(partiels):
+    partiels = [p for p in partiels if p is not None]
+    if not partiels:
+        return None
+    return (
+        pd.concat(partiels)
+        .groupby(["CompteNum", "CompAuxNum", "CompAuxLib"], sort=False)[["DebitCts", "CreditCts", "NbLignes"]]
         .sum()
         .reset_index()
     )
 
-    def montant_row(row):
-        compte = row["CompteNum"]
-        if compte.startswith("7"):
-            return row["Credit"] - row["Debit"]
-        else:
-            return row["Debit"] - row["Credit"]
 
-    grouped["Montant"] = grouped.apply(montant_row, axis=1)
-    return grouped
+@instrumente("regroupement")
+def preparer_grouped_tiers(df):
+    """
+    `preparer_grouped` et totaux par compte auxiliaire (`_sommer_tiers`)
+    en un seul passage sur les lignes : (grouped, sommes_tiers).
+    (None, None) si format non reconnu ; sommes_tiers vaut None sans
+    colonne CompAuxNum.
+    """
+    tmp = _extraire_montants(df)
+    if tmp is None:
+        return None, None
+    return _finaliser_grouped(_sommer_comptes(tmp)), _sommer_tiers(tmp)
 
 
 # ---------- Contrôle de cohérence balance ----------
 
+CLASSES_COHERENCE = list("1234567")
+
+
+def _soldes_par_compte(tmp):
+    """Solde débit - crédit en centimes de chaque compte (numéro nettoyé)."""
+    solde = tmp["DebitCts"] - tmp["CreditCts"]
+    if isinstance(tmp["CompteNum"].dtype, pd.CategoricalDtype):
+        # forme compacte : regroupement sur les codes, puis nettoyage des numéros
+        par_compte = solde.groupby(tmp["CompteNum"], sort=False, observed=True).sum()
+        par_compte.index = par_compte.index.astype(str).str.strip()
+        par_compte = par_compte.groupby(level=0, sort=False).sum()
+    else:
+        comptes = tmp["CompteNum"].fillna("").str.strip()
+        par_compte = solde.groupby(comptes.to_numpy(), sort=False).sum()
+    return par_compte[par_compte.index != ""]
+
+
+def _fusionner_soldes(partiels):
+    return pd.concat(partiels).groupby(level=0, sort=False).sum()
+
+
+def _resultat_coherence(par_compte, nb_comptes=10):
+    classe = par_compte.index.str[:1]
+
+    dans_classes = classe.isin(CLASSES_COHERENCE)
+    par_classe = (
+        par_compte[dans_classes]
+        .groupby(classe[dans_classes]).sum()
+        .reindex(CLASSES_COHERENCE, fill_value=0)
+    )
+
+    def en_table(soldes):
+        soldes = soldes.reindex(soldes.abs().sort_values(ascending=False).index)
+        return pd.DataFrame({
+            "CompteNum": soldes.index,
+            "Classe": soldes.index.str[:1],
+            "Solde": centimes_vers_euros(soldes.to_numpy()),
+        })
+
+    hors_classes = par_compte[~dans_classes]
+
+    return {
+        "ecart": centimes_vers_euros(int(par_classe.sum())),
+        "par_classe": centimes_vers_euros(par_classe.rename_axis("Classe").rename("Solde")),
+        "top_comptes": en_table(par_compte[dans_classes]).head(nb_comptes),
+        "hors_classes": en_table(hors_classes[hors_classes != 0]),
+    }
+
+
+@instrumente("coherence")
+def controle_coherence_detail(df, nb_comptes=10):
+    """
+    Contrôle de cohérence en une seule passe sur les colonnes.
+
+    Retourne un dict (None si format non reconnu) :
+    - ecart : écart (6-7 + 1-5) en euros, 0 => cohérent
+    - par_classe : solde débit - crédit de chaque classe 1 à 7
+    - top_comptes : comptes des classes 1 à 7 au plus fort solde absolu
+    - hors_classes : comptes mouvementés hors classes 1 à 7 (ignorés)
+    """
+    tmp = _extraire_montants(df)
+    if tmp is None:
+        return None
+
+    return _resultat_coherence(_soldes_par_compte(tmp), nb_comptes)
+
+
 def controle_coherence(df):
-    """Retourne l'écart (6-7 + 1-5). 0 => cohérent."""
-    col_compte, _, col_debit, col_credit = normaliser_colonnes(df)
-    if col_compte is None:
+    """Retourne l'écart (6-7 + 1-5), calculé en centimes. 0 => cohérent."""
+    resultat = controle_coherence_detail(df, nb_comptes=0)
+    if resultat is None:
         return None
+    return resultat["ecart"]
+
+
+# ---------- Index des comptes par préfixe ----------
+
+def indexer_prefixes(grouped):
+    """
+    Index des comptes de 'grouped', construit une seule fois : numéros de
+    compte triés et sommes cumulées des montants (en centimes).
+
+    Les comptes commençant par un même préfixe forment une plage contiguë
+    des numéros triés : toute somme par préfixe se fait en O(log n).
+    """
+    comptes = grouped["CompteNum"].to_numpy(dtype=object)
+    if np.all(comptes[1:] >= comptes[:-1]):
+        ordre = np.arange(len(comptes))  # déjà trié (sortie de preparer_grouped)
+    else:
+        ordre = np.argsort(comptes.astype(str), kind="stable")
+    montants = np.rint(grouped["Montant"].to_numpy(dtype="float64") * 100).astype("int64")
+    return {
+        "comptes": comptes[ordre],
+        "ordre": ordre,
+        "cumul": np.concatenate(([0], np.cumsum(montants[ordre]))),
+    }
+
+
+def plage_prefixe(index, prefixe):
+    """(début, fin) des comptes commençant par `prefixe` dans l'index trié."""
+    comptes = index["comptes"]
+    debut = np.searchsorted(comptes, prefixe, side="left")
+    fin = np.searchsorted(comptes, prefixe + "\U0010ffff", side="left")
+    return int(debut), int(fin)
+
+
+def _prefixes_disjoints(prefixes):
+    """Retire les préfixes déjà couverts par un préfixe plus court de la liste."""
+    retenus = []
+    for p in sorted(set(prefixes), key=len):
+        if not any(p.startswith(q) for q in retenus):
+            retenus.append(p)
+    return retenus
+
+
+def somme_prefixes(index, prefixes, exclus=()):
+    """
+    Somme des montants des comptes commençant par l'un des `prefixes`,
+    hors comptes commençant par l'un des `exclus` (ex. 60 sauf 607).
+    """
+    inclus = _prefixes_disjoints(prefixes)
+    exclus = [e for e in _prefixes_disjoints(exclus)
+              if any(e.startswith(p) and e != p for p in inclus)]
+
+    cumul = index["cumul"]
+    total = 0
+    for p in inclus:
+        debut, fin = plage_prefixe(index, p)
+        total += cumul[fin] - cumul[debut]
+    for e in exclus:
+        debut, fin = plage_prefixe(index, e)
+        total -= cumul[fin] - cumul[debut]
+    return centimes_vers_euros(int(total))
+
+
+# ---------- Règles SIG ----------
+
+# Postes élémentaires : comptes commençant par l'un des préfixes inclus,
+# hors comptes commençant par l'un des préfixes exclus.
+POSTES_SIG = {
+    "ventes_marchandises": (("707",), ()),
+    "production_vendue": (("70",), ("707",)),
+    "production_stockee": (("713",), ()),
+    "production_immobilisee": (("72",), ()),
+    "cout_marchandises": (("607", "6037", "6031"), ()),
+    "achats_mat": (("60",), ("607",)),
+    "charges_externes": (("61", "62"), ()),
+    "subventions_expl": (("74",), ()),
+    "impots_taxes": (("63",), ()),
+    "charges_personnel": (("64",), ()),
+    "transferts_charges": (("79",), ()),
+    "reprises_provisions": (("78",), ()),
+    "autres_produits_expl": (("75",), ()),
+    "dotations_amort": (("68",), ("686", "687")),
+    "dotations_provisions": (("681",), ()),
+    "autres_charges_expl": (("65",), ()),
+    "produits_financiers": (("76",), ()),
+    "charges_financieres": (("66",), ()),
+    "produits_exceptionnels": (("77",), ()),
+    "charges_exceptionnelles": (("67",), ()),
+}
 
-    if col_debit is None:
-        df["_Debit"] = 0.0
-        col_debit = "_Debit"
-    if col_credit is None:
-        df["_Credit"] = 0.0
-        col_credit = "_Credit"
+# Lignes SIG, dans l'ordre d'affichage : {terme: signe}, où un terme est un
+# poste élémentaire ou une ligne définie plus haut.
+LIGNES_SIG = {
+    "Chiffre d'affaires": {
+        "ventes_marchandises": 1, "production_vendue": 1,
+        "production_stockee": 1, "production_immobilisee": 1,
+    },
+    "Ventes + Production réelle": {"Chiffre d'affaires": 1},
+    "Achats consommés": {"cout_marchandises": -1, "achats_mat": -1, "charges_externes": -1},
+    "Marge globale": {"Chiffre d'affaires": 1, "Achats consommés": 1},
+    "Charges de fonctionnement": {"achats_mat": -1, "charges_externes": -1},
+    "Valeur ajoutée": {"Marge globale": 1, "Charges de fonctionnement": 1},
+    "Subvention de l'exploitation": {"subventions_expl": 1},
+    "Impôts et taxes": {"impots_taxes": -1},
+    "Charges de personnel": {"charges_personnel": -1},
+    "Excédent brut d'exploitation": {
+        "Valeur ajoutée": 1, "Subvention de l'exploitation": 1,
+        "Impôts et taxes": 1, "Charges de personnel": 1,
+    },
+    "Transfert de charges": {"transferts_charges": 1},
+    "Reprises sur provisions": {"reprises_provisions": 1},
+    "Autres produits d'exploitation": {"autres_produits_expl": 1},
+    "Dotations aux amortissements": {"dotations_amort": -1},
+    "Dotations aux provisions": {"dotations_provisions": -1},
+    "Autres charges d'exploitation": {"autres_charges_expl": -1},
+    "Résultat d'exploitation": {
+        "Excédent brut d'exploitation": 1, "Transfert de charges": 1,
+        "Reprises sur provisions": 1, "Autres produits d'exploitation": 1,
+        "Dotations aux amortissements": 1, "Dotations aux provisions": 1,
+        "Autres charges d'exploitation": 1,
+    },
+    "Résultat financier": {"produits_financiers": 1, "charges_financieres": -1},
+    "Résultat courant": {"Résultat d'exploitation": 1, "Résultat financier": 1},
+    "Résultat exceptionnel": {"produits_exceptionnels": 1, "charges_exceptionnelles": -1},
+    "Résultat de l'exercice": {"Résultat courant": 1, "Résultat exceptionnel": 1},
+    "Capacité d'autofinancement": {
+        "Résultat de l'exercice": 1, "Dotations aux amortissements": -1,
+        "Dotations aux provisions": -1, "reprises_provisions": -1,
+    },
+}
 
-    sum_1to5 = 0.0
-    sum_6to7 = 0.0
 
-    for _, row in df.iterrows():
-        compte = str(row[col_compte]).strip()
-        if compte == "":
-            continue
-        debit_val = to_float(row[col_debit])
-        credit_val = to_float(row[col_credit])
-        m = debit_val - credit_val
-        if compte[0] in "12345":
-            sum_1to5 += m
-        elif compte[0] in "67":
-            sum_6to7 += m
+def _coefficients_postes():
+    """Développe LIGNES_SIG en coefficients sur les postes élémentaires (lignes × postes)."""
+    postes = list(POSTES_SIG)
+    identite = np.eye(len(postes), dtype="int16")
+    par_terme = {p: identite[i] for i, p in enumerate(postes)}
 
-    ecart = sum_6to7 + sum_1to5
-    return ecart
+    for ligne, termes in LIGNES_SIG.items():
+        vecteur = np.zeros(len(postes), dtype="int16")
+        for terme, signe in termes.items():
+            vecteur += signe * par_terme[terme]
+        par_terme[ligne] = vecteur
+
+    return np.array([par_terme[ligne] for ligne in LIGNES_SIG])
+
+
+COEFFICIENTS_POSTES = _coefficients_postes()
+
+
+def _segments_sig(comptes):
+    """
+    Découpe les numéros de compte triés `comptes` aux bornes des plages de
+    préfixes des postes : à l'intérieur d'un segment, tous les comptes ont
+    les mêmes coefficients SIG. Retourne (bornes, coefficients) : bornes
+    des segments (S + 1 positions) et matrice lignes SIG × segments.
+    Quelques dizaines de segments, quel que soit le nombre de comptes.
+    """
+    index = {"comptes": comptes}
+    plages = [
+        ([plage_prefixe(index, p) for p in _prefixes_disjoints(inclus)],
+         [plage_prefixe(index, e) for e in exclus])
+        for inclus, exclus in POSTES_SIG.values()
+    ]
+    bornes = np.unique(np.array(
+        [0, len(comptes)] + [b for inclus, exclus in plages for plage in inclus + exclus for b in plage],
+        dtype="int64",
+    ))
+    debuts = bornes[:-1]
+
+    appartenance = np.zeros((len(POSTES_SIG), len(debuts)), dtype="int64")
+    for i, (inclus, exclus) in enumerate(plages):
+        for debut, fin in inclus:
+            appartenance[i, (debuts >= debut) & (debuts < fin)] = 1
+        for debut, fin in exclus:
+            appartenance[i, (debuts >= debut) & (debuts < fin)] = 0
+
+    return bornes, COEFFICIENTS_POSTES.astype("int64") @ appartenance
+
+
+@instrumente("regles_sig")
+def compiler_regles_sig(grouped):
+    """
+    Compile les règles SIG pour un 'grouped' donné (une seule fois) :
+    - coefficients : matrice lignes SIG × comptes (ordre des lignes de 'grouped')
+    - montants : Montant de chaque compte, en centimes
+    - comptes_par_ligne : positions des comptes qui composent chaque ligne,
+      dans l'ordre des numéros de compte (partition réutilisée par
+      `filtre_detail`, sans filtre ni tri à chaque affichage)
+
+    Les coefficients sont ceux des segments de `_segments_sig`, recopiés
+    sur leurs comptes.
+    """
+    index = indexer_prefixes(grouped)
+    ordre = index["ordre"]
+    bornes, par_segment = _segments_sig(index["comptes"])
+
+    tries = np.repeat(par_segment.astype("int16"), np.diff(bornes), axis=1)
+    coefficients = np.empty_like(tries)
+    coefficients[:, ordre] = tries
+
+    return {
+        "coefficients": coefficients,
+        "montants": np.rint(grouped["Montant"].to_numpy(dtype="float64") * 100).astype("int64"),
+        "comptes_par_ligne": {
+            ligne: ordre[np.flatnonzero(tries[i])] for i, ligne in enumerate(LIGNES_SIG)
+        },
+    }
 
 
 # ---------- Calcul SIG ----------
 
-def calcul_sig(grouped):
-    """Calcule les agrégats SIG, renvoie un dict {libellé: montant}."""
-
-    def somme_prefix(prefixes):
-        return grouped[grouped["CompteNum"].str.startswith(prefixes)]["Montant"].sum()
-
-    ventes_marchandises = somme_prefix(("707",))
-    production_vendue = grouped[grouped["CompteNum"].str.match(r"^70(?!7)")]\
-        ["Montant"].sum()
-    production_stockee = somme_prefix(("713",))
-    production_immobilisee = somme_prefix(("72",))
-    production_exercice = production_vendue + production_stockee + production_immobilisee
-
-    chiffre_affaires = ventes_marchandises + production_exercice
-
-    cout_marchandises = somme_prefix(("607", "6037", "6031"))
-    achats_mat = grouped[grouped["CompteNum"].str.match(r"^60(?!7)")]\
-        ["Montant"].sum()
-    charges_externes = somme_prefix(("61", "62"))
-    achats_consommes = cout_marchandises + achats_mat + charges_externes
-
-    marge_globale = chiffre_affaires - achats_consommes
-
-    charges_fonctionnement = achats_mat + charges_externes
-    valeur_ajoutee = marge_globale - charges_fonctionnement
-
-    subventions_expl = somme_prefix(("74",))
-    impots_taxes = somme_prefix(("63",))
-    charges_personnel = somme_prefix(("64",))
-
-    ebe = valeur_ajoutee + subventions_expl - impots_taxes - charges_personnel
-
-    transferts_charges = somme_prefix(("79", "791"))
-    reprises_provisions = somme_prefix(("78", "781"))
-    autres_produits_expl = somme_prefix(("75",))
-    dotations_amort = grouped[grouped["CompteNum"].str.match(r"^68(?!6|7)")]\
-        ["Montant"].sum()
-    dotations_provisions = somme_prefix(("681",))
-    autres_charges_expl = somme_prefix(("65",))
-
-    resultat_exploitation = (
-        ebe
-        + transferts_charges
-        + reprises_provisions
-        + autres_produits_expl
-        - dotations_amort
-        - dotations_provisions
-        - autres_charges_expl
-    )
+@instrumente("sig")
+def calcul_sig(grouped, regles=None):
+    """
+    Calcule les agrégats SIG, renvoie un dict {libellé: montant}.
 
-    produits_financiers = somme_prefix(("76",))
-    charges_financieres = somme_prefix(("66",))
-    resultat_financier = produits_financiers - charges_financieres
-
-    resultat_courant = resultat_exploitation + resultat_financier
-
-    produits_exceptionnels = somme_prefix(("77",))
-    charges_exceptionnelles = somme_prefix(("67",))
-    resultat_exceptionnel = produits_exceptionnels - charges_exceptionnelles
-
-    resultat_exercice = resultat_courant + resultat_exceptionnel
-
-    caf = resultat_exercice + dotations_amort + dotations_provisions - reprises_provisions
-
-    sig = {
-        "Chiffre d'affaires": chiffre_affaires,
-        "Ventes + Production réelle": chiffre_affaires,
-        "Achats consommés": -achats_consommes,
-        "Marge globale": marge_globale,
-        "Charges de fonctionnement": -charges_fonctionnement,
-        "Valeur ajoutée": valeur_ajoutee,
-        "Subvention de l'exploitation": subventions_expl,
-        "Impôts et taxes": -impots_taxes,
-        "Charges de personnel": -charges_personnel,
-        "Excédent brut d'exploitation": ebe,
-        "Transfert de charges": transferts_charges,
-        "Reprises sur provisions": reprises_provisions,
-        "Autres produits d'exploitation": autres_produits_expl,
-        "Dotations aux amortissements": -dotations_amort,
-        "Dotations aux provisions": -dotations_provisions,
-        "Autres charges d'exploitation": -autres_charges_expl,
-        "Résultat d'exploitation": resultat_exploitation,
-        "Résultat financier": resultat_financier,
-        "Résultat courant": resultat_courant,
-        "Résultat exceptionnel": resultat_exceptionnel,
-        "Résultat de l'exercice": resultat_exercice,
-        "Capacité d'autofinancement": caf,
+    `regles` : résultat de `compiler_regles_sig(grouped)` s'il est déjà
+    compilé ; sinon, les totaux sont faits par segment de comptes sur
+    l'index trié, sans matrice lignes × comptes.
+    """
+    if regles is not None:
+        totaux = regles["coefficients"] @ regles["montants"]
+    else:
+        index = indexer_prefixes(grouped)
+        bornes, par_segment = _segments_sig(index["comptes"])
+        cumul = index["cumul"]
+        totaux = par_segment @ (cumul[bornes[1:]] - cumul[bornes[:-1]])
+    return {ligne: centimes_vers_euros(int(t)) for ligne, t in zip(LIGNES_SIG, totaux)}
+
+
+# ---------- SIG par période ----------
+
+# un exercice dure au plus 24 mois ; au-delà, une date d'écriture est une erreur de saisie
+MOIS_EXERCICE_MAX = 24
+
+
+def _fenetre_exercice(mois):
+    """
+    (premier, dernier) mois (int64, datetime64[M]) de l'exercice des
+    lignes datées `mois` : MOIS_EXERCICE_MAX mois centrés sur le mois médian.
+    """
+    median = int(np.median(mois))
+    return median - MOIS_EXERCICE_MAX // 2, median + MOIS_EXERCICE_MAX // 2 - 1
+
+
+@instrumente("sig_periodes")
+def calcul_sig_mensuel(df, fenetre=None):
+    """
+    SIG mois par mois, en un seul regroupement (mois, compte) :
+    DataFrame mois (PeriodIndex continu) × lignes SIG, en centimes int64.
+    None si le format n'est pas reconnu ou sans date d'écriture valide.
+
+    Seuls les mois de l'exercice sont retenus : `fenetre` = (premier,
+    dernier) mois en int64 datetime64[M], à défaut `_fenetre_exercice`. Une
+    date aberrante (29991231) n'étend donc pas l'axe des mois. attrs :
+    fenetre, et hors_exercice = nombre de lignes écartées.
+    """
+    tmp = _extraire_montants(df)
+    col_date = _identifier_colonne_date(df.columns)
+    if tmp is None or col_date is None:
+        return None
+
+    mois = _dates_ecriture(df[col_date]).to_numpy().astype("datetime64[M]")
+    comptes = tmp["CompteNum"]
+    if isinstance(comptes.dtype, pd.CategoricalDtype):
+        codes, uniques = comptes.cat.codes.to_numpy(), comptes.cat.categories
+    else:
+        codes, uniques = pd.factorize(comptes)
+    uniques = pd.Index(uniques).astype(str)
+
+    # lignes datées des comptes de classes 1 à 7, comme 'grouped'
+    classe_sig = np.asarray(uniques.str.match(r"^[1-7]"), dtype=bool)
+    valides = ~np.isnat(mois) & (codes >= 0)
+    valides[valides] = classe_sig[codes[valides]]
+    if not valides.any():
+        return None
+
+    mois_valides = mois[valides].astype("int64")
+    debut, fin = fenetre if fenetre is not None else _fenetre_exercice(mois_valides)
+    dans_exercice = (mois_valides >= debut) & (mois_valides <= fin)
+    hors_exercice = int((~dans_exercice).sum())
+    valides[valides] = dans_exercice
+    mois = mois_valides[dans_exercice]
+    if not len(mois):  # lignes toutes hors de `fenetre` (delta d'une mise à jour)
+        mensuel = pd.DataFrame(0, index=pd.PeriodIndex([], freq="M"), columns=list(LIGNES_SIG), dtype="int64")
+        mensuel.attrs.update(fenetre=(debut, fin), hors_exercice=hors_exercice)
+        return mensuel
+
+    codes = codes[valides]
+    premier, nb_mois, nb_comptes = mois.min(), mois.max() - mois.min() + 1, len(uniques)
+
+    # une seule passe : solde débit - crédit par (mois, compte), au plus
+    # MOIS_EXERCICE_MAX mois
+    solde = (tmp["DebitCts"].to_numpy() - tmp["CreditCts"].to_numpy())[valides]
+    soldes = np.rint(np.bincount(
+        (mois - premier) * nb_comptes + codes, weights=solde, minlength=nb_mois * nb_comptes,
+    )).astype("int64").reshape(nb_mois, nb_comptes)
+
+    # Montant : charge > 0, produit > 0 (comme `_finaliser_grouped`)
+    produit = np.asarray(uniques.str.startswith("7"), dtype=bool)
+    montants = np.where(produit, -soldes, soldes)
+
+    regles = compiler_regles_sig(pd.DataFrame({"CompteNum": uniques, "Montant": 0.0}))
+    periodes = pd.period_range(pd.Period(np.datetime64(int(premier), "M"), freq="M"), periods=nb_mois, freq="M")
+    mensuel = pd.DataFrame(montants @ regles["coefficients"].T, index=periodes, columns=list(LIGNES_SIG))
+    mensuel.attrs.update(fenetre=(debut, fin), hors_exercice=hors_exercice)
+    return mensuel
+
+
+def sig_periodes(mensuel):
+    """
+    Vues dérivées du SIG mensuel en centimes (`calcul_sig_mensuel`), en euros :
+    - mensuel, trimestriel
+    - cumul : cumul depuis le début de l'exercice
+    - hors_exercice : lignes écartées, datées hors de l'exercice
+    """
+    if mensuel is None:
+        return None
+    return {
+        "hors_exercice": mensuel.attrs.get("hors_exercice", 0),
+        "mensuel": centimes_vers_euros(mensuel),
+        "trimestriel": centimes_vers_euros(mensuel.groupby(mensuel.index.asfreq("Q")).sum()),
+        "cumul": centimes_vers_euros(mensuel.cumsum()),
     }
 
-    return sig
-
-
-def filtre_detail(grouped, ligne):
-    """Retourne le détail des comptes pour une ligne SIG donnée."""
-    g = grouped.copy()
-    if ligne in ("Chiffre d'affaires", "Ventes + Production réelle"):
-        mask = g["CompteNum"].str.startswith(("70", "71", "72", "75"))
-    elif ligne == "Achats consommés":
-        mask = g["CompteNum"].str.startswith(("60", "61", "62"))
-    elif ligne == "Charges de fonctionnement":
-        mask = g["CompteNum"].str.startswith(("60", "61", "62"))
-    elif ligne == "Impôts et taxes":
-        mask = g["CompteNum"].str.startswith(("63",))
-    elif ligne == "Charges de personnel":
-        mask = g["CompteNum"].str.startswith(("64",))
-    elif ligne == "Subvention de l'exploitation":
-        mask = g["CompteNum"].str.startswith(("74",))
-    elif ligne.startswith("Dotations"):
-        mask = g["CompteNum"].str.startswith(("68", "681"))
-    elif ligne.startswith("Autres produits d'exploitation"):
-        mask = g["CompteNum"].str.startswith(("75", "78"))
-    elif ligne.startswith("Autres charges d'exploitation"):
-        mask = g["CompteNum"].str.startswith(("65",))
-    elif ligne == "Résultat financier":
-        mask = g["CompteNum"].str.startswith(("76", "66"))
-    elif ligne == "Résultat exceptionnel":
-        mask = g["CompteNum"].str.startswith(("77", "67"))
+
+def calcul_sig_periodes(df):
+    """SIG mensuel, trimestriel et cumulé (voir `sig_periodes`)."""
+    return sig_periodes(calcul_sig_mensuel(df))
+
+
+def sig_glissant_12(mensuel, precedent):
+    """
+    SIG sur 12 mois glissants, pour chaque mois de l'exercice : tables
+    "mensuel" (`sig_periodes`, en euros) de l'exercice et de l'exercice
+    précédent, mises bout à bout (mois sans écriture à 0). Les mois sans
+    12 mois d'historique sont omis. None sans exercice précédent, ou s'il
+    chevauche l'exercice.
+    """
+    if mensuel is None or precedent is None or mensuel.empty or precedent.empty:
+        return None
+    if precedent.index.max() >= mensuel.index.min():
+        return None
+    suite = pd.concat([precedent, mensuel])
+    suite = suite.reindex(pd.period_range(suite.index.min(), suite.index.max(), freq="M"), fill_value=0)
+    centimes = pd.DataFrame(np.rint(suite.to_numpy() * 100).astype("int64"), index=suite.index, columns=suite.columns)
+    glissant = centimes.rolling(12).sum().iloc[11:].astype("int64")
+    return centimes_vers_euros(glissant[glissant.index >= mensuel.index.min()])
+
+
+# ---------- SIG pluriannuel ----------
+
+@instrumente("sig_annees")
+def calcul_sig_annees(grouped_par_an):
+    """
+    SIG de plusieurs exercices `{annee: grouped}` en un seul produit
+    matriciel (coefficients des segments de l'union triée des comptes ×
+    totaux par segment et par exercice) : DataFrame lignes SIG × exercices, en euros,
+    colonnes dans l'ordre reçu. None sans aucun 'grouped'.
+    """
+    annees = [annee for annee, grouped in grouped_par_an.items() if grouped is not None]
+    if not annees:
+        return None
+
+    comptes = pd.concat([grouped_par_an[a]["CompteNum"] for a in annees], ignore_index=True)
+    codes, uniques = pd.factorize(comptes, sort=True)
+    exercices = np.repeat(np.arange(len(annees)), [len(grouped_par_an[a]) for a in annees])
+    centimes = np.concatenate([
+        np.rint(grouped_par_an[a]["Montant"].to_numpy(dtype="float64") * 100).astype("int64") for a in annees
+    ])
+
+    montants = np.zeros((len(uniques), len(annees)), dtype="int64")
+    np.add.at(montants, (codes, exercices), centimes)
+
+    # comptes de l'union triés : totaux par segment de `_segments_sig`, par exercice
+    bornes, par_segment = _segments_sig(np.asarray(uniques, dtype=object))
+    cumul = np.vstack([np.zeros((1, len(annees)), dtype="int64"), np.cumsum(montants, axis=0)])
+    return pd.DataFrame(
+        centimes_vers_euros(par_segment @ (cumul[bornes[1:]] - cumul[bornes[:-1]])),
+        index=pd.Index(LIGNES_SIG, name="Poste"),
+        columns=annees,
+    )
+
+
+def comparer_annees(sig_annees):
+    """
+    Ajoute à `calcul_sig_annees` l'écart et la variation en % de chaque
+    exercice par rapport au suivant (N / N-1, N-1 / N-2...). La variation
+    est NaN quand l'exercice de comparaison est nul.
+    """
+    annees = list(sig_annees.columns)
+    colonnes = {annee: sig_annees[annee] for annee in annees}
+    for annee, precedente in zip(annees, annees[1:]):
+        ecart = sig_annees[annee] - sig_annees[precedente]
+        base = sig_annees[precedente].where(sig_annees[precedente].abs() > 1e-6)
+        colonnes[f"Écart {annee}/{precedente}"] = ecart
+        colonnes[f"% {annee}/{precedente}"] = ecart / base * 100
+    return pd.DataFrame(colonnes)
+
+
+@instrumente("detail")
+def filtre_detail(grouped, ligne, regles=None, debut=0, fin=None):
+    """
+    Retourne le détail des comptes pour une ligne SIG donnée, trié par
+    compte. `debut` / `fin` : tranche du détail à produire (pagination) ;
+    seuls les comptes de la tranche sont copiés.
+    """
+    if ligne in LIGNES_SIG:
+        if regles is None:
+            regles = compiler_regles_sig(grouped)
+        detail = grouped.iloc[regles["comptes_par_ligne"][ligne][debut:fin]].copy()
     else:
-        mask = g["CompteNum"].str.match(r"^[67]")
+        detail = grouped[grouped["CompteNum"].str.match(r"^[67]")].sort_values("CompteNum").iloc[debut:fin].copy()
 
-    detail = g[mask].copy()
     detail["Montant"] = detail["Montant"].round(2)
-    return detail.sort_values("CompteNum")
+    return detail
+
+
+def nb_comptes_detail(ligne, regles):
+    """Nombre de comptes du détail d'une ligne SIG (`filtre_detail`), sans le produire."""
+    return len(regles["comptes_par_ligne"][ligne])
@@ -0,0 +1,221 @@
+"""
+Client de recherche SIREN (RapidAPI – verify_siren).
+
+- une session HTTP partagée (keep-alive, pool de connexions) pour tout le processus ;
+- un cache persistant (SQLite) des fiches entreprise, avec durée de vie ;
+- des relances avec temporisation exponentielle (erreurs réseau, 429, 5xx) ;
+- une recherche en masse parallèle, sous une limite de débit configurable.
+
+L'URL de l'API est configurable (BIPLUS_SIREN_URL) : le client peut être
+testé contre un serveur HTTP local (benchmarks/serveur_siren_local.py).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+URL_API = os.environ.get(
+    "BIPLUS_SIREN_URL", "https://api-siret-verification.p.rapidapi.com/api/v1/verify/siren"
+)
+HOTE_API = "api-siret-verification.p.rapidapi.com"
+CLE_API = os.environ.get("RAPIDAPI_KEY", "TA_CLE_RAPIDAPI_ICI")  # <-- À REMPLACER
+CHEMIN_CACHE = Path(os.environ.get("BIPLUS_SIREN_CACHE", Path.home() / ".cache" / "biplus" / "siren.sqlite"))
+DUREE_VIE_CACHE = 7 * 24 * 3600  # secondes
+
+STATUTS_A_RELANCER = {429, 500, 502, 503, 504}
+ATTENTE_MAX = 30  # secondes, plafond d'une attente (Retry-After compris)
+
+
+def normaliser_siren(siren):
+    """SIREN à 9 chiffres (un SIRET est tronqué), None si invalide."""
+    siren = str(siren or "").strip().replace(" ", "")
+    if len(siren) == 14 and siren.isdigit():
+        siren = siren[:9]
+    if not siren.isdigit() or len(siren) != 9:
+        return None
+    return siren
+
+
+def delai_retry_after(valeur, defaut, plafond=ATTENTE_MAX):
+    """
+    Attente en secondes d'un en-tête Retry-After (nombre de secondes ou
+    date HTTP), bornée à [0, plafond] ; `defaut` si absent ou illisible.
+    """
+    valeur = (valeur or "").strip()
+    try:
+        attente = float(valeur)
+    except ValueError:
+        from datetime import datetime, timezone
+        from email.utils import parsedate_to_datetime
+
+        try:
+            date = parsedate_to_datetime(valeur)
+        except (TypeError, ValueError):
+            attente = defaut
+        else:
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+            attente = (date - datetime.now(timezone.utc)).total_seconds()
+    if attente != attente:  # NaN
+        attente = defaut
+    return min(max(attente, 0.0), plafond)
+
+
+class _LimiteDebit:
+    """Au plus `par_seconde` requêtes par seconde, tous threads confondus."""
+
+    def __init__(self, par_seconde):
+        self.intervalle = 1.0 / par_seconde if par_seconde else 0.0
+        self._prochain = 0.0
+        self._verrou = threading.Lock()
+
+    def attendre(self):
+        with self._verrou:
+            maintenant = time.monotonic()
+            creneau = max(self._prochain, maintenant)
+            self._prochain = creneau + self.intervalle
+        if creneau > maintenant:
+            time.sleep(creneau - maintenant)
+
+
+class _CacheSiren:
+    """Cache SQLite {siren: fiche} avec durée de vie, partagé entre threads."""
+
+    def __init__(self, chemin, duree_vie):
+        self.duree_vie = duree_vie
+        self._verrou = threading.Lock()
+        if chemin != ":memory:":
+            Path(chemin).parent.mkdir(parents=True, exist_ok=True)
+        self._connexion = sqlite3.connect(str(chemin), check_same_thread=False)
+        self._connexion.execute(
+            "CREATE TABLE IF NOT EXISTS fiches (siren TEXT PRIMARY KEY, fiche TEXT, horodatage REAL)"
+        )
+
+    def lire(self, siren):
+        with self._verrou:
+            ligne = self._connexion.execute(
+                "SELECT fiche, horodatage FROM fiches WHERE siren = ?", (siren,)
+            ).fetchone()
+        if ligne is None or time.time() - ligne[1] > self.duree_vie:
+            return None
+        return json.loads(ligne[0])
+
+    def ecrire(self, siren, fiche):
+        with self._verrou, self._connexion:
+            self._connexion.execute(
+                "INSERT OR REPLACE INTO fiches VALUES (?, ?, ?)",
+                (siren, json.dumps(fiche, ensure_ascii=False), time.time()),
+            )
+
+
+class ClientSiren:
+    """Recherche d'informations entreprise par SIREN."""
+
+    def __init__(
+        self,
+        url=URL_API,
+        cle_api=CLE_API,
+        chemin_cache=CHEMIN_CACHE,
+        duree_vie_cache=DUREE_VIE_CACHE,
+        requetes_par_seconde=5,
+        relances=3,
+        temporisation=0.5,
+        attente_max=ATTENTE_MAX,
+        timeout=10,
+        taille_pool=10,
+    ):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.relances = relances
+        self.temporisation = temporisation
+        self.attente_max = attente_max
+        self.timeout = timeout
+        self.cache = _CacheSiren(chemin_cache, duree_vie_cache)
+        self.limite = _LimiteDebit(requetes_par_seconde)
+
+        self.session = requests.Session()
+        adaptateur = HTTPAdapter(pool_connections=taille_pool, pool_maxsize=taille_pool)
+        self.session.mount("https://", adaptateur)
+        self.session.mount("http://", adaptateur)
+        self.session.headers.update({
+            "x-rapidapi-key": cle_api,
+            "x-rapidapi-host": HOTE_API,
+            "Content-Type": "application/json",
+        })
+
+    def _appeler(self, siren):
+        """POST avec relances et temporisation exponentielle ; renvoie le JSON."""
+        import requests
+
+        payload = {"siren": siren, "include_company_data": True}
+        for tentative in range(self.relances + 1):
+            self.limite.attendre()
+            try:
+                r = self.session.post(self.url, data=json.dumps(payload), timeout=self.timeout)
+                if r.status_code not in STATUTS_A_RELANCER or tentative == self.relances:
+                    r.raise_for_status()
+                    return r.json()
+                attente = delai_retry_after(
+                    r.headers.get("Retry-After"), self.temporisation * 2 ** tentative, self.attente_max
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if tentative == self.relances:
+                    raise
+                attente = min(self.temporisation * 2 ** tentative, self.attente_max)
+            time.sleep(attente)
+
+    def rechercher(self, siren):
+        """
+        Retourne (info, statut) : statut "OK" et info = dict siren /
+        nom_entreprise / adresse / ville_cp / dirigeant, sinon (None, message).
+        """
+        siren = normaliser_siren(siren)
+        if siren is None:
+            return None, "Format SIREN invalide."
+
+        info = self.cache.lire(siren)
+        if info is not None:
+            return info, "OK"
+
+        try:
+            data = self._appeler(siren)
+        except Exception as e:
+            return None, f"Erreur API : {e}"
+
+        if "company" not in data:
+            return None, "Aucune donnée entreprise trouvée."
+
+        company = data["company"]
+        info = {
+            "siren": siren,
+            "nom_entreprise": company.get("name", "Nom inconnu"),
+            "adresse": company.get("address", "Adresse inconnue"),
+            "ville_cp": f"{company.get('postal_code', '')} {company.get('city', '')}",
+            "dirigeant": company.get("representative", "Dirigeant non fourni"),
+        }
+        self.cache.ecrire(siren, info)
+        return info, "OK"
+
+    def rechercher_masse(self, sirens, max_workers=8):
+        """Recherche parallèle de plusieurs SIREN : {siren: (info, statut)}."""
+        sirens = list(dict.fromkeys(sirens))
+        with ThreadPoolExecutor(max_workers=max_workers) as executeur:
+            return dict(zip(sirens, executeur.map(self.rechercher, sirens)))
+
+
+_client = None
+_verrou_client = threading.Lock()
+
+
+def client_par_defaut():
+    """Client partagé par tout le processus (pool de connexions et cache communs)."""
+    global _client
+    with _verrou_client:
+        if _client is None:
+            _client = ClientSiren()
+        return _client
@@ -0,0 +1,183 @@
+"""
+Imports en tâche de fond : chaque fichier importé est traité par
+`traiter_annee_cache` dans un pool de threads partagé par le processus,
+pendant que l'interface reste utilisable (autres exercices, autres pages).
+
+La tâche lit une copie du fichier en mémoire (pour une archive, le FEC
+choisi, décompressé au fil de la lecture), instrumentée : chaque lecture
+met à jour la progression (octets et lignes lus) et vérifie la demande
+d'annulation. Les tâches d'une session sont suivies dans
+st.session_state["taches_import"] (page d'import).
+"""
+import contextvars
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from archives_fec import est_archive, membres_fec, ouvrir_membre
+from pipeline_sig import traiter_annee_cache
+from sig_utils import LectureInterrompue, empreinte_fichier
+
+IMPORTS_PARALLELES = int(os.environ.get("BIPLUS_IMPORTS_PARALLELES", "4"))
+
+_executeur = ThreadPoolExecutor(max_workers=IMPORTS_PARALLELES, thread_name_prefix="biplus-import")
+
+
+class ImportAnnule(LectureInterrompue):
+    """
+    Levée par une lecture du fichier après demande d'annulation ; les
+    lectures de `sig_utils` la laissent remonter jusqu'à la tâche.
+    """
+
+
+class TacheImport:
+    """
+    Import d'un exercice. `etat` : "en_attente", "en_cours", puis
+    "terminee" (resultat : dict de `traiter_annee`, None si fichier
+    illisible), "annulee" ou "erreur" (message dans `erreur`).
+    """
+
+    def __init__(self, annee, nom, taille, source, options, membre=None):
+        self.annee = annee
+        self.nom = nom
+        self.membre = membre  # FEC lu dans l'archive `nom`
+        self.nom_lu = os.path.basename(membre) if membre else nom
+        self.taille = taille  # octets à lire (décompressés pour une archive)
+        self.source = source  # identifiant du fichier importé et options
+        self.options = options
+        self.etat = "en_attente"
+        self.resultat = None
+        self.empreinte = None  # empreinte du contenu lu, dès le début de la tâche
+        self.erreur = None
+        self.octets_lus = 0
+        self.lignes_lues = 0
+        self.debut = time.time()
+        self.fin = None
+        self.remise = False  # résultat déjà repris par la page
+        self.annulation = threading.Event()
+        self.futur = None
+
+    @property
+    def terminee(self):
+        return self.etat in ("terminee", "annulee", "erreur")
+
+    @property
+    def progression(self):
+        """Fraction des octets lus, entre 0 et 1 (1 une fois terminée)."""
+        if self.terminee:
+            return 1.0
+        return min(self.octets_lus / self.taille, 0.99) if self.taille else 0.0
+
+    def annuler(self):
+        """Demande l'arrêt : la tâche s'interrompt à sa prochaine lecture du fichier."""
+        self.annulation.set()
+        if self.futur is not None and self.futur.cancel():
+            self.etat = "annulee"
+
+
+class _FluxSuivi(io.RawIOBase):
+    """
+    Flux binaire (fichier importé, ou membre d'archive décompressé au fil de
+    la lecture) dont chaque lecture fait avancer la tâche.
+    """
+
+    def __init__(self, flux, nom, tache):
+        self._flux = flux
+        self.name = nom
+        self._tache = tache
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, position, whence=io.SEEK_SET):
+        return self._flux.seek(position, whence)
+
+    def tell(self):
+        return self._flux.tell()
+
+    def readinto(self, tampon):
+        tache = self._tache
+        if tache.annulation.is_set():
+            raise ImportAnnule(tache.nom)
+        debut = self._flux.tell()
+        donnees = self._flux.read(len(tampon))
+        n = len(donnees)
+        tampon[:n] = donnees
+        # relectures (en-tête, rembobinage) : seules les données nouvelles comptent
+        nouvelles = debut + n - max(debut, tache.octets_lus)
+        if nouvelles > 0:
+            tache.lignes_lues += donnees[-nouvelles:].count(b"\n")
+            tache.octets_lus = debut + n
+        return n
+
+
+def _ouvrir(contenu, nom, membre):
+    """Flux du fichier importé, ou du membre `membre` s'il s'agit d'une archive."""
+    if not est_archive(nom):
+        return io.BytesIO(contenu)
+    archive = io.BytesIO(contenu)
+    archive.name = nom
+    return ouvrir_membre(archive, membre)
+
+
+def _executer(tache, contenu):
+    if tache.annulation.is_set():
+        tache.etat = "annulee"
+        return
+    tache.etat = "en_cours"
+    try:
+        source = _ouvrir(contenu, tache.nom, tache.membre)
+        if source is None:  # archive sans FEC
+            tache.etat = "terminee"
+            return
+        # empreinte sur un flux séparé : le hachage ne compte pas dans la progression
+        empreinte = tache.empreinte = empreinte_fichier(source)
+        flux = _FluxSuivi(_ouvrir(contenu, tache.nom, tache.membre), tache.nom_lu, tache)
+        fichier = io.BufferedReader(flux, buffer_size=1 << 20)
+        resultat = traiter_annee_cache(fichier, annee=tache.annee, empreinte=empreinte, **tache.options)
+    except ImportAnnule:
+        tache.etat = "annulee"
+        return
+    except Exception as e:
+        tache.erreur = str(e)
+        tache.etat = "erreur"
+        return
+    finally:
+        tache.fin = time.time()
+
+    # annulation demandée après la dernière lecture du fichier
+    if tache.annulation.is_set():
+        tache.etat = "annulee"
+        return
+    tache.resultat = resultat
+    tache.etat = "terminee"
+
+
+def identifiant_import(file, options, membre=None):
+    """Identifie un import (fichier déposé, membre d'archive, options) : un changement relance la tâche."""
+    return getattr(file, "file_id", file.name), membre, tuple(sorted(options.items()))
+
+
+def lancer_import(annee, file, membre=None, flux=False, conserver_lignes=False, conserver=(), siren=""):
+    """
+    Lance l'import du fichier `file` (exercice `annee`) en tâche de fond et
+    renvoie la TacheImport. Pour une archive .zip / .gz, `membre` désigne le
+    FEC à lire (le premier si None), décompressé au fil de la lecture. Les
+    mesures de la tâche restent rattachées à la session appelante.
+    """
+    options = dict(flux=flux, conserver_lignes=conserver_lignes, conserver=conserver, siren=siren)
+    contenu = file.getvalue()
+    taille = len(contenu)
+    if est_archive(file.name):
+        membres = membres_fec(file)
+        choisi = next((m for m in membres if m["nom"] == membre), membres[0] if membres else None)
+        if choisi is not None:
+            membre, taille = choisi["nom"], choisi["taille"] or taille
+    tache = TacheImport(annee, file.name, taille, identifiant_import(file, options, membre), options, membre)
+    tache.futur = _executeur.submit(contextvars.copy_context().run, _executer, tache, contenu)
+    return tache
@@ -0,0 +1,130 @@
+"""
+Analyse des tiers (comptes auxiliaires CompAuxNum / CompAuxLib du FEC) :
+soldes par tiers, classements clients / fournisseurs et concentration.
+
+Les totaux par (CompteNum, CompAuxNum) sont produits pendant le
+regroupement des comptes (`preparer_grouped_tiers`, ou l'import en flux),
+sans nouveau passage sur le grand livre. `construire_tiers` les range une
+fois par import, triés par tiers ; seules les lignes portant un compte
+auxiliaire sont indexées (index creux), pour descendre jusqu'aux écritures
+d'un tiers par recherche dichotomique.
+
+Volumes : clients = débits des comptes 41 (facturation TTC), fournisseurs
+= crédits des comptes 40 ; le FEC ne porte pas le tiers sur la ligne de
+produit ou de charge de l'écriture.
+"""
+import numpy as np
+import pandas as pd
+
+from cube_sig import indexer_lignes, lignes_prefixe
+from instrumentation import instrumente
+from sig_utils import _extraire_montants, _renseigne, _sommer_tiers, centimes_vers_euros
+
+# catégorie -> (racine des comptes, colonne du volume, sens du solde)
+CATEGORIES_TIERS = {
+    "clients": ("41", "DebitCts", 1),
+    "fournisseurs": ("40", "CreditCts", -1),
+}
+
+
+def _classement(sommes, racine, colonne, sens):
+    """Tiers d'une catégorie triés par volume décroissant, et indicateurs de concentration."""
+    sous = sommes[sommes["CompteNum"].str.startswith(racine)]
+    par_tiers = (
+        sous.groupby("CompAuxNum", sort=False)
+        .agg(
+            CompAuxLib=("CompAuxLib", "first"),
+            Volume=(colonne, "sum"),
+            DebitCts=("DebitCts", "sum"),
+            CreditCts=("CreditCts", "sum"),
+            NbLignes=("NbLignes", "sum"),
+        )
+        .sort_values("Volume", ascending=False, kind="stable")
+    )
+
+    volumes = par_tiers["Volume"].to_numpy()
+    total = int(volumes.sum())
+    parts = volumes / total * 100 if total else np.zeros(len(volumes))
+    table = pd.DataFrame({
+        "CompAuxLib": par_tiers["CompAuxLib"],
+        "Volume": centimes_vers_euros(volumes),
+        "Solde": centimes_vers_euros(sens * (par_tiers["DebitCts"] - par_tiers["CreditCts"])),
+        "NbLignes": par_tiers["NbLignes"],
+        "Part": parts,
+        "PartCumulee": np.cumsum(parts),
+    })
+    concentration = {
+        "nb_tiers": len(table),
+        "volume": centimes_vers_euros(total),
+        "top1": float(parts[:1].sum()),
+        "top5": float(parts[:5].sum()),
+        "top10": float(parts[:10].sum()),
+        # indice de Herfindahl-Hirschman, de 0 (dispersé) à 10 000 (un seul tiers)
+        "hhi": float(((parts / 100) ** 2).sum() * 10_000),
+    }
+    return table, concentration
+
+
+@instrumente("tiers")
+def construire_tiers(sommes, lignes=None):
+    """
+    Structure d'analyse des tiers d'un exercice, à partir des totaux de
+    `_sommer_tiers` (None si le fichier n'a pas de compte auxiliaire) :
+    - soldes : Debit / Credit / Solde / NbLignes par (CompAuxNum, CompteNum),
+      trié par tiers
+    - clients, fournisseurs : classements par volume, avec Part et
+      PartCumulee en %
+    - concentration : {clients, fournisseurs} -> nb_tiers, volume, top1,
+      top5, top10 (parts en %), hhi
+    - ecritures : index des lignes à compte auxiliaire (None sans `lignes`)
+    """
+    if sommes is None:
+        return None
+
+    sommes = sommes.sort_values(["CompAuxNum", "CompteNum"], kind="stable").reset_index(drop=True)
+    debit, credit = sommes["DebitCts"].to_numpy(), sommes["CreditCts"].to_numpy()
+    soldes = pd.DataFrame({
+        "CompAuxNum": sommes["CompAuxNum"],
+        "CompAuxLib": sommes["CompAuxLib"],
+        "CompteNum": sommes["CompteNum"],
+        "Debit": centimes_vers_euros(debit),
+        "Credit": centimes_vers_euros(credit),
+        "Solde": centimes_vers_euros(debit - credit),
+        "NbLignes": sommes["NbLignes"],
+    })
+
+    tiers = {
+        "soldes": soldes,
+        "numeros": sommes["CompAuxNum"].to_numpy(dtype=object),
+        "concentration": {},
+        "ecritures": None,
+    }
+    for categorie, (racine, colonne, sens) in CATEGORIES_TIERS.items():
+        tiers[categorie], tiers["concentration"][categorie] = _classement(sommes, racine, colonne, sens)
+
+    if lignes is not None and "CompAuxNum" in lignes.columns:
+        tiers["ecritures"] = indexer_lignes(lignes[_renseigne(lignes["CompAuxNum"])], "CompAuxNum")
+    return tiers
+
+
+def calcul_tiers(df):
+    """`construire_tiers` directement sur des lignes (forme compacte ou brute)."""
+    tmp = _extraire_montants(df)
+    if tmp is None:
+        return None
+    return construire_tiers(_sommer_tiers(tmp), df)
+
+
+def soldes_tiers(tiers, compte_aux):
+    """Soldes du tiers `compte_aux`, par compte collectif."""
+    numeros = tiers["numeros"]
+    debut = np.searchsorted(numeros, compte_aux, side="left")
+    fin = np.searchsorted(numeros, compte_aux, side="right")
+    return tiers["soldes"].iloc[debut:fin]
+
+
+def ecritures_tiers(tiers, compte_aux):
+    """Lignes d'écritures du tiers `compte_aux` ; None sans index des lignes."""
+    if tiers["ecritures"] is None:
+        return None
+    return lignes_prefixe(tiers["ecritures"], compte_aux, exact=True)
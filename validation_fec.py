@@ -0,0 +1,226 @@
+"""
+Contrôles de conformité d'un FEC (article A47 A-1 du LPF) sur le fichier
+brut, toutes lignes traitées en colonnes (regroupements sur codes, sans
+boucle Python par ligne ni par écriture) :
+
+- colonnes : présence des 18 colonnes obligatoires (Montant / Sens admis
+  à la place de Debit / Credit) ;
+- dates : EcritureDate et ValidDate au format AAAAMMJJ, EcritureDate dans
+  l'exercice ;
+- écritures : chaque EcritureNum équilibrée par JournalCode, à date unique ;
+- doublons : lignes strictement identiques.
+
+Le rapport donne, par contrôle, le nombre d'anomalies et les premières
+lignes concernées (numéro de ligne du fichier, en-tête = ligne 1).
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumente
+from sig_utils import centimes_vers_euros, fmt_serie, parser_montants
+
+COLONNES_FEC = (
+    "JournalCode", "JournalLib", "EcritureNum", "EcritureDate", "CompteNum", "CompteLib",
+    "CompAuxNum", "CompAuxLib", "PieceRef", "PieceDate", "EcritureLib", "Debit", "Credit",
+    "EcritureLet", "DateLet", "ValidDate", "Montantdevise", "Idevise",
+)
+COLONNES_SENS = ("Montant", "Sens")  # variante admise de Debit / Credit
+
+CONTROLES = {
+    "colonne_manquante": "Colonne obligatoire absente",
+    "date_invalide": "EcritureDate absente ou hors format AAAAMMJJ",
+    "date_hors_exercice": "EcritureDate hors de l'exercice",
+    "date_validation_invalide": "ValidDate absente ou hors format AAAAMMJJ",
+    "ecriture_desequilibree": "Écriture (JournalCode, EcritureNum) non équilibrée",
+    "ecriture_multi_dates": "Écriture portant plusieurs EcritureDate",
+    "ligne_dupliquee": "Ligne identique à une ligne précédente",
+}
+
+MAX_EXEMPLES = 1000  # lignes d'anomalies conservées par contrôle
+
+
+def _colonnes_fec(colonnes):
+    """{nom réglementaire: nom dans le fichier} des colonnes FEC présentes (casse et espaces ignorés)."""
+    presentes = {str(c).strip().lower(): c for c in colonnes}
+    return {
+        nom: presentes[nom.lower()]
+        for nom in COLONNES_FEC + COLONNES_SENS
+        if nom.lower() in presentes
+    }
+
+
+def _texte(serie):
+    if not pd.api.types.is_string_dtype(serie.dtype):
+        serie = serie.astype("string")
+    return serie.fillna("").str.strip()
+
+
+def _dates(serie):
+    """datetime64 d'une colonne AAAAMMJJ (ou déjà en dates, lecture Excel) ; NaT si vide ou invalide."""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie
+    texte = _texte(serie)
+    return pd.to_datetime(texte.where(texte.str.len() == 8), format="%Y%m%d", errors="coerce")
+
+
+def _melanger(x):
+    """Finaliseur splitmix64 : disperse des entiers (codes) sur 64 bits."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hacher(colonnes):
+    """Empreinte uint64 de chaque ligne sur une liste de Series (codes de factorisation combinés)."""
+    empreinte = np.full(len(colonnes[0]), 0x345678, dtype="uint64")
+    for colonne in colonnes:
+        codes = pd.factorize(colonne)[0].astype("uint64")
+        empreinte = (empreinte * np.uint64(1_000_003)) ^ _melanger(codes)
+    return empreinte
+
+
+def _exercice(dates, cloture):
+    """(début, fin) de l'exercice : 12 mois jusqu'à `cloture`, sinon année civile de la date médiane."""
+    if cloture is None:
+        valides = dates.dropna()
+        if valides.empty:
+            return None
+        cloture = pd.Timestamp(year=valides.sort_values().iloc[len(valides) // 2].year, month=12, day=31)
+    fin = pd.Timestamp(cloture).normalize()
+    return fin - pd.DateOffset(years=1) + pd.Timedelta(days=1), fin
+
+
+def _debit_credit(df, colonnes):
+    """(débit, crédit) en centimes, depuis Debit / Credit ou Montant / Sens."""
+    if "Debit" in colonnes and "Credit" in colonnes:
+        return (
+            parser_montants(df[colonnes["Debit"]]).to_numpy(),
+            parser_montants(df[colonnes["Credit"]]).to_numpy(),
+        )
+    montant = parser_montants(df[colonnes["Montant"]]).to_numpy()
+    debit = _texte(df[colonnes["Sens"]]).str.upper().isin(["D", "+1", "1"]).to_numpy()
+    return np.where(debit, montant, 0), np.where(debit, 0, montant)
+
+
+def _exemples(controle, positions, details, references):
+    """DataFrame des premières anomalies d'un contrôle (positions 0-based dans le fichier)."""
+    positions = np.asarray(positions)[:MAX_EXEMPLES]
+    return pd.DataFrame({
+        "Controle": controle,
+        "Ligne": positions + 2,
+        **{nom: serie.to_numpy()[positions] for nom, serie in references.items()},
+        "Detail": np.asarray(details, dtype=object)[:MAX_EXEMPLES] if details is not None else "",
+    })
+
+
+@instrumente("validation")
+def valider_fec(df, cloture=None):
+    """
+    Contrôles de conformité d'un FEC brut (`lire_fichier_fec`).
+    `cloture` : date de clôture de l'exercice (12 mois) ; à défaut,
+    l'exercice est l'année civile de la date d'écriture médiane.
+
+    Retourne un dict :
+    - conforme : aucun contrôle en anomalie
+    - nb_lignes, exercice (début, fin) ou None
+    - colonnes_manquantes : colonnes obligatoires absentes
+    - synthese : DataFrame par contrôle (Description, Anomalies) ;
+      NaN pour un contrôle impossible faute de colonnes
+    - anomalies : DataFrame Controle, Ligne, JournalCode, EcritureNum,
+      CompteNum, Detail (au plus MAX_EXEMPLES lignes par contrôle)
+    """
+    colonnes = _colonnes_fec(df.columns)
+    sens = all(c in colonnes for c in COLONNES_SENS)
+    manquantes = [
+        c for c in COLONNES_FEC
+        if c not in colonnes and not (sens and c in ("Debit", "Credit"))
+    ]
+    comptes = {controle: np.nan for controle in CONTROLES}
+    comptes["colonne_manquante"] = len(manquantes)
+    exemples = [_exemples("colonne_manquante", np.full(len(manquantes), -1), manquantes, {})] if manquantes else []
+
+    textes = {nom: _texte(df[colonne]) for nom, colonne in colonnes.items() if nom in ("JournalCode", "EcritureNum", "CompteNum")}
+    references = {nom: textes[nom] for nom in ("JournalCode", "EcritureNum", "CompteNum") if nom in textes}
+
+    def signaler(controle, masque_ou_positions, details=None):
+        positions = np.flatnonzero(masque_ou_positions) if masque_ou_positions.dtype == bool else masque_ou_positions
+        comptes[controle] = len(positions)
+        if len(positions):
+            exemples.append(_exemples(controle, positions, details, references))
+
+    # Dates
+    exercice = None
+    dates = None
+    if "EcritureDate" in colonnes:
+        dates = _dates(df[colonnes["EcritureDate"]])
+        invalides = dates.isna().to_numpy()
+        signaler("date_invalide", invalides)
+        exercice = _exercice(dates, cloture)
+        if exercice is not None:
+            hors = ((dates < exercice[0]) | (dates > exercice[1])).to_numpy() & ~invalides
+            positions = np.flatnonzero(hors)
+            signaler("date_hors_exercice", positions, dates.iloc[positions[:MAX_EXEMPLES]].dt.strftime("%d/%m/%Y"))
+    if "ValidDate" in colonnes:
+        signaler("date_validation_invalide", _dates(df[colonnes["ValidDate"]]).isna().to_numpy())
+
+    # Écritures : regroupement sur le code de (JournalCode, EcritureNum)
+    montants = ("Debit" in colonnes and "Credit" in colonnes) or sens
+    if "JournalCode" in textes and "EcritureNum" in textes and montants:
+        journaux, _ = pd.factorize(textes["JournalCode"])
+        numeros, uniques = pd.factorize(textes["EcritureNum"])
+        codes, _ = pd.factorize(journaux.astype("int64") * len(uniques) + numeros)
+        debit, credit = _debit_credit(df, colonnes)
+        par_ecriture = pd.DataFrame({"solde": debit - credit, "position": np.arange(len(df))}).groupby(codes)
+        resume = par_ecriture.agg(solde=("solde", "sum"), premiere=("position", "min"), lignes=("position", "size"))
+
+        desequilibrees = resume[resume["solde"] != 0]
+        premieres = desequilibrees.head(MAX_EXEMPLES)
+        signaler(
+            "ecriture_desequilibree",
+            desequilibrees["premiere"].to_numpy(),
+            "écart " + fmt_serie(centimes_vers_euros(premieres["solde"]), 2)
+            + " sur " + premieres["lignes"].astype(str) + " ligne(s)",
+        )
+
+        if dates is not None:
+            jours = dates.to_numpy().astype("datetime64[D]").astype("int64")
+            jours = np.where(dates.isna().to_numpy(), np.iinfo("int64").min, jours)
+            etendue = pd.Series(jours).groupby(codes).agg(["min", "max"])
+            multi = np.flatnonzero((etendue["min"] != etendue["max"]).to_numpy())
+            signaler("ecriture_multi_dates", resume["premiere"].to_numpy()[multi])
+
+    # Doublons : empreinte sur quelques colonnes discriminantes, puis sur la
+    # ligne entière pour les seules lignes candidates
+    if len(df):
+        discriminantes = [
+            colonnes[c] for c in ("EcritureNum", "CompteNum", "Debit", "Credit", "Montant", "EcritureLib")
+            if c in colonnes
+        ] or list(df.columns)
+        empreintes = _hacher([df[c] for c in discriminantes])
+        candidats = np.flatnonzero(pd.Series(empreintes).duplicated(keep=False).to_numpy())
+        sous_ensemble = df.iloc[candidats]
+        empreintes = _hacher([sous_ensemble[c] for c in df.columns]) if len(candidats) else empreintes[:0]
+        doublons = pd.Series(empreintes).duplicated().to_numpy()
+        originales = pd.Series(candidats).groupby(empreintes).transform("min").to_numpy()[doublons]
+        signaler(
+            "ligne_dupliquee",
+            candidats[doublons],
+            "identique à la ligne " + pd.Series(originales[:MAX_EXEMPLES] + 2).astype(str),
+        )
+
+    synthese = pd.DataFrame(
+        {"Description": list(CONTROLES.values()), "Anomalies": [comptes[c] for c in CONTROLES]},
+        index=pd.Index(list(CONTROLES), name="Controle"),
+    )
+    anomalies = pd.concat(exemples, ignore_index=True) if exemples else pd.DataFrame()
+    anomalies = anomalies.reindex(columns=["Controle", "Ligne", *references, "Detail"])
+    return {
+        "conforme": bool((synthese["Anomalies"].fillna(0) == 0).all()),
+        "nb_lignes": len(df),
+        "exercice": exercice,
+        "colonnes_manquantes": manquantes,
+        "synthese": synthese,
+        "anomalies": anomalies,
+    }